@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Batch image converter for the ESP32-S2 / JBD013VGA display
+- Converts a directory or glob of images in parallel (ProcessPoolExecutor)
+- decode -> grayscale -> resize -> 4-bit quantize (optionally dithered), then write:
+    bin   1 byte per pixel, low 4 bits used (legacy runtime /upload format)
+    bin4  packed 4-bit runtime image with v1 header + CRC (see runtime_image.py)
+    h     C header in the current_image.h layout
+    h4    C header with packed 4-bit data (defines <NAME>_PACKED)
+- Unchanged inputs (same content hash + parameters) are skipped via a manifest
+- --cache DIR reuses packed frames from the shared on-disk frame cache (frame_cache.py)
+
+Usage: python batch_convert.py slides/ -o out/ --format bin4 --jobs 8
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from frame_cache import FrameCache, content_hash, make_key
+from header_writer import pack_4bit, write_header
+from quantizer import DITHER_MODES, quantize_image
+import runtime_image
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".gif")
+FORMATS = {"bin": ".bin", "bin4": ".bin4", "h": ".h", "h4": "_packed.h"}
+MANIFEST_NAME = ".batch_manifest.json"
+
+
+def load_4bit(path, width, height, invert=False, dither="none"):
+    """Decode an image and return (height, width) uint8 levels 0..15"""
+    with Image.open(path) as img:
+        return quantize_image(img, width, height, dither, invert)
+
+
+def c_identifier(name):
+    ident = re.sub(r"\W", "_", name)
+    return ident if not ident[:1].isdigit() else "_" + ident
+
+
+def write_output(dst, fmt, arr4, src, width, height, packed=None):
+    """Write one converted image in fmt (via dst + '.tmp'); packed (h, w/2) is used as-is for bin4"""
+    tmp = dst + ".tmp"
+    if fmt == "bin4" and packed is not None:
+        with open(tmp, "wb") as f:
+            f.write(runtime_image.encode(packed=packed))
+    elif fmt in ("bin", "bin4"):
+        runtime_image.write(tmp, arr4, legacy=(fmt == "bin"))
+    else:
+        stem = os.path.splitext(os.path.basename(dst))[0]
+        comments = [f"Converted from {os.path.basename(src)}",
+                    "Generated by ESP32-S2 batch converter",
+                    f"Dimensions: {width}x{height}"]
+        write_header(tmp, arr4, var_prefix=c_identifier(stem), packed=(fmt == "h4"), comments=comments)
+    os.replace(tmp, dst)
+    return os.path.getsize(dst)
+
+
+def convert_one(src, dst, fmt, width, height, invert, dither="none", return_packed=False):
+    """Worker: convert one file; returns (src, dst, bytes_written, seconds[, packed frame])"""
+    t0 = time.perf_counter()
+    arr4 = load_4bit(src, width, height, invert, dither)
+    nbytes = write_output(dst, fmt, arr4, src, width, height)
+    result = (src, dst, nbytes, time.perf_counter() - t0)
+    return result + (pack_4bit(arr4),) if return_packed else result
+
+
+def cache_key(digest, width, height, invert, dither):
+    return make_key(digest, width=width, height=height, invert=bool(invert), dither=dither,
+                    resample="lanczos", packing="4bpp")
+
+
+def collect_inputs(patterns, recursive=False):
+    """Expand directories and globs to a sorted, de-duplicated list of image files"""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pat = os.path.join(pattern, "**", "*") if recursive else os.path.join(pattern, "*")
+            candidates = glob.glob(pat, recursive=recursive)
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        found.extend(p for p in candidates
+                     if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTS))
+    return sorted(set(os.path.abspath(p) for p in found))
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def run_batch(inputs, out_dir, fmt="bin", width=640, height=480, invert=False,
+              jobs=None, force=False, log=print, dither="none", cache=None):
+    """Convert inputs into out_dir; returns a summary dict.
+
+    cache: FrameCache; converted frames are taken from / added to it (even widths only).
+    """
+    if width % 2:
+        cache = None
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    params = {"format": fmt, "width": width, "height": height, "invert": bool(invert)}
+    if dither != "none":  # keep manifests written before dithering existed valid
+        params["dither"] = dither
+    ext = FORMATS[fmt]
+
+    t0 = time.perf_counter()
+    tasks, skipped, used_names = [], 0, set()
+    for src in inputs:
+        stem = os.path.splitext(os.path.basename(src))[0]
+        name = stem + ext
+        n = 1
+        while name in used_names:  # same stem from different directories
+            name = f"{stem}_{n}{ext}"
+            n += 1
+        used_names.add(name)
+        dst = os.path.join(out_dir, name)
+        digest = content_hash(src)
+        entry = manifest.get(name)
+        if (not force and entry and entry.get("source") == src and entry.get("sha256") == digest
+                and entry.get("params") == params and os.path.exists(dst)):
+            skipped += 1
+            continue
+        tasks.append((src, dst, digest))
+
+    converted, failed, total_bytes, cached = 0, 0, 0, 0
+
+    def done(src, dst, digest, nbytes, secs, note=""):
+        nonlocal converted, total_bytes
+        converted += 1
+        total_bytes += nbytes
+        manifest[os.path.basename(dst)] = {"source": src, "sha256": digest, "params": params}
+        log(f"{os.path.basename(src)} -> {os.path.basename(dst)} ({nbytes} bytes, {secs * 1000:.0f} ms{note})")
+
+    if cache is not None:
+        # cache hits are written here from the memmapped frame, no decode or quantize
+        misses = []
+        for src, dst, digest in tasks:
+            frames = cache.get(cache_key(digest, width, height, invert, dither))
+            if frames is None:
+                misses.append((src, dst, digest))
+                continue
+            t1 = time.perf_counter()
+            try:
+                arr4 = None if fmt == "bin4" else runtime_image.unpack_4bit(frames[0], width)
+                nbytes = write_output(dst, fmt, arr4, src, width, height, packed=frames[0])
+            except Exception as e:
+                failed += 1
+                log(f"FAILED {src}: {e}")
+                continue
+            cached += 1
+            done(src, dst, digest, nbytes, time.perf_counter() - t1, ", cached")
+        tasks = misses
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(convert_one, src, dst, fmt, width, height, invert, dither,
+                                   cache is not None): (src, dst, digest)
+                       for src, dst, digest in tasks}
+            for fut in as_completed(futures):
+                src, dst, digest = futures[fut]
+                try:
+                    _, _, nbytes, secs, *packed = fut.result()
+                except Exception as e:
+                    failed += 1
+                    log(f"FAILED {src}: {e}")
+                    continue
+                if packed:
+                    cache.put(cache_key(digest, width, height, invert, dither), packed,
+                              source=os.path.basename(src))
+                done(src, dst, digest, nbytes, secs)
+    save_manifest(out_dir, manifest)
+
+    elapsed = time.perf_counter() - t0
+    rate = converted / elapsed if elapsed > 0 else 0.0
+    return {"converted": converted, "skipped": skipped, "failed": failed, "cached": cached,
+            "bytes": total_bytes, "seconds": elapsed, "images_per_second": rate}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Batch-convert images for the ESP32-S2 JBD013VGA display")
+    ap.add_argument("inputs", nargs="+", help="image files, directories or glob patterns")
+    ap.add_argument("-o", "--out-dir", required=True)
+    ap.add_argument("-f", "--format", choices=sorted(FORMATS), default="bin")
+    ap.add_argument("--width", type=int, default=640)
+    ap.add_argument("--height", type=int, default=480)
+    ap.add_argument("--invert", action="store_true")
+    ap.add_argument("--dither", choices=DITHER_MODES, default="none", help="4-bit quantization dither")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("-r", "--recursive", action="store_true", help="recurse into input directories")
+    ap.add_argument("--force", action="store_true", help="reconvert even if unchanged")
+    ap.add_argument("--cache", help="frame cache directory shared with the streamer (python frame_cache.py)")
+    ap.add_argument("--cache-mb", type=int, default=512, help="frame cache size limit (MiB)")
+    args = ap.parse_args(argv)
+
+    if args.width <= 0 or args.height <= 0 or (args.format in ("bin4", "h4") and args.width % 2):
+        ap.error("width/height must be positive (and width even for bin4)")
+    inputs = collect_inputs(args.inputs, recursive=args.recursive)
+    if not inputs:
+        print("No input images found", file=sys.stderr)
+        return 1
+    summary = run_batch(inputs, args.out_dir, fmt=args.format, width=args.width, height=args.height,
+                        invert=args.invert, jobs=args.jobs, force=args.force,
+                        dither=args.dither,
+                        cache=FrameCache(args.cache, args.cache_mb << 20) if args.cache else None)
+    print(f"Converted {summary['converted']} images in {summary['seconds']:.2f} s "
+          f"({summary['images_per_second']:.1f} img/s, {summary['cached']} from cache), "
+          f"skipped {summary['skipped']} unchanged, {summary['failed']} failed")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-chunk _pack_rows_4bit (previous streamer path) vs FramePacker
+Usage: python benchmarks/bench_packer.py [--rows 10] [--iters 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_packer import FramePacker  # noqa: E402
+
+
+def legacy_pack_rows_4bit(g4_bytes, row_start, rows):
+    """The old ScreenStreamerGUI._pack_rows_4bit, called once per chunk"""
+    out = np.empty(320 * rows, dtype=np.uint8)
+    src = np.frombuffer(g4_bytes, dtype=np.uint8).reshape(480, 640)
+    block = src[row_start:row_start+rows, :]
+    hi = block[:, 0::2] & 0x0F
+    lo = block[:, 1::2] & 0x0F
+    packed = ((hi << 4) | lo).astype(np.uint8)
+    out[:] = packed.reshape(-1)
+    return out.tobytes()
+
+
+def legacy_frame(g4_bytes, chunk_rows):
+    total = 0
+    for row_start in range(0, 480, chunk_rows):
+        rows = min(chunk_rows, 480 - row_start)
+        msg = b"\0\0\0\0" + legacy_pack_rows_4bit(g4_bytes, row_start, rows)
+        total += len(msg)
+    return total
+
+
+def packer_frame(packer, g4, chunk_rows):
+    packed = packer.pack(g4)
+    total = 0
+    for row_start in range(0, 480, chunk_rows):
+        rows = min(chunk_rows, 480 - row_start)
+        total += len(packer.ws_message(packed, row_start, rows))
+    return total
+
+
+def bench(fn, iters):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - t0) / iters * 1000.0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--rows", type=int, default=10, help="rows per chunk")
+    ap.add_argument("--iters", type=int, default=200)
+    args = ap.parse_args()
+
+    g4 = np.random.default_rng(0).integers(0, 16, (480, 640), dtype=np.uint8)
+    g4_bytes = g4.tobytes()
+    packer = FramePacker()
+
+    ref = b"".join(legacy_pack_rows_4bit(g4_bytes, r, 60) for r in range(0, 480, 60))
+    assert packer.pack(g4).tobytes() == ref, "FramePacker output differs from legacy path"
+
+    t_old = bench(lambda: legacy_frame(g4_bytes, args.rows), args.iters)
+    t_new = bench(lambda: packer_frame(packer, g4, args.rows), args.iters)
+    print(f"rows/chunk={args.rows} chunks/frame={-(-480 // args.rows)}")
+    print(f"legacy  _pack_rows_4bit : {t_old:7.3f} ms/frame")
+    print(f"FramePacker + ws_message: {t_new:7.3f} ms/frame  ({t_old / t_new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+End-to-end streaming benchmark with a per-stage latency breakdown
+- Stages: capture, quantize (BGRA -> 4-bit), pack, serialize (wire payloads), send
+- Transports: http (/stream-chunks, or /stream-chunk per band on older firmware),
+  upload (/upload + /apply), ws (port 81 protocol)
+- Sources: synthetic moving scene, recorded frames (image directory or .npy), or the screen
+- Target: a local device_emulator.py subprocess (default) or a real device (--host)
+- Reports p50/p95/p99 per stage, achieved FPS, bytes/frame and CPU/frame as JSON;
+  --compare flags regressions against an earlier JSON result
+
+Usage: python benchmarks/bench_streaming.py --frames 200 -o result.json
+       python benchmarks/bench_streaming.py --source recorded --input clips/ --compare result.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import runtime_image  # noqa: E402
+from chunk_codec import encode_or_raw  # noqa: E402
+from frame_packer import FramePacker  # noqa: E402
+from screen_capture import Bgra4BitConverter, MssCapture  # noqa: E402
+from stream_engine import changed_row_bands  # noqa: E402
+from stream_transport import (OCTET_STREAM, chunk_batch, device_http_features, http_base_url,  # noqa: E402
+                              new_session, upload_and_apply, ws_host)
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+try:
+    from websockets.sync.client import connect as ws_connect
+except ImportError:
+    ws_connect = None
+
+STAGES = ("capture", "quantize", "pack", "serialize", "send")
+TRANSPORTS = ("http", "upload", "ws")
+DEFAULT_ROWS = {"http": 60, "upload": 60, "ws": 10}
+
+
+# ---- frame sources ----------------------------------------------------------
+
+class SyntheticSource:
+    """Static gradient with a moving block: a few dozen rows change per frame"""
+
+    def __init__(self, width=640, height=480, block=64, step=8):
+        xx = np.arange(width)[None, :].repeat(height, axis=0)
+        gray = ((xx * 255) // max(1, width - 1)).astype(np.uint8)
+        self.base = np.dstack([gray, gray, gray, np.full_like(gray, 255)])
+        self.frame = self.base.copy()
+        self.block = block
+        self.step = step
+        self.n = 0
+        self.width, self.height = width, height
+
+    def grab(self):
+        f, b = self.frame, self.block
+        np.copyto(f, self.base)
+        x = (self.n * self.step) % (self.width - b)
+        y = (self.n * self.step // 2) % (self.height - b)
+        f[y:y + b, x:x + b, :3] = 255 - f[y:y + b, x:x + b, :3]
+        self.n += 1
+        return f
+
+    def close(self):
+        pass
+
+
+class RecordedSource:
+    """Cycle through pre-decoded frames (directory of images or an (N, h, w[, 4]) .npy)"""
+
+    def __init__(self, path, width=640, height=480):
+        if path.endswith(".npy"):
+            arr = np.load(path)
+            frames = [self._to_bgra(a) for a in arr]
+        else:
+            files = sorted(p for p in glob.glob(os.path.join(path, "*"))
+                           if p.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")))
+            frames = []
+            for p in files:
+                img = Image.open(p).convert("RGB")
+                if img.size != (width, height):
+                    img = img.resize((width, height), Image.Resampling.BILINEAR)
+                frames.append(self._to_bgra(np.asarray(img)[:, :, ::-1]))
+        if not frames:
+            raise ValueError(f"no frames found in {path}")
+        self.frames = frames
+        self.n = 0
+
+    @staticmethod
+    def _to_bgra(a):
+        if a.ndim == 2:
+            a = np.dstack([a, a, a])
+        if a.shape[2] == 3:
+            a = np.dstack([a, np.full(a.shape[:2], 255, np.uint8)])
+        return np.ascontiguousarray(a, dtype=np.uint8)
+
+    def grab(self):
+        f = self.frames[self.n % len(self.frames)]
+        self.n += 1
+        return f
+
+    def close(self):
+        pass
+
+
+class ScreenSource:
+    def __init__(self, region):
+        self.capture = MssCapture()
+        self.region = region
+
+    def grab(self):
+        return self.capture.grab_bgra(*self.region)
+
+    def close(self):
+        self.capture.close()
+
+
+# ---- transports -------------------------------------------------------------
+
+class HttpChunkBench:
+    """Same requests as HttpChunkSender.submit, with serialize and send timed separately"""
+
+    def __init__(self, host, ws_port, compress=False):
+        self.base_url = http_base_url(host)
+        self.compress = compress
+        self.session = new_session()
+        self.features = device_http_features(self.base_url, self.session)
+
+    def drain(self):
+        pass
+
+    def serialize(self, packed, bands):
+        if "multi" in self.features:
+            return [chunk_batch(packed, bands, self.compress)] if bands else []
+        out = []
+        for row_start, rows in bands:
+            chunk, rle = FramePacker.chunk_view(packed, row_start, rows), False
+            if self.compress:
+                chunk, rle = encode_or_raw(chunk)
+            out.append((row_start, rows, rle, bytes(chunk)))
+        return out
+
+    def send(self, payloads):
+        if "multi" in self.features:
+            for body in payloads:
+                self.session.post(self.base_url + "/stream-chunks", data=body, headers=OCTET_STREAM,
+                                  timeout=10).raise_for_status()
+            return sum(len(b) for b in payloads)
+        for row_start, rows, rle, chunk in payloads:
+            params = {'rowStart': str(row_start), 'rows': str(rows), 'packed': '1'}
+            if rle:
+                params['enc'] = 'rle'
+            if "raw" in self.features:
+                r = self.session.post(self.base_url + "/stream-chunk", params=params, data=chunk,
+                                      headers=OCTET_STREAM, timeout=10)
+            else:
+                files = {'file': ('chunk.bin', chunk, 'application/octet-stream')}
+                r = self.session.post(self.base_url + "/stream-chunk", params=params, files=files,
+                                      timeout=10)
+            r.raise_for_status()
+        return sum(len(c) for _, _, _, c in payloads)
+
+    def close(self):
+        self.session.close()
+
+
+class UploadBench(HttpChunkBench):
+    def serialize(self, packed, bands):
+        return [runtime_image.encode(packed=packed)] if bands else []
+
+    def send(self, payloads):
+        for data in payloads:
+            upload_and_apply(self.base_url, data, session=self.session, raw="raw" in self.features,
+                             chunked=False, skip_same=False)
+        return sum(len(d) for d in payloads)
+
+
+class WsBench:
+    """Blocking WebSocket client; send time includes TCP backpressure from the device.
+
+    There are no acks, so drain() waits for the emulator to report every message
+    as processed before the run's FPS is computed (no-op against a real device).
+    """
+
+    def __init__(self, host, ws_port, compress=False):
+        if ws_connect is None:
+            raise RuntimeError("websockets >= 11 not installed: pip install websockets")
+        self.host = host
+        self.compress = compress
+        self.packer = FramePacker()
+        self._conn = ws_connect(f"ws://{ws_host(host)}:{ws_port}/", max_size=None, compression=None)
+        self.ws = self._conn.__enter__()
+        stats = device_stats(host)
+        self._base = stats["ws_messages"] if stats else None
+        self.sent = 0
+
+    def serialize(self, packed, bands):
+        return [bytes(self.packer.ws_message(packed, row_start, rows, compress=self.compress))
+                for row_start, rows in bands]
+
+    def send(self, payloads):
+        for msg in payloads:
+            self.ws.send(msg)
+        self.sent += len(payloads)
+        return sum(len(m) for m in payloads)
+
+    def drain(self, timeout=30.0):
+        if self._base is None:
+            return
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            stats = device_stats(self.host)
+            if stats is None or stats["ws_messages"] >= self._base + self.sent:
+                return
+            time.sleep(0.005)
+
+    def close(self):
+        self._conn.__exit__(None, None, None)
+
+
+BENCHES = {"http": HttpChunkBench, "upload": UploadBench, "ws": WsBench}
+
+
+# ---- emulator ---------------------------------------------------------------
+
+def start_emulator(spi_us_per_byte, sync_ms):
+    """Run device_emulator.py on free ports; returns (process, http_host, ws_port)"""
+    cmd = [sys.executable, "-u", os.path.join(ROOT, "device_emulator.py"), "--http-port", "0",
+           "--ws-port", "0", "--spi-us-per-byte", str(spi_us_per_byte), "--sync-ms", str(sync_ms)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    http_host = ws_port = None
+    while http_host is None or ws_port is None:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("device emulator exited during startup")
+        if line.startswith("HTTP: "):
+            http_host = line.split("://", 1)[1].strip()
+        elif line.startswith("WebSocket: "):
+            ws_port = int(line.strip().rsplit(":", 1)[1])
+    return proc, http_host, ws_port
+
+
+def device_stats(host):
+    try:
+        return requests.get(http_base_url(host) + "/emu/stats", timeout=2).json()
+    except Exception:
+        return None
+
+
+# ---- measurement ------------------------------------------------------------
+
+def summarize(samples_ms):
+    a = np.asarray(samples_ms, dtype=np.float64)
+    if a.size == 0:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3), "mean": round(a.mean(), 3)}
+
+
+def run_transport(name, source, host, ws_port, frames, rows, delta, fps, warmup, compress=False):
+    bench = BENCHES[name](host, ws_port, compress)
+    conv, packer = Bgra4BitConverter(), FramePacker()
+    times = {s: [] for s in STAGES}
+    total_ms, cpu_ms, sizes = [], [], []
+    errors, prev = 0, None
+    dev_before = device_stats(host)
+    interval = 1.0 / fps if fps > 0 else 0.0
+    t_start = None
+    try:
+        for i in range(warmup + frames):
+            if i == warmup:
+                t_start = time.perf_counter()
+            c0, t0 = time.process_time(), time.perf_counter()
+            frame = source.grab()
+            t1 = time.perf_counter()
+            g4 = conv.convert(frame)
+            t2 = time.perf_counter()
+            packed = packer.pack(g4)
+            t3 = time.perf_counter()
+            bands = changed_row_bands(prev if delta else None, packed, rows)
+            payloads = bench.serialize(packed, bands)
+            t4 = time.perf_counter()
+            try:
+                nbytes = bench.send(payloads)
+                prev = packed
+            except Exception:
+                errors += 1
+                nbytes, prev = 0, None
+            t5 = time.perf_counter()
+            if i >= warmup:
+                for stage, a, b in zip(STAGES, (t0, t1, t2, t3, t4), (t1, t2, t3, t4, t5)):
+                    times[stage].append((b - a) * 1000.0)
+                total_ms.append((t5 - t0) * 1000.0)
+                cpu_ms.append((time.process_time() - c0) * 1000.0)
+                sizes.append(nbytes)
+            if interval:
+                time.sleep(max(0.0, interval - (time.perf_counter() - t0)))
+        bench.drain()
+        elapsed = time.perf_counter() - t_start if t_start is not None else 0.0
+    finally:
+        bench.close()
+    dev_after = device_stats(host)
+    result = {
+        "frames": frames,
+        "errors": errors,
+        "fps": round(frames / elapsed, 3) if elapsed > 0 else None,
+        "bytes_per_frame": round(float(np.mean(sizes)), 1) if sizes else None,
+        "cpu_ms_per_frame": summarize(cpu_ms),
+        "total_ms": summarize(total_ms),
+        "stages": {s: summarize(times[s]) for s in STAGES},
+    }
+    if dev_before and dev_after:
+        result["device"] = {k: round(dev_after[k] - dev_before[k], 6) for k in dev_after
+                            if isinstance(dev_after[k], (int, float))}
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return regressions where p50 total/stage time or FPS got worse by more than tolerance"""
+    regressions = []
+    for name, cur in results["transports"].items():
+        old = baseline.get("transports", {}).get(name)
+        if not old:
+            continue
+        checks = [("total_ms.p50", cur["total_ms"]["p50"], old["total_ms"]["p50"])]
+        checks += [(f"stages.{s}.p50", cur["stages"][s]["p50"], old["stages"][s]["p50"]) for s in STAGES]
+        for key, new, ref in checks:
+            # stages under 0.05 ms are timer noise
+            if new is not None and ref is not None and ref >= 0.05 and new > ref * (1 + tolerance):
+                regressions.append(f"{name} {key}: {ref:.3f} -> {new:.3f} ms")
+        if cur["fps"] and old.get("fps") and cur["fps"] < old["fps"] * (1 - tolerance):
+            regressions.append(f"{name} fps: {old['fps']:.2f} -> {cur['fps']:.2f}")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="End-to-end streaming benchmark")
+    ap.add_argument("--transport", action="append", choices=TRANSPORTS,
+                    help="transport to run (repeatable, default: all)")
+    ap.add_argument("--frames", type=int, default=100)
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--fps", type=float, default=0.0, help="target FPS (0 = as fast as possible)")
+    ap.add_argument("--rows", type=int, default=None, help="rows per chunk (default: 10 ws, 60 http)")
+    ap.add_argument("--no-delta", action="store_true", help="send every frame in full")
+    ap.add_argument("--compress", action="store_true", help="RLE chunks for http/ws")
+    ap.add_argument("--source", choices=("synthetic", "recorded", "screen"), default="synthetic")
+    ap.add_argument("--input", help="image directory or .npy for --source recorded")
+    ap.add_argument("--region", default="0,0,640,480", help="capture region for --source screen")
+    ap.add_argument("--host", help="real device address (default: start device_emulator.py)")
+    ap.add_argument("--ws-port", type=int, default=81)
+    ap.add_argument("--spi-us-per-byte", type=float, default=1.0, help="emulator SPI cost")
+    ap.add_argument("--sync-ms", type=float, default=1.0, help="emulator SPI_SYNC delay")
+    ap.add_argument("-o", "--output", help="write JSON here (default: stdout)")
+    ap.add_argument("--compare", help="baseline JSON; exit 1 on regressions")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown for --compare")
+    args = ap.parse_args(argv)
+
+    if requests is None:
+        raise RuntimeError("requests not installed: pip install requests")
+    if args.source == "recorded" and not args.input:
+        ap.error("--source recorded needs --input")
+    if args.source == "synthetic":
+        source = SyntheticSource()
+    elif args.source == "recorded":
+        source = RecordedSource(args.input)
+    else:
+        source = ScreenSource(tuple(int(v) for v in args.region.split(",")))
+
+    proc = None
+    host, ws_port = args.host, args.ws_port
+    if host is None:
+        proc, host, ws_port = start_emulator(args.spi_us_per_byte, args.sync_ms)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "target": "device" if args.host else "emulator",
+            "spi_us_per_byte": None if args.host else args.spi_us_per_byte,
+            "sync_ms": None if args.host else args.sync_ms,
+            "source": args.source,
+            "frames": args.frames,
+            "fps_target": args.fps,
+            "delta": not args.no_delta,
+            "compress": args.compress,
+        },
+        "transports": {},
+    }
+    try:
+        for name in args.transport or TRANSPORTS:
+            rows = args.rows or DEFAULT_ROWS[name]
+            res = run_transport(name, source, host, ws_port, args.frames, rows, not args.no_delta,
+                                args.fps, args.warmup, args.compress)
+            res["rows_per_chunk"] = rows
+            results["transports"][name] = res
+            st = res["stages"]
+            print(f"{name:6s} {res['fps'] or 0:7.2f} fps  {res['bytes_per_frame'] or 0:9.0f} B/frame  "
+                  f"total p50 {res['total_ms']['p50']} p99 {res['total_ms']['p99']} ms  "
+                  + "  ".join(f"{s} {st[s]['p50']}" for s in STAGES), file=sys.stderr)
+    finally:
+        source.close()
+        if proc is not None:
+            proc.terminate()
+            proc.wait(5)
+
+    text = json.dumps(results, indent=1)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
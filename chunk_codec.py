@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Run-length codec for packed 4-bit chunks (decoded on the ESP32 by rleDecode in src/main.cpp)
+- Byte stream of tokens:
+    0x00-0x7F  c  followed by c + 1 literal bytes (1..128)
+    0x80-0xFF  c  followed by one byte repeated c - 0x80 + 3 times (3..130)
+- A run of equal nibble pairs (blank UI, flat fills, text margins) costs 2 bytes per 130
+- The encoder is vectorized with NumPy; encode_or_raw() falls back to the raw bytes
+  when compression does not save at least min_gain
+- On the wire: WS header rows |= CHUNK_FLAG_RLE (also per chunk in /stream-chunks bodies),
+  /stream-chunk?enc=rle
+"""
+
+import numpy as np
+
+CHUNK_FLAG_RLE = 0x8000  # bit 15 of the WS header "rows" field
+MAX_LITERAL = 128
+MAX_REPEAT = 130
+MIN_REPEAT = 3
+
+
+def _runs(data):
+    """(starts, lengths) of runs of equal bytes"""
+    n = data.size
+    edges = np.flatnonzero(data[1:] != data[:-1]) + 1
+    starts = np.concatenate(([0], edges))
+    lengths = np.diff(np.concatenate((starts, [n])))
+    return starts, lengths
+
+
+def _plan(data):
+    """Per-run token counts and literal groups shared by encoded_size() and rle_encode()"""
+    starts, lengths = _runs(data)
+    full, rem = np.divmod(lengths, MAX_REPEAT)
+    tail_rep = rem >= MIN_REPEAT
+    reps = full + tail_rep
+    lit = np.where(tail_rep, 0, rem)  # leftover bytes of a run go into the literal stream
+    # a run with repeat tokens starts a new group: [its repeats][literal bytes up to the next such run]
+    # (leading pure-literal runs form group 0)
+    group = np.cumsum(reps > 0) - int(reps[0] > 0)
+    n_groups = int(group[-1]) + 1
+    lit_len = np.bincount(group, weights=lit, minlength=n_groups).astype(np.int64)
+    n_reps = np.bincount(group, weights=reps, minlength=n_groups).astype(np.int64)
+    return starts, lengths, full, rem, tail_rep, reps, lit, group, n_groups, lit_len, n_reps
+
+
+def _size(plan):
+    *_, lit_len, n_reps = plan
+    return int(2 * n_reps.sum() + lit_len.sum() + (-(-lit_len // MAX_LITERAL)).sum())
+
+
+def encoded_size(data):
+    """Exact RLE size of data without building the output"""
+    data = np.asarray(data, dtype=np.uint8).reshape(-1)
+    return _size(_plan(data)) if data.size else 0
+
+
+def rle_encode(data):
+    """Encode a uint8 buffer; returns bytes"""
+    data = np.asarray(data, dtype=np.uint8).reshape(-1)
+    return _build(data, _plan(data)) if data.size else b""
+
+
+def _build(data, plan):
+    starts, lengths, full, rem, tail_rep, reps, lit, group, n_groups, lit_len, n_reps = plan
+    n_pieces = -(-lit_len // MAX_LITERAL)
+    group_size = 2 * n_reps + lit_len + n_pieces
+    group_off = np.concatenate(([0], np.cumsum(group_size)[:-1]))
+    out = np.empty(int(group_size.sum()), dtype=np.uint8)
+
+    # repeat tokens: every run with reps > 0 is the first run of its group
+    rep_runs = np.flatnonzero(reps > 0)
+    if rep_runs.size:
+        counts = reps[rep_runs]
+        tok_run = np.repeat(rep_runs, counts)
+        first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        tok_idx = np.arange(tok_run.size) - np.repeat(first, counts)  # token index within its run
+        tok_len = np.where(tok_idx < full[tok_run], MAX_REPEAT, rem[tok_run])
+        pos = group_off[group[tok_run]] + 2 * tok_idx
+        out[pos] = 0x80 + tok_len - MIN_REPEAT
+        out[pos + 1] = data[starts[tok_run]]
+
+    # literal bytes of a group are contiguous in data: the leftover of its first run
+    # followed by the pure-literal runs after it
+    lit_groups = np.flatnonzero(lit_len)
+    if lit_groups.size:
+        run_end = starts + lengths
+        # first run contributing literal bytes to each group
+        has_lit = np.flatnonzero(lit > 0)
+        first_lit_run = has_lit[np.searchsorted(group[has_lit], lit_groups)]
+        src_start = run_end[first_lit_run] - lit[first_lit_run]
+        glen = lit_len[lit_groups]
+        npc = n_pieces[lit_groups]
+        # one entry per literal piece
+        pg = np.repeat(np.arange(lit_groups.size), npc)
+        pfirst = np.concatenate(([0], np.cumsum(npc)[:-1]))
+        pidx = np.arange(pg.size) - pfirst[pg]
+        plen = np.minimum(MAX_LITERAL, glen[pg] - pidx * MAX_LITERAL)
+        hdr = group_off[lit_groups][pg] + 2 * n_reps[lit_groups][pg] + pidx * (MAX_LITERAL + 1)
+        out[hdr] = plen - 1
+        # byte copies
+        bfirst = np.concatenate(([0], np.cumsum(plen)[:-1]))
+        k = np.arange(int(plen.sum())) - np.repeat(bfirst, plen)
+        dst = np.repeat(hdr + 1, plen) + k
+        src = np.repeat(src_start[pg] + pidx * MAX_LITERAL, plen) + k
+        out[dst] = data[src]
+    return out.tobytes()
+
+
+def rle_decode_prefix(data, out_len, offset=0):
+    """Decode tokens from data[offset:] until out_len bytes are produced.
+
+    Returns (decoded bytes, offset after the last token); used for several RLE
+    chunks back to back (/stream-chunks). Raises ValueError on malformed input.
+    """
+    src = memoryview(data).cast("B")
+    out = bytearray(out_len)
+    i, o = offset, 0
+    n = len(src)
+    while o < out_len:
+        if i >= n:
+            raise ValueError(f"RLE decoded {o} bytes, expected {out_len}")
+        c = src[i]
+        i += 1
+        if c < 0x80:
+            k = c + 1
+            if i + k > n or o + k > out_len:
+                raise ValueError("RLE literal overruns buffer")
+            out[o:o + k] = src[i:i + k]
+            i += k
+        else:
+            k = c - 0x80 + MIN_REPEAT
+            if i >= n or o + k > out_len:
+                raise ValueError("RLE repeat overruns buffer")
+            out[o:o + k] = bytes((src[i],)) * k
+            i += 1
+        o += k
+    return bytes(out), i
+
+
+def rle_decode(data, out_len):
+    """Decode to exactly out_len bytes; raises ValueError on malformed input"""
+    data = bytes(data)
+    out, end = rle_decode_prefix(data, out_len)
+    if end != len(data):
+        raise ValueError(f"RLE data continues after {out_len} bytes")
+    return out
+
+
+def encode_or_raw(chunk, min_gain=0.1):
+    """Return (payload, compressed): RLE when it saves at least min_gain of the size, else raw"""
+    raw = np.asarray(chunk, dtype=np.uint8).reshape(-1)
+    if raw.size == 0:
+        return chunk, False
+    plan = _plan(raw)
+    if _size(plan) > raw.size * (1.0 - min_gain):
+        return chunk, False
+    return _build(raw, plan), True
@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+ESP32-S2 / JBD013VGA device emulator for benchmarks and regression tests
+- HTTP API with the same routes and semantics as setupWebServer() in src/main.cpp:
+    /upload  /upload/begin|chunk|status|commit|abort  /apply  /stream-chunk  /stream-chunks
+    /api/fs-status  /api/runtime-status  /runtime.bin
+  (multipart or application/octet-stream bodies; --http-features "" emulates older
+  firmware without /stream-chunks and the chunked upload)
+- Binary WebSocket protocol of webSocketEvent(): <HH rowStart, rows> + rows * 320 bytes
+  (rows bit 15 = RLE payload, /stream-chunk?enc=rle; see chunk_codec.py), plus the
+  HELLO / FRAME_END / CHUNK_ACK flow-control messages (see stream_transport.py)
+- Simulated 640x480 4-bit panel cache; every display_image() costs
+  spi_us_per_byte * bytes + sync_ms (SPI_SYNC), and the device handles one
+  request at a time like the single-threaded Arduino loop()
+- Dump the framebuffer to PNG (--dump-png on exit, or GET /emu/framebuffer.png)
+
+Usage: python device_emulator.py --http-port 8080 --ws-port 8081
+       python -m stream_engine stream --host 127.0.0.1:8080 --ws-port 8081 --fps 10
+"""
+
+import argparse
+import io
+import json
+import signal
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+import runtime_image
+from chunk_codec import CHUNK_FLAG_RLE, rle_decode, rle_decode_prefix
+from stream_transport import (WS_CONTROL_ROW, WS_FRAME_ACK, WS_MSG_CHUNK_ACK, WS_MSG_FRAME_END,
+                              WS_MSG_HELLO, WS_REPLY)
+
+try:
+    import websockets
+    import asyncio
+except ImportError:
+    websockets = None
+    asyncio = None
+
+PANEL_WIDTH = 640
+PANEL_HEIGHT = 480
+BYTES_PER_ROW_PACKED = PANEL_WIDTH // 2
+BYTES_PER_ROW_UNPACKED = PANEL_WIDTH
+FS_TOTAL_BYTES = 0x180000  # spiffs partition in partitions.csv
+WS_MAX_MESSAGE = 15 * 1024  # WEBSOCKETS_MAX_DATA_SIZE of links2004/WebSockets on ESP32
+HTTP_FEATURES = "raw,multi,chunked"  # kHttpFeatures in main.cpp
+UPLOAD_CHUNK_MAX = 16384  # kUploadChunkMax
+WS_PROTO_VERSION = 1  # kWsProtoVersion
+WS_WINDOW = 8  # kWsWindow: chunks in flight the firmware accepts
+
+
+class EmulatedPanel:
+    """Panel cache (480 rows x 320 packed bytes) with an SPI cost model"""
+
+    def __init__(self, spi_us_per_byte=1.0, sync_ms=1.0, realtime=True):
+        self.cache = np.zeros((PANEL_HEIGHT, BYTES_PER_ROW_PACKED), dtype=np.uint8)
+        self.spi_us_per_byte = spi_us_per_byte
+        self.sync_ms = sync_ms
+        self.realtime = realtime
+        self.writes = 0
+        self.bytes_written = 0
+        self.busy_seconds = 0.0
+        self.last_write = 0.0
+
+    def display_image(self, data, length, x, y):
+        """Same addressing as spi_wr_cache: length bytes from column x (pixels) of row y"""
+        buf = np.frombuffer(data, dtype=np.uint8, count=length)
+        flat = self.cache.reshape(-1)
+        start = y * BYTES_PER_ROW_PACKED + x // 2
+        n = max(0, min(length, flat.size - start))
+        flat[start:start + n] = buf[:n]
+        # cmd + 3 addr + dummy + end pixel, plus the 1-byte read-back spi_wr_cache does first
+        cost = (length + 6 + 6) * self.spi_us_per_byte * 1e-6 + self.sync_ms * 1e-3
+        if self.realtime:
+            time.sleep(cost)
+        self.writes += 1
+        self.bytes_written += length
+        self.busy_seconds += cost
+        self.last_write = time.time()
+
+    def levels(self):
+        out = np.empty((PANEL_HEIGHT, PANEL_WIDTH), dtype=np.uint8)
+        out[:, 0::2] = self.cache >> 4
+        out[:, 1::2] = self.cache & 0x0F
+        return out
+
+    def to_png_bytes(self):
+        buf = io.BytesIO()
+        Image.fromarray((self.levels() * 17).astype(np.uint8)).save(buf, format="PNG")
+        return buf.getvalue()
+
+
+def _pack_rows(src, invert):
+    """1B/px rows -> packed rows, like the refreshDisplayFromFS inner loop"""
+    v = src & 0x0F
+    if invert:
+        v = 15 - v
+    return ((v[:, 0::2] << 4) | v[:, 1::2]).astype(np.uint8)
+
+
+class DeviceEmulator:
+    """HTTP (+ optional WebSocket) stand-in for the device firmware"""
+
+    def __init__(self, host="127.0.0.1", http_port=8080, ws_port=8081, spi_us_per_byte=1.0,
+                 sync_ms=1.0, realtime=True, ws_max_message=WS_MAX_MESSAGE, builtin=None, log=None,
+                 http_features=HTTP_FEATURES):
+        self.host = host
+        self.http_port = http_port
+        self.ws_port = ws_port
+        self.ws_max_message = ws_max_message
+        self.http_features = http_features  # runtime-status "http"
+        self.panel = EmulatedPanel(spi_us_per_byte, sync_ms, realtime)
+        self.invert_enabled = False
+        self.runtime_file = None  # bytes of /current_image.bin
+        self.upload_meta = None  # (size, crc32) of /upload.meta
+        self.upload_tmp = bytearray()  # /upload.tmp
+        self.builtin = builtin if builtin is not None else np.zeros((PANEL_HEIGHT, PANEL_WIDTH), np.uint8)
+        self._log = log or (lambda msg: None)
+        self.lock = threading.Lock()  # one request at a time, like loop()
+        self.stats = {"http_requests": 0, "ws_messages": 0, "ws_dropped": 0, "ws_connections": 0,
+                      "bytes_received": 0}
+        self._httpd = None
+        self._ws_loop = None
+        self._ws_stop = None
+        self._threads = []
+
+    # ---- firmware behaviour ---------------------------------------------------
+
+    def refresh_display(self):
+        """refreshDisplay(): built-in current_image.h, 60-row chunks"""
+        for row_start in range(0, PANEL_HEIGHT, 60):
+            packed = _pack_rows(self.builtin[row_start:row_start + 60], self.invert_enabled)
+            self.panel.display_image(packed.tobytes(), packed.size, 0, row_start)
+
+    def refresh_display_from_fs(self):
+        """refreshDisplayFromFS(): v1 packed rows go straight to display_image, others are packed"""
+        data = self.runtime_file
+        if data is None:
+            return self.refresh_display()
+        try:
+            hdr = runtime_image.parse_header(data)
+        except runtime_image.RuntimeImageError:
+            hdr = None
+        if hdr is not None:
+            if hdr["width"] != PANEL_WIDTH or hdr["height"] != PANEL_HEIGHT or \
+                    len(data) < hdr["header_size"] + hdr["length"]:
+                return self.refresh_display()
+            start = hdr["header_size"]
+            if hdr["packed"]:
+                payload = np.frombuffer(data, np.uint8, count=BYTES_PER_ROW_PACKED * PANEL_HEIGHT, offset=start)
+                rows = payload.reshape(PANEL_HEIGHT, BYTES_PER_ROW_PACKED)
+                for row_start in range(0, PANEL_HEIGHT, 60):
+                    chunk = rows[row_start:row_start + 60]
+                    if self.invert_enabled:
+                        chunk = chunk ^ 0xFF
+                    self.panel.display_image(chunk.tobytes(), chunk.size, 0, row_start)
+                return
+        else:
+            start = 0
+        if len(data) < start + PANEL_WIDTH * PANEL_HEIGHT:
+            return self.refresh_display()
+        src = np.frombuffer(data, np.uint8, count=PANEL_WIDTH * PANEL_HEIGHT, offset=start)
+        src = src.reshape(PANEL_HEIGHT, PANEL_WIDTH)
+        for row_start in range(0, PANEL_HEIGHT, 40):
+            packed = _pack_rows(src[row_start:row_start + 40], self.invert_enabled)
+            self.panel.display_image(packed.tobytes(), packed.size, 0, row_start)
+
+    def _verify_upload(self, data, meta=None):
+        """verifyUploadTmp(): error text, or None if the temp file may replace the image"""
+        if not data:
+            return "上传失败: 空文件"
+        if meta is not None and len(data) != meta[0]:
+            return "上传失败: 大小不符"
+        if meta is not None and zlib.crc32(data) != meta[1]:
+            return "上传失败: CRC校验错误"
+        try:
+            hdr = runtime_image.parse_header(data)
+        except runtime_image.RuntimeImageError:
+            hdr = None
+        if hdr is not None:
+            start = hdr["header_size"]
+            payload = data[start:start + hdr["length"]]
+            if len(payload) != hdr["length"] or zlib.crc32(payload) != hdr["crc32"]:
+                return "上传失败: CRC校验错误"
+        return None
+
+    def _fs_free(self):
+        return FS_TOTAL_BYTES - (len(self.runtime_file) if self.runtime_file is not None else 0) - len(self.upload_tmp)
+
+    def handle_upload(self, body):
+        """/upload: the body goes to a temp file and replaces the runtime file only if it checks out"""
+        self.upload_meta = None  # a one-shot upload supersedes an unfinished chunked one
+        self.upload_tmp = bytearray()
+        err = self._verify_upload(body)
+        if err:
+            return (500 if not body else 400), err
+        if len(body) > self._fs_free():
+            return 500, "上传失败"
+        self.runtime_file = bytes(body)
+        v1 = body[:4] == runtime_image.MAGIC
+        return 200, f"上传完成, 大小 {len(body)} 字节" + (", v1打包格式" if v1 else "")
+
+    def upload_state(self, code=200):
+        """sendUploadState(): (code, json, ctype)"""
+        meta = self.upload_meta
+        state = {"active": meta is not None, "size": meta[0] if meta else 0, "crc32": meta[1] if meta else 0,
+                 "received": len(self.upload_tmp) if meta else 0, "chunk_max": UPLOAD_CHUNK_MAX}
+        return code, json.dumps(state), "application/json"
+
+    def upload_begin(self, query):
+        """/upload/begin?size&crc: new session, or resume one with the same size and CRC"""
+        try:
+            want = (int(query["size"]), int(query["crc"]))
+        except (KeyError, ValueError):
+            return 400, "缺少size/crc参数"
+        if want[0] <= 0:
+            return 400, "size无效"
+        if self.upload_meta != want or len(self.upload_tmp) > want[0]:
+            self.upload_meta = None
+            self.upload_tmp = bytearray()
+            if want[0] > self._fs_free():
+                return 507, "空间不足"
+            self.upload_meta = want
+        return self.upload_state()
+
+    def upload_chunk(self, query, body):
+        """/upload/chunk?offset&crc: append in offset order (409 + state if an earlier chunk is missing)"""
+        meta = self.upload_meta
+        if meta is None:
+            return 409, "没有进行中的上传"
+        if not body or len(body) > UPLOAD_CHUNK_MAX:
+            return 400, "分块为空或超过16KiB"
+        try:
+            offset, crc = int(query["offset"]), int(query["crc"])
+        except (KeyError, ValueError):
+            return 400, "缺少offset/crc参数"
+        if zlib.crc32(body) != crc:
+            return 400, "分块CRC校验错误"
+        if offset + len(body) > meta[0]:
+            return 400, "分块超出文件大小"
+        received = len(self.upload_tmp)
+        if offset + len(body) <= received:
+            return self.upload_state()  # resent chunk, already written
+        if offset > received:
+            return self.upload_state(409)
+        self.upload_tmp += body[received - offset:]
+        return self.upload_state()
+
+    def upload_commit(self):
+        meta = self.upload_meta
+        if meta is None:
+            return 409, "没有进行中的上传"
+        if len(self.upload_tmp) != meta[0]:
+            return self.upload_state(409)
+        data, self.upload_tmp = bytes(self.upload_tmp), bytearray()
+        self.upload_meta = None
+        err = self._verify_upload(data, meta)
+        if err:
+            return 400, err
+        self.runtime_file = data
+        return 200, f"上传完成, 大小 {meta[0]} 字节"
+
+    def upload_abort(self):
+        self.upload_meta = None
+        self.upload_tmp = bytearray()
+        return 200, "已取消上传"
+
+    def handle_stream_chunk(self, query, body):
+        """/stream-chunk?rowStart&rows&packed[&sw&sh]"""
+        row_start = int(query.get("rowStart", "0") or 0)
+        rows = int(query.get("rows", "0") or 0)
+        packed = query.get("packed", "1") != "0"
+        if rows <= 0 or row_start >= PANEL_HEIGHT:
+            return 400, "invalid stream params"
+        expected = (BYTES_PER_ROW_PACKED if packed else BYTES_PER_ROW_UNPACKED) * rows
+        if packed and query.get("enc") == "rle" and body is not None:
+            try:
+                body = rle_decode(body[:expected], expected)
+            except ValueError:
+                return 400, "bad rle data"
+        if body is None or len(body) < expected:
+            return 400, "incomplete body"
+        body = body[:expected]
+        if packed:
+            self.panel.display_image(body, expected, 0, row_start)
+        else:
+            sw = int(query.get("sw", PANEL_WIDTH) or PANEL_WIDTH)
+            sh = int(query.get("sh", PANEL_HEIGHT) or PANEL_HEIGHT)
+            if sw <= 0 or sh <= 0:
+                sw, sh = PANEL_WIDTH, PANEL_HEIGHT
+            src = np.frombuffer(body, np.uint8)
+            ys = np.minimum(np.arange(row_start, row_start + rows), sh - 1)
+            xs = np.minimum(np.arange(PANEL_WIDTH) * sw // PANEL_WIDTH, sw - 1)
+            idx = ys[:, None] * sw + xs[None, :]
+            idx = np.minimum(idx, src.size - 1)
+            out = _pack_rows(src[idx], self.invert_enabled)
+            self.panel.display_image(out.tobytes(), out.size, 0, row_start)
+        return 200, "chunk applied"
+
+    def handle_stream_chunks(self, body):
+        """/stream-chunks: WS-format chunks back to back, each applied once it is complete"""
+        body = body or b""
+        pos = applied = 0
+        while pos < len(body):
+            if len(body) - pos < 4:
+                return 400, "incomplete body"
+            row_start = body[pos] | (body[pos + 1] << 8)
+            rows = body[pos + 2] | (body[pos + 3] << 8)
+            rle = bool(rows & CHUNK_FLAG_RLE)
+            rows &= ~CHUNK_FLAG_RLE
+            pos += 4
+            if rows == 0 or row_start + rows > PANEL_HEIGHT:
+                return 400, "invalid chunk header"
+            expected = BYTES_PER_ROW_PACKED * rows
+            if rle:
+                try:
+                    data, pos = rle_decode_prefix(body, expected, pos)
+                except ValueError:
+                    return 400, "bad rle data"
+            else:
+                if len(body) - pos < expected:
+                    return 400, "incomplete body"
+                data = body[pos:pos + expected]
+                pos += expected
+            self.panel.display_image(data, expected, 0, row_start)
+            applied += 1
+        return 200, f"{applied} chunks applied"
+
+    def handle_ws_message(self, payload, client=None):
+        """webSocketEvent(WStype_BIN) for one connection; returns the binary replies to send.
+
+        client: per-connection dict (WsClientState); acks start after a HELLO control message.
+        """
+        client = {} if client is None else client
+        if len(payload) >= 4 and payload[0] == 0xFF and payload[1] == 0xFF:
+            return self._ws_control(payload, client)
+        if not client.get("in_frame"):
+            client["in_frame"] = True
+            client["frame_start"] = time.perf_counter()
+        ok = self._ws_apply_chunk(payload)
+        if not ok:
+            self.stats["ws_dropped"] += 1
+        if not client.get("acks"):
+            return []
+        if not ok:
+            client["rejected"] += 1
+        client["chunk_seq"] = (client["chunk_seq"] + 1) & 0xFFFF
+        return [WS_REPLY.pack(WS_CONTROL_ROW, WS_MSG_CHUNK_ACK, client["chunk_seq"], 0 if ok else 1)]
+
+    def _ws_control(self, payload, client):
+        kind = payload[2] | (payload[3] << 8)
+        if kind == WS_MSG_HELLO:
+            client.update(acks=True, chunk_seq=0, rejected=0, in_frame=False)
+            return [WS_REPLY.pack(WS_CONTROL_ROW, WS_MSG_HELLO, WS_PROTO_VERSION, WS_WINDOW)]
+        if kind == WS_MSG_FRAME_END and client.get("acks") and len(payload) >= 6:
+            seq = payload[4] | (payload[5] << 8)
+            apply_us = 0
+            if client["in_frame"]:
+                apply_us = int((time.perf_counter() - client["frame_start"]) * 1e6)
+            reply = WS_FRAME_ACK.pack(WS_CONTROL_ROW, WS_MSG_FRAME_END, seq, client["rejected"],
+                                      min(apply_us, 0xFFFFFFFF))
+            client.update(rejected=0, in_frame=False)
+            return [reply]
+        return []
+
+    def _ws_apply_chunk(self, payload):
+        """One chunk message; False if it is malformed (dropped, as the firmware does)"""
+        if len(payload) < 4:
+            return False
+        row_start = payload[0] | (payload[1] << 8)
+        rows = payload[2] | (payload[3] << 8)
+        rle = bool(rows & CHUNK_FLAG_RLE)
+        rows &= ~CHUNK_FLAG_RLE
+        expected = BYTES_PER_ROW_PACKED * rows
+        if row_start >= PANEL_HEIGHT or rows == 0:
+            return False
+        if rle:
+            try:
+                if row_start + rows > PANEL_HEIGHT:
+                    raise ValueError("rows past panel end")
+                data = rle_decode(payload[4:], expected)
+            except ValueError:
+                return False
+            self.panel.display_image(data, expected, 0, row_start)
+            return True
+        if len(payload) < 4 + expected:
+            return False
+        self.panel.display_image(payload[4:4 + expected], expected, 0, row_start)
+        return True
+
+    def fs_status(self):
+        used = len(self.runtime_file) if self.runtime_file is not None else 0
+        return {"mounted": True, "total": FS_TOTAL_BYTES, "used": used}
+
+    def runtime_status(self):
+        data = self.runtime_file
+        status = {"available": data is not None, "size": len(data) if data is not None else 0}
+        fmt = "none"
+        if data is not None:
+            try:
+                hdr = runtime_image.parse_header(data)
+            except runtime_image.RuntimeImageError:
+                hdr = None
+            fmt = "legacy" if hdr is None else ("v1-packed" if hdr["packed"] else "v1")
+        status["format"] = fmt
+        status["codecs"] = "rle"
+        if self.http_features:
+            status["http"] = self.http_features
+        if data is not None and hdr is not None:
+            status["crc32"] = hdr["crc32"]
+        return status
+
+    def emu_stats(self):
+        p = self.panel
+        return dict(self.stats, display_writes=p.writes, display_bytes=p.bytes_written,
+                    spi_busy_seconds=round(p.busy_seconds, 6))
+
+    # ---- servers ------------------------------------------------------------
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer((self.host, self.http_port), _make_handler(self))
+        self._httpd.daemon_threads = True
+        self.http_port = self._httpd.server_address[1]
+        t = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        t.start()
+        self._threads.append(t)
+        self._log(f"HTTP: http://{self.host}:{self.http_port}")
+        if self.ws_port is not None:
+            if websockets is None or asyncio is None:
+                raise RuntimeError("websockets not installed: pip install websockets")
+            ready = threading.Event()
+            t = threading.Thread(target=self._run_ws, args=(ready,), daemon=True)
+            t.start()
+            self._threads.append(t)
+            ready.wait(5.0)
+            self._log(f"WebSocket: ws://{self.host}:{self.ws_port}")
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._ws_loop is not None and self._ws_stop is not None:
+            self._ws_loop.call_soon_threadsafe(self._ws_stop.set)
+        for t in self._threads:
+            t.join(2.0)
+        self._threads = []
+
+    def _run_ws(self, ready):
+        async def handler(ws):
+            self.stats["ws_connections"] += 1
+            client = {}
+            try:
+                async for message in ws:
+                    if isinstance(message, str):
+                        continue
+                    with self.lock:
+                        self.stats["ws_messages"] += 1
+                        self.stats["bytes_received"] += len(message)
+                        # blocking here is intentional: the device stops reading while it drives SPI
+                        replies = self.handle_ws_message(message, client)
+                    for reply in replies:
+                        await ws.send(reply)
+            except websockets.ConnectionClosed as e:
+                self._log(f"WebSocket closed: {e}")
+
+        async def main():
+            self._ws_stop = asyncio.Event()
+            async with websockets.serve(handler, self.host, self.ws_port,
+                                        max_size=self.ws_max_message, ping_interval=None) as server:
+                sock = next(iter(server.sockets), None)
+                if sock is not None:
+                    self.ws_port = sock.getsockname()[1]
+                ready.set()
+                await self._ws_stop.wait()
+
+        self._ws_loop = asyncio.new_event_loop()
+        try:
+            self._ws_loop.run_until_complete(main())
+        finally:
+            self._ws_loop.close()
+
+
+def parse_multipart_file(content_type, body):
+    """Return the payload of the first file part of a multipart/form-data body"""
+    boundary = None
+    for part in content_type.split(";"):
+        part = part.strip()
+        if part.startswith("boundary="):
+            boundary = part[len("boundary="):].strip('"')
+    if not boundary:
+        return None
+    delim = b"--" + boundary.encode("latin-1")
+    for section in body.split(delim)[1:]:
+        if section.startswith(b"--"):
+            break
+        head, sep, data = section.partition(b"\r\n\r\n")
+        if not sep:
+            continue
+        if b"filename=" in head or b'name="file"' in head:
+            return data[:-2] if data.endswith(b"\r\n") else data
+    return None
+
+
+def _make_handler(emu):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, code, body, ctype="text/plain; charset=utf-8"):
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, obj):
+            self._send(200, json.dumps(obj), "application/json")
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(n) if n else b""
+            emu.stats["bytes_received"] += len(data)
+            ctype = self.headers.get("Content-Type", "")
+            if ctype.startswith("multipart/form-data"):
+                return parse_multipart_file(ctype, data)
+            return data
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/invert":  # server.on() without a method accepts GET too
+                return self.do_POST()
+            with emu.lock:
+                emu.stats["http_requests"] += 1
+                if url.path == "/api/fs-status":
+                    return self._json(emu.fs_status())
+                if url.path == "/api/runtime-status":
+                    return self._json(emu.runtime_status())
+                if url.path == "/api/invert-status":
+                    return self._json({"enabled": emu.invert_enabled,
+                                       "status": "启用" if emu.invert_enabled else "禁用"})
+                if url.path == "/runtime.bin":
+                    if emu.runtime_file is None:
+                        return self._send(404, "未找到")
+                    return self._send(200, emu.runtime_file, "application/octet-stream")
+                if url.path == "/upload/status" and "chunked" in emu.http_features:
+                    return self._send(*emu.upload_state())
+                if url.path == "/emu/framebuffer.png":
+                    return self._send(200, emu.panel.to_png_bytes(), "image/png")
+                if url.path == "/emu/stats":
+                    return self._json(emu.emu_stats())
+            self._send(404, "Not found")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            body = self._body()
+            with emu.lock:
+                emu.stats["http_requests"] += 1
+                if url.path == "/upload":
+                    return self._send(*emu.handle_upload(body))
+                if url.path.startswith("/upload/") and "chunked" in emu.http_features:
+                    if url.path == "/upload/begin":
+                        return self._send(*emu.upload_begin(query))
+                    if url.path == "/upload/chunk":
+                        return self._send(*emu.upload_chunk(query, body))
+                    if url.path == "/upload/commit":
+                        return self._send(*emu.upload_commit())
+                    if url.path == "/upload/abort":
+                        return self._send(*emu.upload_abort())
+                if url.path == "/apply":
+                    if emu.runtime_file is None:
+                        return self._send(404, "未找到运行时图像")
+                    emu.refresh_display_from_fs()
+                    return self._send(200, "已应用运行时图像")
+                if url.path == "/stream-chunk":
+                    return self._send(*emu.handle_stream_chunk(query, body))
+                if url.path == "/stream-chunks" and "multi" in emu.http_features:
+                    return self._send(*emu.handle_stream_chunks(body))
+                if url.path == "/invert":
+                    if query.get("enable") not in ("true", "false"):
+                        return self._send(400, "invalid param")
+                    emu.invert_enabled = query.get("enable") == "true"
+                    emu.refresh_display()
+                    return self._send(200, "invert on" if emu.invert_enabled else "invert off")
+            self._send(404, "Not found")
+
+        do_PUT = do_POST
+
+    return Handler
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Emulate the ESP32-S2 JBD013VGA HTTP/WebSocket API")
+    ap.add_argument("--bind", default="127.0.0.1")
+    ap.add_argument("--http-port", type=int, default=8080)
+    ap.add_argument("--ws-port", type=int, default=8081)
+    ap.add_argument("--spi-us-per-byte", type=float, default=1.0, help="SPI cost per byte written (us)")
+    ap.add_argument("--sync-ms", type=float, default=1.0, help="SPI_SYNC delay per display_image (ms)")
+    ap.add_argument("--no-realtime", action="store_true", help="account SPI time without sleeping")
+    ap.add_argument("--builtin", help="runtime .bin (v1 or legacy) used as the built-in image")
+    ap.add_argument("--dump-png", help="write the framebuffer to this PNG on exit")
+    ap.add_argument("--http-features", default=HTTP_FEATURES,
+                    help='runtime-status "http" list ("" = firmware before /stream-chunks)')
+    args = ap.parse_args(argv)
+
+    builtin = None
+    if args.builtin:
+        with open(args.builtin, "rb") as f:
+            builtin, _ = runtime_image.decode(f.read())
+    emu = DeviceEmulator(args.bind, args.http_port, args.ws_port, args.spi_us_per_byte, args.sync_ms,
+                         realtime=not args.no_realtime, builtin=builtin, log=print,
+                         http_features=args.http_features)
+    emu.refresh_display()
+    emu.start()
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *a: stop.set())
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    stop.wait()
+    emu.stop()
+    print(json.dumps(emu.emu_stats()))
+    if args.dump_png:
+        with open(args.dump_png, "wb") as f:
+            f.write(emu.panel.to_png_bytes())
+        print(f"Framebuffer written to {args.dump_png}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of ready-to-send packed 4-bit frames
+- Keyed by source content hash + conversion parameters (size, invert, dither, resample, packing)
+- One <key>.frames file per entry holding n raw (h, w/2) packed frames back to back,
+  opened as a read-only np.memmap: a hit costs no decode/resize/quantize/pack and no
+  copy, and FramePacker.chunk_view() slices go straight from the page cache to the socket
+- index.json records shape, size and last use; entries are evicted least recently used
+  first once the total exceeds max_bytes. Other processes' changes are merged per key
+  (newest last_used wins), and only when the file's mtime has changed
+- Entry files are written to a temp name and renamed, so readers never see partial data
+
+Usage: python frame_cache.py stats DIR | clear DIR
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+INDEX_NAME = "index.json"
+DEFAULT_MAX_BYTES = 512 << 20
+TOUCH_INTERVAL_S = 60.0  # last_used granularity persisted by get()
+
+
+def content_hash(paths, bufsize=1 << 20):
+    """sha256 over the contents of one or more files (in order)"""
+    h = hashlib.sha256()
+    for path in [paths] if isinstance(paths, str) else paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(bufsize), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def make_key(source_hash, **params):
+    """Cache key for a source hash and the conversion parameters that produced the frames"""
+    blob = json.dumps({"source": source_hash, "params": params}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+class CacheWriter:
+    """Append packed frames for one key; commit() publishes the entry, abort() drops it"""
+
+    def __init__(self, cache, key, params):
+        self.cache = cache
+        self.key = key
+        self.params = params
+        self.shape = None
+        self.frames = 0
+        self.path = os.path.join(cache.directory, f"{key}.frames.{os.getpid()}.{threading.get_ident()}.tmp")
+        self._f = open(self.path, "wb")
+
+    def append(self, packed):
+        """Add one (h, w/2) uint8 frame; False (and the entry is dropped) once it would not fit"""
+        if self._f is None:
+            return False
+        packed = np.ascontiguousarray(packed, dtype=np.uint8)
+        if self.shape is None:
+            self.shape = packed.shape
+        elif packed.shape != self.shape:
+            raise ValueError(f"frame shape {packed.shape} differs from {self.shape}")
+        if (self.frames + 1) * packed.nbytes > self.cache.max_bytes:
+            self.abort()
+            return False
+        self._f.write(packed.data)
+        self.frames += 1
+        return True
+
+    def commit(self):
+        """Publish the entry; returns the memmapped frames (or None if nothing was written)"""
+        if self._f is None:
+            return None
+        self._f.close()
+        self._f = None
+        if not self.frames:
+            os.remove(self.path)
+            return None
+        return self.cache._publish(self)
+
+    def abort(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class FrameCache:
+    """Directory of memmapped packed-frame entries with an LRU size bound (thread-safe)"""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._index_mtime = None  # mtime_ns of index.json as last read or written
+        self._index = self._load_index()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.frames")
+
+    def _index_file_mtime(self):
+        try:
+            return os.stat(os.path.join(self.directory, INDEX_NAME)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load_index(self):
+        self._index_mtime = self._index_file_mtime()
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        return {k: e for k, e in index.items() if os.path.exists(self._entry_path(k))}
+
+    def _merge_index(self):
+        """Fold in entries other processes wrote to index.json, if it changed since we last saw it"""
+        if self._index_file_mtime() == self._index_mtime:
+            return
+        for key, entry in self._load_index().items():
+            cur = self._index.get(key)
+            if cur is None or entry["last_used"] > cur["last_used"]:
+                self._index[key] = entry
+
+    def _save_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._index, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+        self._index_mtime = self._index_file_mtime()
+
+    def _open(self, key, entry):
+        return np.memmap(self._entry_path(key), dtype=np.uint8, mode="r",
+                         shape=(entry["frames"],) + tuple(entry["shape"]))
+
+    def get(self, key):
+        """(n, h, w/2) read-only memmap of the cached frames, or None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                # another process may have added it since we loaded the index
+                self._merge_index()
+                entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                frames = self._open(key, entry)
+            except (OSError, ValueError):
+                self._index.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            if now - entry["last_used"] > TOUCH_INTERVAL_S:
+                entry["last_used"] = now
+                self._save_index()
+            return frames
+
+    def writer(self, key, **params):
+        return CacheWriter(self, key, params)
+
+    def put(self, key, frames, **params):
+        """Store an iterable of packed frames under key; returns the memmap (None if too big)"""
+        w = self.writer(key, **params)
+        try:
+            for packed in frames:
+                if not w.append(packed):
+                    return None
+        except BaseException:
+            w.abort()
+            raise
+        return w.commit()
+
+    def _publish(self, writer):
+        key = writer.key
+        os.replace(writer.path, self._entry_path(key))
+        entry = {"frames": writer.frames, "shape": list(writer.shape),
+                 "bytes": os.path.getsize(self._entry_path(key)), "last_used": time.time(),
+                 "params": writer.params}
+        with self._lock:
+            self._merge_index()
+            self._index[key] = entry
+            self._evict(keep=key)
+            self._save_index()
+            return self._open(key, entry)
+
+    def _evict(self, keep=None):
+        total = sum(e["bytes"] for e in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self._entry_path(key))
+            except FileNotFoundError:
+                pass  # already evicted by another process
+            except OSError:
+                continue  # still mapped elsewhere (Windows); retry on the next put
+            total -= self._index.pop(key)["bytes"]
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self._entry_path(key))
+                except OSError:
+                    continue
+                del self._index[key]
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._index),
+                    "bytes": sum(e["bytes"] for e in self._index.values()),
+                    "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2 or argv[0] not in ("stats", "clear"):
+        print("usage: python frame_cache.py stats|clear DIR", file=sys.stderr)
+        return 2
+    cache = FrameCache(argv[1])
+    if argv[0] == "clear":
+        cache.clear()
+    s = cache.stats()
+    print(f"{s['entries']} entries, {s['bytes'] / (1 << 20):.1f} MiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
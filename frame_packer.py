@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Whole-frame 4-bit packer for the JBD013VGA panel
+- Packs a 640x480 1B/px (low nibble) frame to 480 rows x 320 bytes in one pass
+- Chunk payloads are memoryview slices of the packed frame (no copies)
+- WS messages reuse one preallocated bytearray: 4-byte header rowStart(u16), rows(u16) + rows
+- Optional RLE payloads (chunk_codec.py) flagged by bit 15 of the rows field
+"""
+
+import struct
+
+import numpy as np
+
+from chunk_codec import CHUNK_FLAG_RLE, encode_or_raw
+
+PANEL_WIDTH = 640
+PANEL_HEIGHT = 480
+BYTES_PER_ROW = PANEL_WIDTH // 2
+MAX_CHUNK_ROWS = 60
+WS_HEADER = struct.Struct('<HH')
+
+
+class FramePacker:
+    """Pack whole frames once and slice chunks out of the result.
+
+    pack() allocates a fresh (480, 320) array unless `out` is given, because packed
+    frames are kept as delta baselines and queued for sending. ws_message() returns a
+    view of the packer's own message buffer, valid until the next ws_message() call.
+    """
+
+    def __init__(self, max_chunk_rows=MAX_CHUNK_ROWS):
+        self.max_chunk_rows = max_chunk_rows
+        self._lo = np.empty((PANEL_HEIGHT, BYTES_PER_ROW), dtype=np.uint8)
+        self._msg = bytearray(WS_HEADER.size + BYTES_PER_ROW * max_chunk_rows)
+        self._msg_view = memoryview(self._msg)
+
+    def pack(self, g4, out=None):
+        """Pack (480, 640) 4-bit levels (array or bytes) to (480, 320): (p0 << 4) | p1"""
+        src = np.frombuffer(g4, dtype=np.uint8) if not isinstance(g4, np.ndarray) else g4
+        src = src.reshape(PANEL_HEIGHT, PANEL_WIDTH)
+        if out is None:
+            out = np.empty((PANEL_HEIGHT, BYTES_PER_ROW), dtype=np.uint8)
+        # uint8 shift drops the high nibble, so no separate mask is needed for p0
+        np.left_shift(src[:, 0::2], 4, out=out)
+        np.bitwise_and(src[:, 1::2], 0x0F, out=self._lo)
+        np.bitwise_or(out, self._lo, out=out)
+        return out
+
+    @staticmethod
+    def pack_rows(g4_rows, rows, out):
+        """Pack (len(rows), 640) levels into rows of an existing packed frame"""
+        out[rows] = (g4_rows[:, 0::2] << 4) | (g4_rows[:, 1::2] & 0x0F)
+        return out
+
+    @staticmethod
+    def chunk_view(packed, row_start, rows):
+        """Zero-copy memoryview of rows [row_start, row_start + rows) of a packed frame"""
+        start = row_start * BYTES_PER_ROW
+        return memoryview(packed.reshape(-1))[start:start + rows * BYTES_PER_ROW]
+
+    def ws_message(self, packed, row_start, rows, compress=False):
+        """Header + rows in the preallocated message buffer, as a memoryview.
+
+        compress: RLE-encode the rows when that saves space (raw otherwise).
+        """
+        if rows > self.max_chunk_rows:
+            raise ValueError(f"rows {rows} exceeds max_chunk_rows {self.max_chunk_rows}")
+        payload = self.chunk_view(packed, row_start, rows)
+        flags = 0
+        if compress:
+            payload, rle = encode_or_raw(payload)
+            flags = CHUNK_FLAG_RLE if rle else 0
+        n = len(payload)
+        WS_HEADER.pack_into(self._msg, 0, row_start, rows | flags)
+        self._msg_view[WS_HEADER.size:WS_HEADER.size + n] = payload
+        return self._msg_view[:WS_HEADER.size + n]
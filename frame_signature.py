@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Per-band frame signatures for skip-identical streaming
+- CRC-32 of every band of raw captured rows (~0.3 ms for a 640x480 BGRA frame,
+  well below quantize + pack), compared with the previous frame's signature
+- update() returns a per-row changed mask: all False for an identical frame, which
+  lets the engine skip quantize/pack/send, and otherwise the rows worth re-encoding
+"""
+
+import zlib
+
+import numpy as np
+
+
+class BandSignature:
+    """Rolling per-band CRC-32 signature of the last frame passed to update()"""
+
+    def __init__(self, band_rows=16):
+        self.band_rows = band_rows
+        self._hashes = None
+        self._shape = None
+
+    def reset(self):
+        self._hashes = None
+        self._shape = None
+
+    def hashes(self, frame):
+        frame = np.ascontiguousarray(frame)
+        b = self.band_rows
+        return np.fromiter((zlib.crc32(frame[r:r + b]) for r in range(0, frame.shape[0], b)),
+                           dtype=np.uint32)
+
+    def update(self, frame):
+        """Return a bool mask over frame rows that changed since the last update, or None if unknown"""
+        hashes = self.hashes(frame)
+        prev, prev_shape = self._hashes, self._shape
+        self._hashes, self._shape = hashes, frame.shape
+        if prev is None or prev_shape != frame.shape:
+            return None
+        changed = np.repeat(hashes != prev, self.band_rows)[:frame.shape[0]]
+        return changed
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Fast C header writer for current_image.h
+- Formats 16 bytes per line with a vectorized "0xNN, " lookup table
+- Streams blocks of lines through a buffered file handle (no quadratic string growth)
+- Variants:
+    array    const u8 <prefix>_data[] = {...} (default, 1B/px low nibble)
+    packed   same, but two pixels per byte (half the size), defines <PREFIX>_PACKED
+    incbin   raw blob next to the header, pulled in by .incbin from a generated .S file;
+             the header only declares the symbol, so it can be included anywhere
+"""
+
+import os
+
+import numpy as np
+
+VALUES_PER_LINE = 16
+LINES_PER_WRITE = 4096
+
+# "0xNN, " for every byte value, as a (256, 6) uint8 table
+_HEX_TABLE = np.frombuffer("".join(f"0x{b:02X}, " for b in range(256)).encode("ascii"),
+                           dtype=np.uint8).reshape(256, 6)
+
+
+PACKED_WIDTH = 640  # packed headers are copied row for row into the panel buffer
+PACKED_HEIGHT = 480
+
+
+def pack_4bit(levels):
+    """(h, w) levels 0..15 -> (h, w/2) bytes, (p0 << 4) | p1 (panel order); w must be even"""
+    if levels.ndim != 2 or levels.shape[1] % 2:
+        raise ValueError(f"4-bit packing needs an (h, w) array with even w, got shape {levels.shape}")
+    return ((levels[:, 0::2] & 0x0F) << 4) | (levels[:, 1::2] & 0x0F)
+
+
+def _iter_hex_blocks(flat):
+    n_full = flat.size // VALUES_PER_LINE
+    tail = flat[n_full * VALUES_PER_LINE:]
+    width = 2 + VALUES_PER_LINE * 6
+    for start in range(0, n_full, LINES_PER_WRITE):
+        stop = min(start + LINES_PER_WRITE, n_full)
+        rows = flat[start * VALUES_PER_LINE:stop * VALUES_PER_LINE].reshape(-1, VALUES_PER_LINE)
+        block = np.empty((rows.shape[0], width), dtype=np.uint8)
+        block[:, 0:2] = ord(" ")
+        block[:, 2:] = _HEX_TABLE[rows].reshape(rows.shape[0], -1)
+        block[:, -1] = ord("\n")  # "0xNN, " -> "0xNN,\n" at the end of each line
+        out = block.tobytes()
+        if stop == n_full and tail.size == 0:
+            out = out[:-2] + b"\n"  # no comma after the last value
+        yield out
+    if tail.size:
+        yield ("  " + ", ".join(f"0x{b:02X}" for b in tail.tolist()) + "\n").encode("ascii")
+
+
+def format_comment(packed):
+    return ("Format: packed 4-bit, two pixels per byte (high nibble first)" if packed
+            else "Format: 1 byte per pixel, only low 4 bits used (0-15)")
+
+
+def write_header(out_path, levels, var_prefix="current_image", packed=False, incbin=False,
+                 comments=()):
+    """Write a C header for (height, width) 4-bit levels.
+
+    packed: store two pixels per byte (panel order) and define <PREFIX>_PACKED; 640x480 only.
+    incbin: write the data to <header>_data.bin / .bin4 plus a <header>_data.S that
+            defines the symbol with .incbin (compiled once, next to the header), and
+            only declare it in the header. The blob path is resolved by the assembler
+            relative to the build directory, i.e. the PlatformIO project root.
+    Returns a dict with output paths and the data size in bytes.
+    """
+    height, width = levels.shape
+    if packed and (width, height) != (PACKED_WIDTH, PACKED_HEIGHT):
+        raise ValueError(f"packed headers must be {PACKED_WIDTH}x{PACKED_HEIGHT} (the firmware copies "
+                         f"them straight into the panel buffer), got {width}x{height}")
+    data = pack_4bit(levels) if packed else np.ascontiguousarray(levels, dtype=np.uint8)
+    size = data.size
+    guard = var_prefix.upper() + "_H"
+    if not any(c.startswith("Format:") for c in comments):
+        comments = list(comments) + [format_comment(packed)]
+
+    head = [f"// {c}" for c in comments]
+    head += ["", f"#ifndef {guard}", f"#define {guard}", ""]
+    if packed:
+        head.append(f"#define {var_prefix.upper()}_PACKED 1")
+    head += [f"const u16 {var_prefix}_width = {width};",
+             f"const u16 {var_prefix}_height = {height};",
+             f"const u32 {var_prefix}_size = {size};",
+             ""]
+
+    blob_path = asm_path = None
+    with open(out_path, "wb", buffering=1 << 20) as f:
+        if incbin:
+            stem = os.path.splitext(out_path)[0] + "_data"
+            blob_path = stem + (".bin4" if packed else ".bin")
+            asm_path = stem + ".S"
+            with open(blob_path, "wb") as bf:
+                bf.write(data.tobytes())
+            with open(asm_path, "w", encoding="utf-8", newline="\n") as af:
+                af.write("\n".join([
+                    f"// {var_prefix}_data for {os.path.basename(out_path)}; assemble this file once",
+                    "  .section .rodata",
+                    "  .balign 4",
+                    f"  .global {var_prefix}_data",
+                    f"{var_prefix}_data:",
+                    f'  .incbin "{os.path.basename(blob_path)}"',
+                    "",
+                ]))
+            head += [
+                f'extern "C" const u8 {var_prefix}_data[{size}];  // defined in {os.path.basename(asm_path)}',
+                "",
+                f"#endif // {guard}",
+                "",
+            ]
+            f.write("\n".join(head).encode("utf-8"))
+        else:
+            head.append(f"const u8 {var_prefix}_data[{size}] = {{")
+            f.write(("\n".join(head) + "\n").encode("utf-8"))
+            for block in _iter_hex_blocks(data.reshape(-1)):
+                f.write(block)
+            f.write(f"}};\n\n#endif // {guard}\n".encode("ascii"))
+
+    return {"output_path": out_path, "blob_path": blob_path, "asm_path": asm_path, "size": size,
+            "width": width, "height": height, "packed": packed}
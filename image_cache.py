@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+In-memory decode cache for the image converter GUI
+- LRU of resized luma planes, 4-bit levels and preview thumbnails, keyed by
+  (path, mtime, size, params) and bounded by bytes, so repeated previews / exports of
+  the same source skip decode, grayscale and resize
+- JPEGs are decoded with Image.draft() (DCT scaling by 1/2..1/8 while decoding) and
+  other large sources are shrunk with Image.reduce() before the resampler, keeping at
+  least REDUCING_GAP x the target size so the final filter still has margin (as
+  Image.thumbnail does)
+- Levels are cached without invert: inverted levels are 15 - levels in every dither
+  mode, so toggling invert or the output format reuses them
+- Long operations take a cancelled() callable and raise Cancelled between stages
+"""
+
+import collections
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+from quantizer import quantize
+from resampler import resize_gray
+
+DEFAULT_MAX_BYTES = 128 << 20
+REDUCING_GAP = 2.0
+
+
+class Cancelled(Exception):
+    """The job was superseded before it finished"""
+
+
+def check(cancelled):
+    if cancelled is not None and cancelled():
+        raise Cancelled()
+
+
+def file_key(path):
+    """(real path, mtime_ns, size): changes whenever the file is replaced or edited"""
+    st = os.stat(path)
+    return os.path.realpath(path), st.st_mtime_ns, st.st_size
+
+
+def open_reduced(path, width, height):
+    """Decode path as an 'L' image no smaller than REDUCING_GAP x (width, height) where possible"""
+    want = (int(width * REDUCING_GAP), int(height * REDUCING_GAP))
+    with Image.open(path) as src:
+        if src.format == "JPEG":
+            src.draft("L", want)  # decoder-side downscale; no-op for small sources
+        img = src.convert('L') if src.mode != 'L' else src.copy()  # loaded, detached from the file
+    factor = int(min(img.width / want[0], img.height / want[1]))
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+class ImageCache:
+    """Thread-safe LRU of decoded / converted images (see module docstring)"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (value, nbytes)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key, value, nbytes):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if nbytes > self.max_bytes:
+                return value
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, n) = self._entries.popitem(last=False)
+                self._bytes -= n
+        return value
+
+    def luma(self, path, width, height, resample="lanczos", cancelled=None):
+        """(height, width) uint8 gray plane of path"""
+        key = ("luma", file_key(path), width, height, resample)
+        gray = self._get(key)
+        if gray is None:
+            check(cancelled)
+            img = open_reduced(path, width, height)
+            check(cancelled)
+            gray = resize_gray(img, width, height, resample)
+            gray.setflags(write=False)
+            self._put(key, gray, gray.nbytes)
+        return gray
+
+    def levels(self, path, width, height, dither="none", invert=False, resample="lanczos", cancelled=None):
+        """(height, width) uint8 4-bit levels of path (a new array, safe to modify)"""
+        key = ("levels", file_key(path), width, height, resample, dither)
+        g4 = self._get(key)
+        if g4 is None:
+            gray = self.luma(path, width, height, resample, cancelled)
+            check(cancelled)
+            g4 = quantize(gray, dither)
+            g4.setflags(write=False)
+            self._put(key, g4, g4.nbytes)
+        return (15 - g4).astype(np.uint8) if invert else g4.copy()
+
+    def thumbnail(self, path, size, cancelled=None):
+        """(thumbnail image, source (width, height), source mode) for a preview"""
+        key = ("thumb", file_key(path), tuple(size))
+        entry = self._get(key)
+        if entry is None:
+            check(cancelled)
+            with Image.open(path) as img:
+                src_size, mode = img.size, img.mode
+                img.thumbnail(size, Image.Resampling.LANCZOS)  # draft + reduce internally
+                thumb = img.copy()
+            entry = (thumb, src_size, mode)
+            self._put(key, entry, thumb.width * thumb.height * len(thumb.getbands()))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
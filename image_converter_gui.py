@@ -2,16 +2,25 @@
 """
 ESP32-S2 Image Converter - GUI Version
 Graphical interface for converting PNG/JPG images to ESP32-S2 format
+- Decoded / resized sources are kept in an in-memory LRU (image_cache.py), so repeated
+  previews and exports, and changes to invert or the output format, skip the decode
+- Decoding and conversion run on one background worker; a newer request cancels the
+  one in progress and only the latest result reaches the Tk thread
 """
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import sys
-import threading
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
 
+from header_writer import PACKED_HEIGHT, PACKED_WIDTH, format_comment, write_header
+from image_cache import Cancelled, ImageCache
+from quantizer import DITHER_MODES
+import runtime_image
+
 class ImageConverterGUI:
     def __init__(self, root):
         self.root = root
@@ -22,7 +31,12 @@ class ImageConverterGUI:
         # Configure style
         style = ttk.Style()
         style.theme_use('clam')
-        
+
+        self.cache = ImageCache()
+        self._jobs = ThreadPoolExecutor(max_workers=1)
+        self._job_seq = 0  # a job is cancelled once a newer one is started
+        self._prefetch_path = None
+
         self.setup_ui()
         
     def setup_ui(self):
@@ -85,6 +99,24 @@ class ImageConverterGUI:
         output_info = ttk.Label(settings_frame, text="current_image.h (Fixed filename)", 
                                foreground="green", font=('Arial', 9, 'italic'))
         output_info.grid(row=1, column=1, columnspan=3, sticky=tk.W, padx=(5, 0), pady=(10, 0))
+
+        # Header variants
+        self.header_packed_var = tk.BooleanVar(value=False)
+        self.header_incbin_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Packed 4-bit header (half size)",
+                        variable=self.header_packed_var).grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        ttk.Checkbutton(settings_frame, text="Binary blob (.incbin)",
+                        variable=self.header_incbin_var).grid(row=2, column=2, columnspan=2, sticky=tk.W, pady=(10, 0))
+        self.bin_packed_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(settings_frame, text="Packed runtime .bin (uncheck for legacy 1B/px firmware)",
+                        variable=self.bin_packed_var).grid(row=3, column=0, columnspan=4, sticky=tk.W, pady=(5, 0))
+        ttk.Label(settings_frame, text="Dither:").grid(row=4, column=0, sticky=tk.W, pady=(5, 0))
+        self.dither_var = tk.StringVar(value="none")
+        ttk.Combobox(settings_frame, textvariable=self.dither_var, values=DITHER_MODES, width=16,
+                     state="readonly").grid(row=4, column=1, sticky=tk.W, padx=(5, 0), pady=(5, 0))
+        self.invert_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Invert",
+                        variable=self.invert_var).grid(row=4, column=2, sticky=tk.W, pady=(5, 0))
         
         # Convert button
         convert_btn = ttk.Button(main_frame, text="🚀 Convert Image", 
@@ -149,44 +181,118 @@ class ImageConverterGUI:
             self.preview_image(filename)
             
     def preview_image(self, filepath):
-        """Show image preview and info"""
-        try:
-            img = Image.open(filepath)
-            
-            # Update info
+        """Show image preview and info (thumbnail decoded on the worker)"""
+        def done(entry):
+            thumb, size, mode = entry
             mode_desc = {
                 'RGB': 'RGB Color',
                 'RGBA': 'RGB with Alpha',
                 'L': 'Grayscale',
                 'P': 'Palette'
             }
-            
-            info_text = f"📐 Size: {img.size[0]}x{img.size[1]} | 🎨 Mode: {mode_desc.get(img.mode, img.mode)}"
+            info_text = f"📐 Size: {size[0]}x{size[1]} | 🎨 Mode: {mode_desc.get(mode, mode)}"
             file_size = os.path.getsize(filepath) / 1024  # KB
             info_text += f" | 💾 Size: {file_size:.1f} KB"
-            
             self.info_label.config(text=info_text)
-            
-            # Create thumbnail for preview
-            thumbnail_size = (200, 150)
-            img_thumb = img.copy()
-            img_thumb.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-            
+
             # Convert to PhotoImage for tkinter
             try:
                 import PIL.ImageTk
-                photo = PIL.ImageTk.PhotoImage(img_thumb)
+                photo = PIL.ImageTk.PhotoImage(thumb)
                 self.preview_label.config(image=photo, text="")
                 self.preview_label.image = photo  # Keep a reference
             except ImportError:
                 self.preview_label.config(text=f"Preview: {os.path.basename(filepath)}\n{info_text}")
-                
             self.status_var.set(f"Loaded: {os.path.basename(filepath)}")
-            
-        except Exception as e:
-            self.preview_label.config(text=f"❌ Error loading image:\n{str(e)}")
+            self._prefetch(filepath)
+
+        def failed(e):
+            self.preview_label.config(text=f"❌ Error loading image:\n{str(e)}", image="")
+            self.preview_label.image = None
             self.status_var.set("Error loading image")
-            
+
+        self._run_job(lambda cancelled: self.cache.thumbnail(filepath, (200, 150), cancelled),
+                      done, failed, "Loading...")
+
+    def _prefetch(self, filepath):
+        """Decode + resize the new source at the current size ahead of the first convert/preview"""
+        size = self._read_size(quiet=True)
+        if size is None:
+            return
+        self._prefetch_path = filepath
+        cancelled = lambda: self._prefetch_path != filepath
+        self._jobs.submit(self._warm, filepath, size, cancelled)
+
+    def _warm(self, filepath, size, cancelled):
+        try:
+            self.cache.luma(filepath, size[0], size[1], cancelled=cancelled)
+        except Exception:
+            pass  # the real request reports the error
+
+    def _run_job(self, work, done, failed, status=None):
+        """Run work(cancelled) on the worker; done(result) / failed(exc) run on the Tk thread.
+
+        Starting another job cancels this one: work stops at its next stage and
+        neither callback is called.
+        """
+        self._job_seq += 1
+        seq = self._job_seq
+
+        def cancelled():
+            return seq != self._job_seq
+
+        future = self._jobs.submit(work, cancelled)
+        self.progress.start()
+        if status:
+            self.status_var.set(status)
+
+        def poll():
+            if cancelled():
+                return
+            if not future.done():
+                self.root.after(20, poll)
+                return
+            self.progress.stop()
+            try:
+                result = future.result()
+            except Cancelled:
+                return
+            except Exception as e:
+                failed(e)
+                return
+            done(result)
+
+        self.root.after(20, poll)
+
+    def _read_size(self, quiet=False):
+        """(width, height) from the settings, or None (with an error box unless quiet)"""
+        try:
+            width = int(self.width_var.get())
+            height = int(self.height_var.get())
+            if width <= 0 or height <= 0:
+                raise ValueError("Dimensions must be positive")
+        except ValueError as e:
+            if not quiet:
+                messagebox.showerror("Error", f"Invalid dimensions: {e}")
+            return None
+        return width, height
+
+    def _settings(self):
+        """Conversion settings, read on the Tk thread before a job starts"""
+        return {"dither": self.dither_var.get(), "invert": self.invert_var.get(),
+                "packed": self.header_packed_var.get(), "incbin": self.header_incbin_var.get(),
+                "legacy": not self.bin_packed_var.get()}
+
+    def _source_path(self):
+        filepath = self.file_path_var.get().strip()
+        if not filepath:
+            messagebox.showerror("Error", "Please select an image file first!")
+            return None
+        if not os.path.exists(filepath):
+            messagebox.showerror("Error", f"File not found: {filepath}")
+            return None
+        return filepath
+
     def log(self, message):
         """Add message to log"""
         self.log_text.insert(tk.END, message + "\n")
@@ -195,105 +301,69 @@ class ImageConverterGUI:
         
     def convert_image(self):
         """Convert selected image"""
-        filepath = self.file_path_var.get().strip()
-        
-        if not filepath:
-            messagebox.showerror("Error", "Please select an image file first!")
+        filepath = self._source_path()
+        if filepath is None:
             return
-            
-        if not os.path.exists(filepath):
-            messagebox.showerror("Error", f"File not found: {filepath}")
+        size = self._read_size()
+        if size is None:
             return
-            
-        # Validate dimensions
-        try:
-            width = int(self.width_var.get())
-            height = int(self.height_var.get())
-            
-            if width <= 0 or height <= 0:
-                raise ValueError("Dimensions must be positive")
-                
-        except ValueError as e:
-            messagebox.showerror("Error", f"Invalid dimensions: {e}")
+        width, height = size
+        settings = self._settings()
+        if settings["packed"] and (width, height) != (PACKED_WIDTH, PACKED_HEIGHT):
+            messagebox.showerror("Error", f"Packed 4-bit headers must be {PACKED_WIDTH}x{PACKED_HEIGHT} "
+                                          f"(the firmware copies them straight to the panel)")
             return
-            
-        # Run conversion in a separate thread
-        self.progress.start()
-        convert_btn = None
-        for widget in self.root.winfo_children():
-            if isinstance(widget, ttk.Frame):
-                for child in widget.winfo_children():
-                    if isinstance(child, ttk.Button) and "Convert" in child.cget("text"):
-                        convert_btn = child
-                        break
-                        
-        if convert_btn:
-            convert_btn.config(state='disabled')
-            
-        self.status_var.set("Converting...")
-        
-        def convert_thread():
-            try:
-                self.log(f"\n🔄 Starting conversion...")
-                self.log(f"📁 Input: {os.path.basename(filepath)}")
-                
-                result = self.convert_png_to_fixed_header(filepath, width, height)
-                
-                self.log(f"✅ Conversion completed successfully!")
-                self.log(f"📄 Output: {result['output_path']}")
-                self.log(f"📐 Final size: {result['width']}x{result['height']}")
-                self.log(f"💾 Data size: {result['size']} bytes")
-                self.log(f"🏷️  Variables: {result['var_prefix']}_data, {result['var_prefix']}_width, {result['var_prefix']}_height")
-                self.log("")
-                self.log("🎉 Ready to compile! Run 'pio run' to build your ESP32-S2 project.")
-                
-                self.status_var.set("Conversion completed!")
-                
-                messagebox.showinfo("Success", 
-                    f"Image converted successfully!\n\n"
-                    f"Output: current_image.h\n"
-                    f"Size: {result['width']}x{result['height']}\n"
-                    f"Data: {result['size']} bytes\n\n"
-                    f"You can now compile your ESP32-S2 project.")
-                
-            except Exception as e:
-                self.log(f"❌ Error: {str(e)}")
-                self.status_var.set("Conversion failed!")
-                messagebox.showerror("Error", f"Conversion failed:\n{str(e)}")
-                
-            finally:
-                self.progress.stop()
-                if convert_btn:
-                    convert_btn.config(state='normal')
-                    
-        threading.Thread(target=convert_thread, daemon=True).start()
+        lines = []
+
+        def work(cancelled):
+            return self.convert_png_to_fixed_header(filepath, width, height, settings, cancelled, lines.append)
+
+        def done(result):
+            for line in lines:
+                self.log(line)
+            self.log(f"✅ Conversion completed successfully!")
+            self.log(f"📄 Output: {result['output_path']}")
+            self.log(f"📐 Final size: {result['width']}x{result['height']}")
+            self.log(f"💾 Data size: {result['size']} bytes")
+            self.log(f"🏷️  Variables: {result['var_prefix']}_data, {result['var_prefix']}_width, {result['var_prefix']}_height")
+            self.log("")
+            self.log("🎉 Ready to compile! Run 'pio run' to build your ESP32-S2 project.")
+            self.status_var.set("Conversion completed!")
+            messagebox.showinfo("Success", 
+                f"Image converted successfully!\n\n"
+                f"Output: current_image.h\n"
+                f"Size: {result['width']}x{result['height']}\n"
+                f"Data: {result['size']} bytes\n\n"
+                f"You can now compile your ESP32-S2 project.")
+
+        def failed(e):
+            for line in lines:
+                self.log(line)
+            self.log(f"❌ Error: {str(e)}")
+            self.status_var.set("Conversion failed!")
+            messagebox.showerror("Error", f"Conversion failed:\n{str(e)}")
+
+        self.log(f"\n🔄 Starting conversion...")
+        self.log(f"📁 Input: {os.path.basename(filepath)}")
+        self._run_job(work, done, failed, "Converting...")
 
     def preview_converted(self):
         """Preview the 4-bit converted grayscale as 8-bit image in a popup window"""
-        filepath = self.file_path_var.get().strip()
-        if not filepath:
-            messagebox.showerror("Error", "Please select an image file first!")
+        filepath = self._source_path()
+        if filepath is None:
             return
-        try:
-            width = int(self.width_var.get())
-            height = int(self.height_var.get())
-            if width <= 0 or height <= 0:
-                raise ValueError("Dimensions must be positive")
-        except Exception as e:
-            messagebox.showerror("Error", f"Invalid width/height: {e}")
+        size = self._read_size()
+        if size is None:
             return
+        width, height = size
+        settings = self._settings()
 
-        try:
-            img = Image.open(filepath)
-            if img.mode != 'L':
-                img = img.convert('L')
-            img = img.resize((width, height), Image.Resampling.LANCZOS)
-            arr = np.array(img)
-            arr4 = np.round(arr / 17.0).astype(np.uint8)
-            arr4 = np.clip(arr4, 0, 15)
-            arr8 = (arr4 * 17).astype(np.uint8)
-            preview = Image.fromarray(arr8, mode='L')
+        def work(cancelled):
+            arr4 = self.cache.levels(filepath, width, height, settings["dither"], settings["invert"],
+                                     cancelled=cancelled)
+            return Image.fromarray((arr4 * 17).astype(np.uint8), mode='L')
 
+        def done(preview):
             # show in a popup window
             win = tk.Toplevel(self.root)
             win.title("4-bit Converted Preview")
@@ -309,115 +379,93 @@ class ImageConverterGUI:
                 tmp_path = os.path.join(os.getcwd(), "preview_converted.png")
                 preview.save(tmp_path)
                 ttk.Label(win, text=f"Preview saved to {tmp_path}").pack()
-        except Exception as e:
-            messagebox.showerror("Error", f"Preview failed: {e}")
+            self.status_var.set("Preview ready")
+
+        self._run_job(work, done, lambda e: messagebox.showerror("Error", f"Preview failed: {e}"),
+                      "Rendering preview...")
 
     def export_bin(self):
-        """Export 1B/px grayscale .bin for runtime upload (low 4 bits used)"""
-        filepath = self.file_path_var.get().strip()
-        if not filepath:
-            messagebox.showerror("Error", "Please select an image file first!")
+        """Export runtime .bin for upload: packed 4-bit v1 (header + CRC) or legacy 1B/px"""
+        filepath = self._source_path()
+        if filepath is None:
             return
-        try:
-            width = int(self.width_var.get())
-            height = int(self.height_var.get())
-            if width <= 0 or height <= 0:
-                raise ValueError("Dimensions must be positive")
-        except Exception as e:
-            messagebox.showerror("Error", f"Invalid width/height: {e}")
+        size = self._read_size()
+        if size is None:
             return
+        width, height = size
+        settings = self._settings()
+        out_path = filedialog.asksaveasfilename(
+            title="Save runtime image",
+            defaultextension=".bin",
+            filetypes=[("Binary", "*.bin"), ("All files", "*.*")],
+            initialfile="current_image.bin"
+        )
+        if not out_path:
+            return
+        legacy = settings["legacy"]
+        kind = "legacy 1B/px" if legacy else "packed 4-bit v1"
 
-        try:
-            img = Image.open(filepath)
-            if img.mode != 'L':
-                img = img.convert('L')
-            img = img.resize((width, height), Image.Resampling.LANCZOS)
-            arr = np.array(img)
-            arr4 = np.round(arr / 17.0).astype(np.uint8)
-            arr4 = np.clip(arr4, 0, 15)
-            # store 1 byte per pixel with low 4 bits used
-            arr1 = arr4.astype(np.uint8)
-            out_path = filedialog.asksaveasfilename(
-                title="Save runtime image",
-                defaultextension=".bin",
-                filetypes=[("Binary", "*.bin"), ("All files", "*.*")],
-                initialfile="current_image.bin"
-            )
-            if not out_path:
-                return
-            with open(out_path, 'wb') as f:
-                f.write(arr1.tobytes())
-            self.log(f"✅ Exported runtime bin: {out_path} ({arr1.size} bytes)")
-            messagebox.showinfo("Success", f"Exported runtime .bin:\n{out_path}\n{width}x{height} ({arr1.size} bytes)")
-        except Exception as e:
-            messagebox.showerror("Error", f"Export failed: {e}")
-        
-    def convert_png_to_fixed_header(self, png_path, target_width=640, target_height=480):
+        def work(cancelled):
+            arr4 = self.cache.levels(filepath, width, height, settings["dither"], settings["invert"],
+                                     cancelled=cancelled)
+            return runtime_image.write(out_path, arr4, legacy=legacy)
+
+        def done(nbytes):
+            self.log(f"✅ Exported runtime bin ({kind}): {out_path} ({nbytes} bytes)")
+            self.status_var.set("Export completed!")
+            messagebox.showinfo("Success", f"Exported runtime .bin ({kind}):\n{out_path}\n{width}x{height} ({nbytes} bytes)")
+
+        self._run_job(work, done, lambda e: messagebox.showerror("Error", f"Export failed: {e}"), "Exporting...")
+
+    def convert_png_to_fixed_header(self, png_path, target_width=640, target_height=480, settings=None,
+                                    cancelled=None, log=None):
         """Convert PNG image to fixed C++ header file current_image.h"""
+        settings = settings or self._settings()
+        log = log or self.log
         
         # Fixed output filename and variable names
         output_path = "current_image.h"
         var_prefix = "current_image"
         
-        # Open and convert image
-        img = Image.open(png_path)
-        self.log(f"📏 Original size: {img.size}")
-        self.log(f"🎨 Original mode: {img.mode}")
-        
-        # Convert to grayscale if not already
-        if img.mode != 'L':
-            img = img.convert('L')
-            self.log("✓ Converted to grayscale")
-        
-        # Resize to target dimensions
-        img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-        self.log(f"📐 Resized to: {img.size}")
-        
-        # Convert to numpy array
-        img_array = np.array(img)
-        
-        # Convert 8-bit grayscale (0-255) to 4-bit grayscale (0-15)
-        img_4bit = np.round(img_array / 17.0).astype(np.uint8)
-        img_4bit = np.clip(img_4bit, 0, 15)
-        
-        self.log(f"🔢 4-bit range: {img_4bit.min()} - {img_4bit.max()}")
-        self.log(f"⚫ Non-zero pixels: {np.count_nonzero(img_4bit)}")
-        
-        # Flatten the array
-        img_flat = img_4bit.flatten()
-        actual_size = len(img_flat)
-        
-        # Generate header file
+        # Header only: the pixels come from the decode cache
+        with Image.open(png_path) as img:
+            log(f"📏 Original size: {img.size}")
+            log(f"🎨 Original mode: {img.mode}")
+        hits = self.cache.hits
+        
+        # Grayscale, resize (cached separable resampling plan) and 8-bit -> 4-bit
+        dither = settings["dither"]
+        img_4bit = self.cache.levels(png_path, target_width, target_height, dither, settings["invert"],
+                                     cancelled=cancelled)
+        if self.cache.hits > hits:
+            log("✓ Reused cached decode")
+        log(f"📐 Resized to: {(target_width, target_height)}")
+        if dither != "none":
+            log(f"✓ Dithered ({dither})")
+        if settings["invert"]:
+            log("✓ Inverted")
+        
+        log(f"🔢 4-bit range: {img_4bit.min()} - {img_4bit.max()}")
+        log(f"⚫ Non-zero pixels: {np.count_nonzero(img_4bit)}")
+        
+        # Generate header file (streamed, vectorized hex formatting)
         original_filename = os.path.basename(png_path)
-        header_content = f"""// Current display image - converted from {original_filename}
-// Generated by ESP32-S2 Image Converter GUI
-// Original dimensions: {img.size[0]}x{img.size[1]} 
-// Target dimensions: {target_width}x{target_height}
-// Format: 1 byte per pixel, only low 4 bits used (0-15)
-// Compatible with packPngScaledRowsToPanel function
-
-#ifndef CURRENT_IMAGE_H
-#define CURRENT_IMAGE_H
-
-const u16 {var_prefix}_width = {target_width};
-const u16 {var_prefix}_height = {target_height};
-const u32 {var_prefix}_size = {actual_size};
-
-const u8 {var_prefix}_data[{actual_size}] = {{
-"""
-        
-        # Add data in rows of 16 bytes
-        for i in range(0, len(img_flat), 16):
-            row = img_flat[i:i+16]
-            hex_values = [f"0x{b:02X}" for b in row]
-            header_content += "  " + ", ".join(hex_values) + ",\n"
-        
-        # Remove the last comma and add closing
-        header_content = header_content.rstrip(',\n') + '\n};\n\n#endif // CURRENT_IMAGE_H\n'
-        
-        # Write header file
-        with open(output_path, 'w') as f:
-            f.write(header_content)
+        packed = settings["packed"]
+        incbin = settings["incbin"]
+        comments = [
+            f"Current display image - converted from {original_filename}",
+            "Generated by ESP32-S2 Image Converter GUI",
+            f"Original dimensions: {target_width}x{target_height} ",
+            f"Target dimensions: {target_width}x{target_height}",
+            format_comment(packed),
+        ]
+        if not packed:
+            comments.append("Compatible with packPngScaledRowsToPanel function")
+        result = write_header(output_path, img_4bit, var_prefix=var_prefix,
+                              packed=packed, incbin=incbin, comments=comments)
+        actual_size = result['size']
+        if result['blob_path']:
+            log(f"📦 Binary blob: {result['blob_path']} (.incbin in {result['asm_path']})")
         
         return {
             'output_path': output_path,
@@ -428,6 +476,11 @@ const u8 {var_prefix}_data[{actual_size}] = {{
             'size': actual_size
         }
 
+    def close(self):
+        self._job_seq += 1  # cancel the running job
+        self._prefetch_path = None
+        self._jobs.shutdown(wait=False, cancel_futures=True)
+
 def main():
     # Check for required dependencies
     try:
@@ -446,6 +499,8 @@ def main():
         root.mainloop()
     except KeyboardInterrupt:
         print("\nGUI closed by user")
+    finally:
+        app.close()
 
 if __name__ == "__main__":
     main()
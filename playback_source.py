@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Video / image-sequence playback source for the streamer (demo loops, reproducible load tests)
+- Decodes a video file (OpenCV), an animated GIF / still image, a directory or a glob of
+  images (PIL) in a background worker, converts each frame to packed 4-bit (cached
+  resampler plan, quantizer, FramePacker) and keeps them in a bounded ring buffer
+- next_frame() paces playback at the source frame rate; frames whose slot has already
+  passed are dropped, and a decoder underrun stalls the clock instead of skipping ahead
+- Short loops (up to cache_frames) are converted once and replayed from memory; with a
+  FrameCache the converted clip is also kept on disk and memory-mapped on the next run
+- StreamEngine(config, source=PlaybackSource(...)) sends them through deliver(), the same
+  delta/transport path as live capture
+"""
+
+import collections
+import glob
+import os
+import threading
+import time
+
+from PIL import Image, ImageSequence
+
+try:
+    import cv2  # video decoding
+except ImportError:
+    cv2 = None
+
+from frame_cache import content_hash, make_key
+from frame_packer import PANEL_HEIGHT, PANEL_WIDTH, FramePacker
+from quantizer import quantize
+from resampler import resize_gray
+
+VIDEO_EXTS = (".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm", ".mpg", ".mpeg")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".gif", ".webp")
+DEFAULT_FPS = 10.0
+
+
+def _image_paths(source):
+    if os.path.isdir(source):
+        names = sorted(os.listdir(source))
+        return [os.path.join(source, n) for n in names if n.lower().endswith(IMAGE_EXTS)]
+    return sorted(p for p in glob.glob(source) if p.lower().endswith(IMAGE_EXTS))
+
+
+def source_files(source):
+    """Files whose contents define the source (for the frame cache key)"""
+    if os.path.isfile(source):
+        return [source]
+    return _image_paths(source)
+
+
+def open_frames(source):
+    """(frame iterator factory, source fps or None); frames are PIL images or (h, w) gray arrays"""
+    if os.path.isfile(source) and source.lower().endswith(VIDEO_EXTS):
+        if cv2 is None:
+            raise RuntimeError("opencv-python not installed: pip install opencv-python")
+        cap = cv2.VideoCapture(source)
+        if not cap.isOpened():
+            raise RuntimeError(f"cannot open video {source}")
+        fps = cap.get(cv2.CAP_PROP_FPS) or None
+        cap.release()
+
+        def frames():
+            cap = cv2.VideoCapture(source)
+            try:
+                while True:
+                    ok, bgr = cap.read()
+                    if not ok:
+                        return
+                    yield cv2.cvtColor(bgr, cv2.COLOR_BGR2GRAY)
+            finally:
+                cap.release()
+        return frames, fps
+
+    if os.path.isfile(source):
+        with Image.open(source) as img:
+            n = getattr(img, "n_frames", 1)
+            duration = img.info.get("duration") if n > 1 else None
+
+        def frames():
+            with Image.open(source) as img:
+                for frame in ImageSequence.Iterator(img):
+                    yield frame.convert('L')
+        return frames, (1000.0 / duration if duration else None)
+
+    paths = _image_paths(source)
+    if not paths:
+        raise RuntimeError(f"no video or images found for {source!r}")
+
+    def frames():
+        for path in paths:
+            with Image.open(path) as img:
+                yield img.convert('L')
+    return frames, None
+
+
+class PlaybackSource:
+    """Background decode + 4-bit conversion into a ring buffer, paced by next_frame()"""
+
+    def __init__(self, source, fps=None, loop=True, invert=False, dither="none", resample="lanczos",
+                 buffer_frames=32, cache_frames=256, metrics=None, log=None, cache=None):
+        self.source = source
+        self._frames, source_fps = open_frames(source)
+        self.fps = fps or source_fps or DEFAULT_FPS
+        self.loop = loop
+        self.invert = invert
+        self.dither = dither
+        self.resample = resample
+        self.buffer_frames = max(2, buffer_frames)
+        self.cache_frames = cache_frames
+        self.metrics = metrics
+        self._log = log or (lambda msg: None)
+        self._packer = FramePacker()
+        self.cache = cache  # FrameCache: converted clips persist across runs
+
+        self._cond = threading.Condition()
+        self._buf = collections.deque()  # (index, packed)
+        self._thread = None
+        self._running = False
+        self.finished = False  # decoder reached the end (loop=False) and the buffer is drained
+        self._eof = False
+        self._clock = None  # monotonic time of frame index 0
+        self.decoded = 0
+        self.dropped = 0
+        self.underruns = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._eof = self.finished = False
+        self._clock = None
+        self._buf.clear()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _record(self, stage, seconds):
+        if self.metrics is not None:
+            self.metrics.record(stage, seconds)
+
+    def convert(self, frame):
+        """PIL image or gray array -> (480, 320) packed 4-bit frame"""
+        t0 = time.perf_counter()
+        gray = resize_gray(frame, PANEL_WIDTH, PANEL_HEIGHT, self.resample)
+        g4 = quantize(gray, self.dither, self.invert)
+        t1 = time.perf_counter()
+        packed = self._packer.pack(g4)
+        self._record("quantize", t1 - t0)
+        self._record("pack", time.perf_counter() - t1)
+        return packed
+
+    def _put(self, index, packed):
+        """Block while the ring buffer is full; False once stopped"""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._running or len(self._buf) < self.buffer_frames)
+            if not self._running:
+                return False
+            self._buf.append((index, packed))
+            self._cond.notify_all()
+            return True
+
+    def _cache_key(self):
+        return make_key(content_hash(source_files(self.source)), width=PANEL_WIDTH, height=PANEL_HEIGHT,
+                        invert=bool(self.invert), dither=self.dither, resample=self.resample, packing="4bpp")
+
+    def _replay(self, frames, index):
+        """Feed already converted frames (list or cache memmap), looping if enabled"""
+        while self._running:
+            for packed in frames:
+                if not self._put(index, packed):
+                    return
+                index += 1
+            if not self.loop:
+                return
+
+    def _decode_loop(self):
+        index = 0
+        replay = []
+        writer = None
+        try:
+            if self.cache is not None:
+                key = self._cache_key()
+                frames = self.cache.get(key)
+                if frames is not None:
+                    self._log(f"Playback: {len(frames)} frames from cache")
+                    self._replay(frames, index)
+                    return
+                writer = self.cache.writer(key, source=os.path.basename(self.source))
+            while self._running:
+                t0 = time.perf_counter()
+                for frame in self._frames():
+                    packed = self.convert(frame)
+                    self._record("capture", time.perf_counter() - t0)
+                    self.decoded += 1
+                    if writer is not None and not writer.append(packed):
+                        writer = None  # larger than the whole cache
+                    if replay is not None:
+                        replay.append(packed)
+                        if len(replay) > self.cache_frames:
+                            replay = None
+                    if not self._put(index, packed):
+                        return
+                    index += 1
+                    t0 = time.perf_counter()
+                if writer is not None:
+                    cached = writer.commit()
+                    writer = None
+                    if cached is not None:
+                        replay = cached
+                if not self.loop or index == 0:
+                    break
+                if replay is not None:
+                    # the whole clip is converted: replay it instead of decoding again
+                    self._log(f"Playback: looping {len(replay)} converted frames")
+                    self._replay(replay, index)
+                    return
+        except Exception as e:
+            self._log(f"Playback decode error: {e}")
+        finally:
+            if writer is not None:
+                writer.abort()
+            with self._cond:
+                self._eof = True
+                self._cond.notify_all()
+
+    def next_frame(self, timeout=0.5):
+        """Packed frame due now (waits until its presentation time), or None on timeout / end.
+
+        Frames whose slot passed while the caller was busy are dropped; if the decoder
+        falls behind, the clock is moved so playback stalls rather than skips.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._buf:
+                    break
+                if self._eof or not self._running:
+                    self.finished = self._eof
+                    return None
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return None
+                self._cond.wait(left)
+                if self._buf and self._clock is not None:
+                    # underrun: the decoder was late, restart the clock at this frame
+                    now = time.monotonic()
+                    index = self._buf[0][0]
+                    if now > self._clock + (index + 1) / self.fps:
+                        self.underruns += 1
+                        self._clock = now - index / self.fps
+            now = time.monotonic()
+            if self._clock is None:
+                self._clock = now - self._buf[0][0] / self.fps
+            due = int((now - self._clock) * self.fps)
+            while len(self._buf) > 1 and self._buf[1][0] <= due:
+                self._buf.popleft()
+                self.dropped += 1
+            index, packed = self._buf[0]
+            at = self._clock + index / self.fps
+            if at - now > deadline - now:
+                return None
+            self._buf.popleft()
+            self._cond.notify_all()
+        delay = at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return packed
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+8-bit gray -> 4-bit level quantizer shared by the converters and the streamer
+- none        round(v / 17), one 256-entry LUT lookup
+- bayer       8x8 ordered dither
+- bluenoise   64x64 blue-noise threshold texture (void-and-cluster; shipped precomputed
+              as BLUE_NOISE_64, _blue_noise() regenerates it)
+- floyd-steinberg  error diffusion, offline only (numba kernel if installed, else the
+              left-to-right pass per row in Python with the next-row spread vectorized)
+Ordered modes are one gather from a (64 thresholds x 256 values) table (~1-2 ms per
+640x480 frame) and position-stable, so unchanged screen areas stay unchanged for
+delta streaming.
+"""
+
+import functools
+
+import numpy as np
+
+from resampler import resize_gray
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+LIVE_MODES = ("none", "bayer", "bluenoise")
+DITHER_MODES = LIVE_MODES + ("floyd-steinberg",)
+THRESHOLD_LEVELS = 64
+
+# 8-bit gray -> 4-bit level, same rounding as np.round(v / 17.0)
+LUT_4BIT = np.clip(np.round(np.arange(256) / 17.0), 0, 15).astype(np.uint8)
+LUT_4BIT_INVERT = (15 - LUT_4BIT).astype(np.uint8)
+
+# _blue_noise() * 64 // 4096: one row per string, one of 64 levels per character
+# (BLUE_NOISE_ALPHABET), so the ~0.25 s generation never lands in a live frame
+BLUE_NOISE_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz-_"
+BLUE_NOISE_64 = (
+    "f2kbI_YGer3v7zfWkQF0Q6l9VL1GPscy5NH9KbE7_MvGiLqFRd-OUJAu2JPuhT8z",
+    "RFyN6fBu5aQlTBNq4tanvbNryCgpZ7hEWtarmvShX0q6Ty1Zl8Dr7xcShrXD1nMt",
+    "Wp9XmRoNU-DKZtGcAJi8ICh2Rav5kLTo9k2RC4LoHQlcEnBOxKYejGp5Em7e-Gd4",
+    "iJdtEy3i9dp0fn3wSzWNp-WJm7OWDz0wOF_dXyf9xa9-MfXrh2uQ3WN_ZLxSNZmC",
+    "_5O1VKbFwIPx8VPgmE1fT4etD_dJneHbWhK7lGTq3iIU2wJ6GVnEzl8eR0jBr3vS",
+    "Zrgwj8qWl5YhG_BK7ZrwFmANVh1s9Rr8t3wPr1bNDRunb9pR_fM9cKuDovGXiJ9M",
+    "G7SHaN_2RsBnNXqbyRL5aQx2qHSxX4kNDnVAhJvk_d5CPkVcC5tiT2Yh5Mc6yVfn",
+    "cyBp5mDcLfU6t1j5GojCqJjdY7jEMg-aSfHbzX5AVJrYzG1wJpYGyqQHzUrmQCw0",
+    "UiLXvRg9uF-aIeQvV9eX_6TBzPvcpBI1v7q2REoPh2lL7erNkS0O7dBlb7EL2arN",
+    "o4te1HxYo0Ok8yCKhs1GNguFmJ6S3uVlKhOwjLtayESuiTAa6f-ojKw2Pitf-kIA",
+    "_GP9VlM4ShBqTYm3aOyTm3XQ0hsZkNd9yXCZ8d0I8oc3H_oFuIAaETsX_IWAS6Xe",
+    "RarizCrfIzbL3sN-FpAZwDqfxTCI7xEpR3sIn-UkOWvCZO4WmOVw3hN6Do0dvOm3",
+    "hD5JbR7Wt6UwGg7dS5kK7bI7Lbo_Rh1aHkfT4NCwf4MmgsKey1iJp9ZmfRwLFqBu",
+    "MxWp2vFlODojAWlIwVfrPj-Wt92eLWtO-6wBrhY6rFz8R0kCS8tcQyGuK8Vk5fWH",
+    "odAkMga-1dQ2-Lt2oBH0uT2DhNmFv5j9dLXQcGuLTbjWvG-brHXD4kU2cqCzZQy0",
+    "T4Q-EU9KisIYeSDaPc_XAeKpazTYBqIUoDm6z1jBo2KDeOW6Mho_NeBzNXg2Jr9j",
+    "xJnZ6uqRCWy8q5iy7kMqFmxQ6H4wgQbx1uaJpOVc_Ptn3qAlx3T7aqIn5wHmOcEY",
+    "8sFfOj3bw4GmOuJWGt3Tc4YBkrbL0l7FRhAUgEv5Fg7YRxKaQEfLu0WhQ9Tu6_iM",
+    "Uc1xBIXnLgScCU0ogRCjyPIvUfEtW_NrYIy3s9ZmLUyCiFf1ouYlASwDbrjDXR2q",
+    "CPkWrS_F8rv3j_eN8zbK8nh1M7RiBHej6nOdLjRx0qcN5rT_BJ4zFiJ4-L0epGuf",
+    "n-AL6h0dQWIYL9rFXm1qVEtb-lx5pU2yCWtF-4IWh9HlwX7dOkUcNsenTZFy8aK4",
+    "YIfvbpMxk5BxmRa4vIPwf4RJAGYPKubQKh0bUmtCOza2QJpFWt8p2X7OAviOVmwS",
+    "7s3UG8YCobsg1HyhSk6aMzXpfs3dj8Flv9pCP7dY3oTsgBjx0fERwDzbq3Jo2AgF",
+    "laNizQtI2NSEVqM8cCpG8lD0NUvD-Ws5SdMwirFxiJD7-Z4SLwnKiUIgEWd_ScMz",
+    "UApD1mfVyh8-d5YmK_VtgQvZj7mR1MeIY_GW2JT5RueWHNsdAY5d9m1sQl8DtHp3",
+    "eJxWcK5BqZKnPuCx0Q4bK5nH_ELbqiAo1j7nbzfo9Nm0piEymTG_NavL4xNjX6iP",
+    "vk5Pr-SlG6v1HhSGesjDxSd3Wgw5HVzQuCRt9ODX_bCyT8Q2Jir3oSCeVpb0zLsC",
+    "1SGg8EZtPeUlX9slWBMpX9qMtATlu7EdLYfHUi1kI4gJZrgWu8QcH7k-GAJSf9Ua",
+    "_pZukN0g9yLC_c2O6-a3GziDbO0cLZkq5zn4xpLvVsRu3G-MaEgzXuNZ6hwmEunI",
+    "8ND3UpxJVk3qQKwYpISlePV6m-iCyR2JVAOZCcR8EnM9kcB4ow0LAh1qUsO2ZQ4h",
+    "WmyeIAc7rEaf7nFhBdx8t1JwFTIr8oexsGjuJ3zga1dxUOthPHUnsSFeL9cH-jKc",
+    "EQ6XvQlYOzSIuW4St1OFYjcqY2fPXEN6Zg0SqWkIrUEp6ImV8dk6aJzl4xnV7pAx",
+    "0ksLh4_G1m5iBdzMmVhoMv6PBnv6i-TmBQ_9fF6PA_KiZz1Fp_MDw2VBYQgDNeRt",
+    "gZG8qDTfubKwOlGa6H-5BTF_eNGbs1IdwLnXMynvcl4RCeTuZ3SreOhuoG0wr4XJ",
+    "AT-cOXnJAVr7U0rAveQZqgXl5Vy9LVq8Y3Et5ZCU2MYxq7KgAIiW9oF6L_ZSiFzm",
+    "qN4kt0w7jPEc_hMSkDs0Ix3KtCkQnDguRleJkQhIfo9GiO-mPsx4K-aTeAkJ8bO2",
+    "EwVBHeMaoy2nIBZy2WMmbQAoag1Xza4NC-VAx3t7zRubU3EX0cCZkP1smP3vpVud",
+    "XKgnR-CU4HXgQu5nJi8-DjuTFNvH7Kwoc1PoLcnOZE0KntdvMlSGv9hIDyXdDK6j",
+    "s7z2Z7isdvL9pWFcPteT6Ld2-8lbsfU9Hit6YFUBrel_C6RH8z5eoUxY5qM7n-SC",
+    "NcGOupIPASj-3MjzC4HwYrGWnfUBQ0kOxWDfzj1xL5VPgYkqfXsN3ELdSgFUf3Zl",
+    "0pUjDW3xl0ZDew8UqZoN1gyBPI4ynF_Z5rMS9JoXhFw9JyE1QCJjYtn0-AlwNqIx",
+    "hBy4fLcTGrJnPYHg0ReCmQ6piwbLXhKBnc2ltcP8uRod3sNaxo7_RBhHOra1Ec9R",
+    "HaPl9_o7ezU9t2mNtGz7vVJZ0Eq8t3UuQE-VG3yEb1MXmTf6lUdFb4VvX6JTj_Ws",
+    "5oKtYFQjBO5bjD_bAiXKjEe_OWhRDdl7gLi8angUlsC-G8zJBM0qkyNCkdyp8O3f",
+    "zVD1Tr3wXpgxJQV6wS4sa2n8rH5nzOHwY0qQvMAJ6Yi4cPoXuiwPI7fq2QBfIukL",
+    "AivbiKbEM1GT4qfIoMlAPwTLixcKY9rSDyaF5W_pPxKSvj1FR5ZDWtZK_HmX0ZDS",
+    "s6QGyAmsd-mZuBk1ZD-cHqCZ2UBv1ib4kNAltd1hFc9qDLZsfp9-l2R9iU5sPznd",
+    "XKfn3NR6UAP7dNzSse2Uj5dzFoOlGQ_KdsUfJRCYs5kVg6_ANJcTGewFpbxLf8H3",
+    "p_BUsZzgIktKoEX8JPuExNnJfu4drWCo8H1-7oxKSzN0uQkUx2js6MnT1N9FkTwO",
+    "j1aH7kE0vZ3Vx4gvm6hY8S0W9RYI8x2YhwWOZFj2eBpYEdI4nXEOyiBazftY2oaD",
+    "SJtgwLVnQCfGjQLaGVqIsc_hrEzgSkNuREpl4vOWoHgLy9raCQqa1VKr5ImQ-M9f",
+    "6mWAPd5xKp-6rBz0tBO3iBGP4lM0pFeJ3b8KgcA_7Qv5UiMwe-7Igv7jQWC4cHry",
+    "MEz2qGiY8bSKWcmTje-aMulYJtaBvX9qk_SrDTIralDbn1SF3MjtRDY_FovhUl0X",
+    "vcRjZ_BrHl1hwF4N8HSm7V1ye6UjP5zTCMe0ym5hM1T-HtZqlVAd4mNe0a8KxDPi",
+    "H3pJ7MT4PyDp8PupYw2ExdQApE-IclLgZ6vGZOuVFsg7PBg6HsOyWIrATsOe6pb9",
+    "tfCVvgnuZfUMagUBiLrgKqGiMTn2ArG2smVLjBd4yYJmaxLTzb0Fo7wgHyCmYI_S",
+    "WMyk0EbJA2tH-0Jx4bT8X4-b3veOyVRxDQ9p2-IoOAu4Vp2k9hRudPY2MjV3uO2m",
+    "5q8aPs7SziY6ojXnQF_kNnBWk8DZh6kbJhYufRa8kcRjBGduJX5jKCl-b7qRFjeD",
+    "JdTH-fWmDNrSAOE8fp1CeuRIxPnHtLBq1z5FNCrUx0H_MsWQDp_8Vq5TEvKcz9Yy",
+    "hu3nAL2xd5FfwbqzZKvVH6i0ds5U1c_WPocTyj3LEqYe3l7x1eMZwGhsPgAo4UrP",
+    "BXMivUpHQtkKV5M3TAiPyZqMEXhyoRF7hHAm7XvbhP9uTgIamSGl2dK8a0xXLlG0",
+    "o-FZ5EbiAZ1_9sglHsc3l9T_mAJOCfvMtZvMdHAo5yWKDsPBz6tBPrT-nIRiCdwS",
+    "b6PwgOt6zToOdERwa6MqDKg3Qw6bl2Xk3DS0pzOTIk2n-4kVKhVbyE4jCVp4_O5j",
+    "KsUBp0SlLChHXn1KB_gVyYtGcjsU-AIRoe-iV4jsaCeQY9cv4pH0ioYNey9aHqYD",
+)
+
+
+def _bayer(n):
+    m = np.zeros((1, 1), dtype=np.int64)
+    while m.shape[0] < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+
+@functools.lru_cache(maxsize=None)
+def _threshold_table(invert):
+    """(THRESHOLD_LEVELS * 256,) levels: floor(v / 17 + t) for t = (k + 0.5) / THRESHOLD_LEVELS"""
+    t = (np.arange(THRESHOLD_LEVELS) + 0.5) / THRESHOLD_LEVELS
+    v = np.arange(256) / 17.0
+    table = np.clip(np.floor(v[None, :] + t[:, None]), 0, 15).astype(np.uint8)
+    if invert:
+        table = 15 - table
+    return table.reshape(-1)
+
+
+def _blue_noise(size=64, sigma=1.5, seed=0):
+    """Void-and-cluster threshold ranks (0..size*size-1) on a torus"""
+    n = size * size
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma * sigma)).reshape(-1)
+    rows = np.arange(n) // size
+    cols = np.arange(n) % size
+
+    def shifted(i):
+        # kernel centred on pixel i (toroidal)
+        return np.roll(np.roll(kernel.reshape(size, size), rows[i], 0), cols[i], 1).reshape(-1)
+
+    rng = np.random.default_rng(seed)
+    ones = np.zeros(n, dtype=bool)
+    ones[rng.choice(n, n // 10, replace=False)] = True
+    energy = np.zeros(n)
+    for i in np.flatnonzero(ones):
+        energy += shifted(i)
+    # relax the initial pattern: move the tightest cluster into the largest void
+    for _ in range(n):
+        cluster = np.flatnonzero(ones)[np.argmax(energy[ones])]
+        ones[cluster] = False
+        energy -= shifted(cluster)
+        void = np.flatnonzero(~ones)[np.argmin(energy[~ones])]
+        ones[void] = True
+        energy += shifted(void)
+        if void == cluster:
+            break
+
+    rank = np.zeros(n, dtype=np.int64)
+    initial, initial_energy = ones.copy(), energy.copy()
+    # phase 1: remove clusters from the initial pattern, highest ranks first
+    for r in range(int(ones.sum()) - 1, -1, -1):
+        cluster = np.flatnonzero(ones)[np.argmax(energy[ones])]
+        ones[cluster] = False
+        energy -= shifted(cluster)
+        rank[cluster] = r
+    # phase 2: fill voids until the texture is full
+    ones, energy = initial, initial_energy
+    for r in range(int(ones.sum()), n):
+        void = np.flatnonzero(~ones)[np.argmin(energy[~ones])]
+        ones[void] = True
+        energy += shifted(void)
+        rank[void] = r
+    return rank.reshape(size, size)
+
+
+@functools.lru_cache(maxsize=None)
+def _texture(mode):
+    """Threshold index texture (values 0..THRESHOLD_LEVELS-1) for an ordered mode"""
+    if mode == "bayer":
+        return _bayer(8) * THRESHOLD_LEVELS // 64
+    if mode == "bluenoise":
+        lut = np.zeros(256, dtype=np.int64)
+        lut[np.frombuffer(BLUE_NOISE_ALPHABET.encode(), dtype=np.uint8)] = np.arange(64)
+        levels = lut[np.frombuffer("".join(BLUE_NOISE_64).encode(), dtype=np.uint8)].reshape(64, 64)
+        return levels * THRESHOLD_LEVELS // 64
+    raise ValueError(f"unknown ordered dither mode {mode!r}")
+
+
+@functools.lru_cache(maxsize=8)
+def _offsets(mode, height, width):
+    """Per-pixel table row offsets (threshold index * 256) for a frame size"""
+    tex = _texture(mode)
+    th, tw = tex.shape
+    tiled = np.tile(tex, (-(-height // th), -(-width // tw)))[:height, :width]
+    return (tiled * 256).astype(np.intp)
+
+
+def quantize(gray, mode="none", invert=False, out=None, rows=None, height=None):
+    """(h, w) gray 0..255 (uint8/uint16) -> uint8 levels 0..15.
+
+    rows: absolute frame rows of `gray` when it is a subset of a larger frame, so
+    ordered dither thresholds line up with a full-frame conversion; height is that
+    frame's height (keeps one cached offset table per frame size).
+    """
+    if out is None:
+        out = np.empty(gray.shape, dtype=np.uint8)
+    if mode == "none":
+        np.take(LUT_4BIT_INVERT if invert else LUT_4BIT, gray, out=out)
+        return out
+    if mode == "floyd-steinberg":
+        out[...] = floyd_steinberg(gray, invert)
+        return out
+    h, w = gray.shape
+    if rows is None:
+        full_h = h
+    else:
+        full_h = height if height is not None else int(np.max(rows)) + 1
+    offsets = _offsets(mode, full_h, w)
+    if rows is not None:
+        offsets = offsets[rows]
+    np.take(_threshold_table(invert), offsets + gray, out=out)
+    return out
+
+
+def _fs_rows_python(img):
+    h, w = img.shape
+    out = np.empty((h, w), dtype=np.uint8)
+    for y in range(h):
+        row = img[y].tolist()
+        q_row = [0] * w
+        err_row = [0.0] * w
+        carry = 0.0
+        for x in range(w):
+            v = row[x] + carry
+            q = int(v / 17.0 + 0.5)
+            q = 0 if q < 0 else (15 if q > 15 else q)
+            e = v - q * 17.0
+            q_row[x] = q
+            err_row[x] = e
+            carry = e * (7.0 / 16.0)
+        out[y] = q_row
+        if y + 1 < h:
+            e = np.asarray(err_row)
+            nxt = img[y + 1]
+            nxt += e * (5.0 / 16.0)
+            nxt[1:] += e[:-1] * (3.0 / 16.0)
+            nxt[:-1] += e[1:] * (1.0 / 16.0)
+    return out
+
+
+def _fs_kernel(img):
+    h, w = img.shape
+    out = np.empty((h, w), dtype=np.uint8)
+    for y in range(h):
+        carry = 0.0
+        for x in range(w):
+            v = img[y, x] + carry
+            q = int(v / 17.0 + 0.5)
+            q = 0 if q < 0 else (15 if q > 15 else q)
+            e = v - q * 17.0
+            out[y, x] = q
+            carry = e * (7.0 / 16.0)
+            if y + 1 < h:
+                if x > 0:
+                    img[y + 1, x - 1] += e * (3.0 / 16.0)
+                img[y + 1, x] += e * (5.0 / 16.0)
+                if x + 1 < w:
+                    img[y + 1, x + 1] += e * (1.0 / 16.0)
+    return out
+
+
+_fs_compiled = numba.njit(cache=True)(_fs_kernel) if numba is not None else None
+
+
+def floyd_steinberg(gray, invert=False):
+    """Floyd-Steinberg error diffusion to 16 levels (offline: ~0.3 s per 640x480 without numba)"""
+    img = np.asarray(gray, dtype=np.float64).copy()
+    out = _fs_compiled(img) if _fs_compiled is not None else _fs_rows_python(img)
+    return (15 - out).astype(np.uint8) if invert else out
+
+
+def quantize_image(img, width, height, mode="none", invert=False, resample="lanczos"):
+    """PIL image -> (height, width) levels: grayscale, cached-plan resize, quantize"""
+    return quantize(resize_gray(img, width, height, resample), mode, invert)
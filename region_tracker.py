@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Capture region that follows an application window and/or crops to its content
+- find_window(): screen geometry of the first visible window whose title contains a
+  string (pygetwindow)
+- content_bbox(): bounding box of the pixels that differ from the border colour, from
+  a strided scan of a BGRA frame (one uint32 compare per sampled pixel)
+- snap_region(): grows a crop to an exact 1x/2x/3x... multiple of 640x480 where it fits,
+  so the converter either skips resampling or takes its integer box path; otherwise
+  to the panel aspect ratio
+- RegionTracker re-evaluates the region every interval_s (window lookup, plus one grab
+  of the whole window for the crop scan); every other frame grabs only the crop
+"""
+
+import math
+import time
+
+import numpy as np
+
+try:
+    import pygetwindow  # window lookup by title (Windows / macOS)
+except ImportError:
+    pygetwindow = None
+
+PANEL_WIDTH = 640
+PANEL_HEIGHT = 480
+
+
+def find_window(title):
+    """(x, y, w, h) of the first visible, non-minimized window whose title contains title, or None"""
+    if pygetwindow is None:
+        raise RuntimeError("pygetwindow not installed: pip install pygetwindow")
+    for win in pygetwindow.getWindowsWithTitle(title):
+        if getattr(win, "isMinimized", False) or win.width <= 0 or win.height <= 0:
+            continue
+        return win.left, win.top, win.width, win.height
+    return None
+
+
+def clip_region(region, bounds):
+    """Intersection of two (x, y, w, h) rectangles, or None if they do not overlap"""
+    x0 = max(region[0], bounds[0])
+    y0 = max(region[1], bounds[1])
+    x1 = min(region[0] + region[2], bounds[0] + bounds[2])
+    y1 = min(region[1] + region[3], bounds[1] + bounds[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def content_bbox(bgra, step=4, margin=0):
+    """(x, y, w, h) within the frame of everything that differs from the top-left pixel.
+
+    Only every step-th row and column is compared, so the box is widened by up to
+    step - 1 pixels per side to cover content between the samples. None for a blank frame.
+    """
+    h, w = bgra.shape[:2]
+    px = np.ascontiguousarray(bgra).view(np.uint32)[..., 0]
+    bg = px[0, 0]
+    diff = px[::step, ::step] != bg
+    rows = np.flatnonzero(diff.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(diff.any(axis=0))
+    x0 = max(0, (int(cols[0]) - 1) * step + 1 - margin)
+    y0 = max(0, (int(rows[0]) - 1) * step + 1 - margin)
+    x1 = min(w, (int(cols[-1]) + 1) * step + margin)
+    y1 = min(h, (int(rows[-1]) + 1) * step + margin)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def snap_region(region, bounds, width=PANEL_WIDTH, height=PANEL_HEIGHT):
+    """Grow region (centred, kept inside bounds) to k*width x k*height, else to the panel aspect"""
+    x, y, w, h = region
+    k = max(1, math.ceil(w / width), math.ceil(h / height))
+    tw, th = k * width, k * height
+    if tw > bounds[2] or th > bounds[3]:
+        tw = min(bounds[2], max(w, math.ceil(h * width / height)))
+        th = min(bounds[3], max(h, math.ceil(w * height / width)))
+    nx = min(max(x + (w - tw) // 2, bounds[0]), bounds[0] + bounds[2] - tw)
+    ny = min(max(y + (h - th) // 2, bounds[1]), bounds[1] + bounds[3] - th)
+    return nx, ny, tw, th
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3])
+
+
+class RegionTracker:
+    """Current capture region for a window title and/or content auto-crop.
+
+    base: the configured region, used as the area to crop when no window is given
+    and as the fallback while the window cannot be found. screen: (x, y, w, h) the
+    region is clipped to (the virtual desktop). The crop only moves when content
+    leaves it or its snapped size changes, so the delta baseline is not reset by jitter.
+    """
+
+    def __init__(self, base, window=None, auto_crop=False, interval_s=1.0, snap=True, screen=None,
+                 log=None):
+        self.base = tuple(base)
+        self.window = window
+        self.auto_crop = auto_crop
+        self.interval_s = interval_s
+        self.snap = snap
+        self.screen = screen
+        self._log = log or (lambda msg: None)
+        self._region = None
+        self._checked = 0.0
+        self._missing = False
+
+    def _bounds(self):
+        bounds = self.base
+        if self.window:
+            geo = find_window(self.window)
+            if geo is None:
+                if not self._missing:
+                    self._log(f"Window {self.window!r} not found; keeping the last region")
+                self._missing = True
+                return None
+            if self._missing:
+                self._log(f"Window {self.window!r} found at {geo}")
+            self._missing = False
+            bounds = geo
+        if self.screen is not None:
+            bounds = clip_region(bounds, self.screen)
+        return bounds
+
+    def region(self, grab_bgra):
+        """(x, y, w, h) to capture now; grab_bgra(x, y, w, h) is used for the crop scan"""
+        now = time.monotonic()
+        if self._region is not None and now - self._checked < self.interval_s:
+            return self._region
+        self._checked = now
+        bounds = self._bounds()
+        if bounds is None:
+            return self._region or self.base
+        region = bounds
+        if self.auto_crop:
+            box = content_bbox(grab_bgra(*bounds))
+            if box is not None:
+                region = (bounds[0] + box[0], bounds[1] + box[1], box[2], box[3])
+                cur = self._region
+                if self.snap:
+                    snapped = snap_region(region, bounds)
+                    if (cur is not None and cur[2:] == snapped[2:] and _contains(bounds, cur)
+                            and _contains(cur, region)):
+                        return cur
+                    region = snapped
+        if region != self._region:
+            self._log(f"Capture region {region}")
+            self._region = region
+        return region
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Runtime image format for /current_image.bin (uploaded via /upload, shown via /apply)
+
+v1 (little-endian, 20-byte header, then data):
+    0  4  magic  b"JBD4"
+    4  1  version (1)
+    5  1  header size in bytes (20)
+    6  1  bits per pixel (4)
+    7  1  flags: bit0 = packed (two pixels per byte, high nibble first)
+    8  2  width
+   10  2  height
+   12  4  data length in bytes
+   16  4  CRC-32 of the data (zlib / firmware crc32_update)
+
+Legacy: headerless 1 byte per pixel, low 4 bits used (width * height bytes).
+Packed 640x480 data is 153600 bytes and is sent to display_image without repacking.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+from header_writer import pack_4bit
+
+MAGIC = b"JBD4"
+VERSION = 1
+FLAG_PACKED = 0x01
+HEADER = struct.Struct("<4sBBBBHHII")
+PANEL_WIDTH = 640
+PANEL_HEIGHT = 480
+
+
+class RuntimeImageError(ValueError):
+    pass
+
+
+def unpack_4bit(packed, width):
+    """(h, w/2) packed bytes -> (h, w) levels"""
+    packed = np.asarray(packed, dtype=np.uint8).reshape(-1, width // 2)
+    out = np.empty((packed.shape[0], width), dtype=np.uint8)
+    out[:, 0::2] = packed >> 4
+    out[:, 1::2] = packed & 0x0F
+    return out
+
+
+def encode(levels=None, packed=None, pack=True):
+    """Build a v1 runtime image from (h, w) levels, or from an already packed (h, w/2) frame"""
+    if packed is not None:
+        data = np.ascontiguousarray(packed, dtype=np.uint8)
+        height, width = data.shape[0], data.shape[1] * 2
+        flags = FLAG_PACKED
+    else:
+        height, width = levels.shape
+        if pack:
+            if width % 2:
+                raise RuntimeImageError("packed format needs an even width")
+            data = pack_4bit(levels)
+            flags = FLAG_PACKED
+        else:
+            data = np.ascontiguousarray(levels & 0x0F, dtype=np.uint8)
+            flags = 0
+    payload = data.tobytes()
+    header = HEADER.pack(MAGIC, VERSION, HEADER.size, 4, flags, width, height,
+                         len(payload), zlib.crc32(payload))
+    return header + payload
+
+
+def encode_legacy(levels):
+    """Headerless 1B/px image for older firmware"""
+    return np.ascontiguousarray(levels & 0x0F, dtype=np.uint8).tobytes()
+
+
+def parse_header(data):
+    """Return the header fields as a dict, or None for a legacy (headerless) image"""
+    if len(data) < HEADER.size or bytes(data[:4]) != MAGIC:
+        return None
+    magic, version, header_size, bpp, flags, width, height, length, crc = HEADER.unpack_from(data)
+    if version != VERSION or header_size < HEADER.size or bpp != 4:
+        raise RuntimeImageError(f"unsupported runtime image (version {version}, bpp {bpp})")
+    return {"version": version, "header_size": header_size, "bpp": bpp,
+            "packed": bool(flags & FLAG_PACKED), "width": width, "height": height,
+            "length": length, "crc32": crc}
+
+
+def decode(data, width=PANEL_WIDTH, height=PANEL_HEIGHT, verify=True):
+    """Return (levels (h, w) uint8, header dict or None) for a v1 or legacy image"""
+    hdr = parse_header(data)
+    if hdr is None:
+        if len(data) < width * height:
+            raise RuntimeImageError(f"legacy image too short: {len(data)} < {width * height}")
+        levels = np.frombuffer(data, dtype=np.uint8, count=width * height).reshape(height, width) & 0x0F
+        return levels, None
+    start = hdr["header_size"]
+    payload = memoryview(data)[start:start + hdr["length"]]
+    if len(payload) != hdr["length"]:
+        raise RuntimeImageError("truncated runtime image")
+    if verify and zlib.crc32(payload) != hdr["crc32"]:
+        raise RuntimeImageError("runtime image CRC mismatch")
+    w, h = hdr["width"], hdr["height"]
+    raw = np.frombuffer(payload, dtype=np.uint8)
+    if hdr["packed"]:
+        levels = unpack_4bit(raw[:h * (w // 2)], w)
+    else:
+        levels = raw[:w * h].reshape(h, w) & 0x0F
+    return levels, hdr
+
+
+def write(path, levels, pack=True, legacy=False):
+    """Write levels to path; returns the number of bytes written"""
+    data = encode_legacy(levels) if legacy else encode(levels, pack=pack)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
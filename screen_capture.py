@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Screen capture backend for the streamer
+- MssCapture keeps one mss handle open per thread instead of one per frame
+- Bgra4BitConverter turns the raw BGRA grab into 4-bit (0..15, 1B/px) with integer
+  luma and a 256-entry LUT, writing into preallocated arrays (no per-frame copies)
+- Regions that are not panel-sized are resized with a cached resampler plan
+  (box / bilinear / lanczos) straight from the luma plane; exact k x panel-size
+  regions (1280x960, 1920x1440, ...) take a k x k box average instead, whatever the
+  resample method
+- Optional ordered dithering (quantizer.LIVE_MODES) costs about the same as the LUT
+"""
+
+import threading
+
+import numpy as np
+
+from resampler import resample_plan
+from quantizer import LIVE_MODES, LUT_4BIT, LUT_4BIT_INVERT, quantize  # noqa: F401 (LUT re-export)
+
+try:
+    import mss  # fast screen capture
+except ImportError:
+    mss = None
+
+
+PANEL_WIDTH = 640
+PANEL_HEIGHT = 480
+
+
+class MssCapture:
+    """Reusable mss session; handles are per thread because mss is not thread-safe"""
+
+    def __init__(self):
+        if mss is None:
+            raise RuntimeError("mss not installed: pip install mss")
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def _handle(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = mss.mss()
+            self._local.sct = sct
+            with self._lock:
+                self._handles.append(sct)
+        return sct
+
+    def screen_bounds(self):
+        """(x, y, w, h) of the virtual desktop spanning all monitors"""
+        mon = self._handle().monitors[0]
+        return mon["left"], mon["top"], mon["width"], mon["height"]
+
+    def grab_bgra(self, x, y, w, h):
+        """Grab a region as an (h, w, 4) uint8 BGRA array backed by the mss buffer"""
+        shot = self._handle().grab({"left": x, "top": y, "width": w, "height": h})
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def close(self):
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for sct in handles:
+            try:
+                sct.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+class Bgra4BitConverter:
+    """BGRA -> luma -> 4-bit with integer math into reused buffers.
+
+    Luma uses 8-bit BT.601 weights (77, 150, 29), which sum to 256 so the
+    accumulator fits in uint16. The returned array is owned by the converter
+    and overwritten by the next convert() call; use one converter per thread.
+    """
+
+    MAX_BOX_FACTOR = 15  # k * k * 255 must fit the uint16 box sums
+
+    def __init__(self, width=PANEL_WIDTH, height=PANEL_HEIGHT):
+        self.width = width
+        self.height = height
+        self._shape = None
+        self._acc = None
+        self._tmp = None
+        self._gray = np.empty((height, width), dtype=np.uint8)
+        self._out = np.empty((height, width), dtype=np.uint8)
+        self._box_cols = None  # (k * height, width) column sums for integer downscale
+        self._box_sum = np.empty((height, width), dtype=np.uint16)
+
+    def _buffers(self, h, w):
+        if self._shape != (h, w):
+            self._shape = (h, w)
+            self._acc = np.empty((h, w), dtype=np.uint16)
+            self._tmp = np.empty((h, w), dtype=np.uint16)
+        return self._acc, self._tmp
+
+    def luma(self, bgra):
+        """Return the (h, w) uint16 luma plane (0..255) of a BGRA frame"""
+        h, w = bgra.shape[:2]
+        acc, tmp = self._buffers(h, w)
+        return self._luma_into(bgra, acc, tmp)
+
+    @staticmethod
+    def _luma_into(bgra, acc, tmp):
+        np.multiply(bgra[..., 2], 77, out=acc, dtype=np.uint16)
+        np.multiply(bgra[..., 1], 150, out=tmp, dtype=np.uint16)
+        np.add(acc, tmp, out=acc)
+        np.multiply(bgra[..., 0], 29, out=tmp, dtype=np.uint16)
+        np.add(acc, tmp, out=acc)
+        np.add(acc, 128, out=acc)  # round; max 65280 + 128 still fits
+        np.right_shift(acc, 8, out=acc)
+        return acc
+
+    def box_factor(self, h, w):
+        """k if an (h, w) frame is exactly k x the output size (k >= 2), else None"""
+        k = w // self.width
+        if 2 <= k <= self.MAX_BOX_FACTOR and (h, w) == (k * self.height, k * self.width):
+            return k
+        return None
+
+    def _box_reduce(self, acc, k):
+        """k x k box average of a (k * height, k * width) luma plane into self._gray"""
+        if self._box_cols is None or self._box_cols.shape[0] != k * self.height:
+            self._box_cols = np.empty((k * self.height, self.width), dtype=np.uint16)
+        cols, total = self._box_cols, self._box_sum
+        np.copyto(cols, acc[:, 0::k])
+        for j in range(1, k):
+            np.add(cols, acc[:, j::k], out=cols)
+        np.copyto(total, cols[0::k])
+        for i in range(1, k):
+            np.add(total, cols[i::k], out=total)
+        n = k * k
+        np.add(total, n // 2, out=total)
+        if n & (n - 1) == 0:
+            np.right_shift(total, n.bit_length() - 1, out=total)
+        else:
+            np.floor_divide(total, n, out=total)
+        self._gray[...] = total
+        return self._gray
+
+    @staticmethod
+    def _check_dither(dither):
+        if dither not in LIVE_MODES:
+            raise ValueError(f"dither {dither!r} is too slow for streaming; use one of {LIVE_MODES}")
+
+    def convert(self, bgra, invert=False, dither="none", resample="lanczos"):
+        """Return (height, width) uint8 4-bit levels for a BGRA frame of any size"""
+        self._check_dither(dither)
+        acc = self.luma(bgra)
+        h, w = acc.shape
+        if (h, w) != (self.height, self.width):
+            k = self.box_factor(h, w)
+            if k is not None:
+                # integer ratio: plain k x k average (the box filter's result) for every method
+                acc = self._box_reduce(acc, k)
+            else:
+                acc = resample_plan(w, h, self.width, self.height, resample)(acc, out=self._gray)
+        return quantize(acc, dither, invert, out=self._out)
+
+    def convert_rows(self, bgra, rows, invert=False, dither="none"):
+        """4-bit levels for the given rows of a panel-sized BGRA frame, as (len(rows), width)"""
+        if bgra.shape[:2] != (self.height, self.width):
+            raise ValueError("convert_rows needs a frame of the panel size")
+        self._check_dither(dither)
+        n = len(rows)
+        acc, tmp = self._buffers(self.height, self.width)
+        acc = self._luma_into(bgra[rows], acc[:n], tmp[:n])
+        return quantize(acc, dither, invert, out=self._out[:n], rows=rows, height=self.height)
@@ -1,56 +1,72 @@
 #!/usr/bin/env python3
 """
 Screen Streamer GUI
-- Captures a 640x480 region of the desktop every N seconds
-- Converts to 4-bit grayscale (1B/px low nibble used)
-- Uploads to ESP32-S2 via /upload then calls /apply
+- Captures a 640x480 region of the desktop every N seconds, or follows a window by
+  title and optionally crops to its content
+- Converts to 4-bit grayscale and streams it to the ESP32-S2
+- Thin Tk shell over stream_engine.StreamEngine (also usable headless:
+  python -m stream_engine stream --host <ip>)
+- Live metrics line (FPS, stage times, KiB/s, drops, reconnects, RTT); optional
+  Prometheus endpoint on the "Metrics port"
 """
 
-import os
-import threading
-import time
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox
 
-import numpy as np
-from PIL import Image
-import struct
-
-try:
-    import mss  # fast screen capture
-except ImportError:
-    mss = None
-
 try:
     import requests
 except ImportError:
     requests = None
 
-try:
-    import websockets
-    import asyncio
-except ImportError:
-    websockets = None
-    asyncio = None
+from quantizer import LIVE_MODES
+from resampler import RESAMPLE_METHODS
+from stream_engine import StreamConfig, StreamEngine, TRANSPORTS
+from stream_metrics import MetricsServer
+from stream_transport import device_http_features, http_base_url, http_session
 
 class ScreenStreamerGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("ESP32-S2 Screen Streamer")
-        self.root.geometry("700x480")
+        self.root.geometry("700x510")
 
-        self.running = False
-        self.capture_interval = 1.0  # seconds
         self.fps_var = tk.StringVar(value="1")
         self.host = tk.StringVar(value="192.168.1.189")
         self.x_var = tk.StringVar(value="0")
         self.y_var = tk.StringVar(value="0")
         self.w_var = tk.StringVar(value="640")
         self.h_var = tk.StringVar(value="480")
+        self.window_var = tk.StringVar(value="")  # window title to follow; blank: fixed region
+        self.auto_crop_var = tk.BooleanVar(value=False)
         self.invert_var = tk.BooleanVar(value=False)
         self.ws_rows_var = tk.StringVar(value="10")  # rows per WS chunk (smaller avoids 1009)
+        self.delta_var = tk.BooleanVar(value=True)  # only send changed row bands while streaming
+        self.pipeline_var = tk.BooleanVar(value=True)  # capture/convert/send on separate threads
+        self.transport_var = tk.StringVar(value="ws")
+        self.adaptive_var = tk.BooleanVar(value=False)  # FPS = upper bound, rows = start size
+        self.compress_var = tk.BooleanVar(value=False)  # RLE chunks, needs firmware with "rle" codec
+        self.dither_var = tk.StringVar(value="none")
+        self.resample_var = tk.StringVar(value="lanczos")  # only used when the region is not 640x480
+        self.metrics_port_var = tk.StringVar(value="")  # blank: no Prometheus endpoint
+        self.metrics_var = tk.StringVar(value="")
+        self._metrics_server = None
+        self._log_queue = queue.Queue()  # engine threads log here; drained on the Tk thread
+
+        self.engine = StreamEngine(self._read_config(StreamConfig()), log=self._log)
+        for var in (self.fps_var, self.host, self.x_var, self.y_var, self.w_var, self.h_var,
+                    self.window_var, self.auto_crop_var,
+                    self.invert_var, self.ws_rows_var, self.delta_var, self.transport_var, self.adaptive_var,
+                    self.compress_var, self.dither_var, self.resample_var):
+            var.trace_add("write", self._on_setting_changed)
 
         self._build_ui()
+        self._refresh_metrics()
+        self._drain_log()
+
+    @property
+    def running(self):
+        return self.engine.running
 
     def _build_ui(self):
         frame = ttk.Frame(self.root, padding=10)
@@ -72,6 +88,9 @@ class ScreenStreamerGUI:
         ttk.Entry(region, textvariable=self.w_var, width=8).grid(row=0, column=5, sticky=tk.W, padx=(5, 10))
         ttk.Label(region, text="H").grid(row=0, column=6, sticky=tk.W)
         ttk.Entry(region, textvariable=self.h_var, width=8).grid(row=0, column=7, sticky=tk.W, padx=(5, 10))
+        ttk.Label(region, text="Window").grid(row=1, column=0, sticky=tk.W, pady=(6, 0))
+        ttk.Entry(region, textvariable=self.window_var, width=26).grid(row=1, column=1, columnspan=4, sticky=tk.W, padx=(5, 10), pady=(6, 0))
+        ttk.Checkbutton(region, text="Auto-crop to content", variable=self.auto_crop_var).grid(row=1, column=5, columnspan=3, sticky=tk.W, pady=(6, 0))
 
         # Options + FPS + Pick Start
         options = ttk.Frame(frame)
@@ -80,8 +99,20 @@ class ScreenStreamerGUI:
         ttk.Label(options, text="FPS").grid(row=0, column=1, padx=(12,4), sticky=tk.W)
         ttk.Entry(options, textvariable=self.fps_var, width=6).grid(row=0, column=2, sticky=tk.W)
         ttk.Button(options, text="Pick Start (click on screen)", command=self.pick_start_point).grid(row=0, column=3, padx=(12,0))
-        ttk.Label(options, text="WS rows/chunk").grid(row=0, column=4, padx=(12,4), sticky=tk.W)
+        ttk.Label(options, text="Rows/chunk").grid(row=0, column=4, padx=(12,4), sticky=tk.W)
         ttk.Entry(options, textvariable=self.ws_rows_var, width=6).grid(row=0, column=5, sticky=tk.W)
+        ttk.Checkbutton(options, text="Delta (changed rows only)", variable=self.delta_var).grid(row=1, column=0, sticky=tk.W)
+        ttk.Checkbutton(options, text="Pipelined stages", variable=self.pipeline_var).grid(row=1, column=1, columnspan=2, sticky=tk.W, padx=(12,0))
+        ttk.Label(options, text="Transport").grid(row=1, column=3, padx=(12,4), sticky=tk.E)
+        ttk.Combobox(options, textvariable=self.transport_var, values=TRANSPORTS, width=5, state="readonly").grid(row=1, column=4, sticky=tk.W)
+        ttk.Checkbutton(options, text="Adaptive FPS/rows", variable=self.adaptive_var).grid(row=2, column=0, sticky=tk.W)
+        ttk.Checkbutton(options, text="RLE compress", variable=self.compress_var).grid(row=2, column=1, columnspan=2, sticky=tk.W, padx=(12,0))
+        ttk.Label(options, text="Dither").grid(row=2, column=3, padx=(12,4), sticky=tk.E)
+        ttk.Combobox(options, textvariable=self.dither_var, values=LIVE_MODES, width=9, state="readonly").grid(row=2, column=4, columnspan=2, sticky=tk.W)
+        ttk.Label(options, text="Resample").grid(row=3, column=3, padx=(12,4), sticky=tk.E)
+        ttk.Combobox(options, textvariable=self.resample_var, values=RESAMPLE_METHODS, width=8, state="readonly").grid(row=3, column=4, columnspan=2, sticky=tk.W)
+        ttk.Label(options, text="Metrics port").grid(row=1, column=5, padx=(12,4), sticky=tk.E)
+        ttk.Entry(options, textvariable=self.metrics_port_var, width=6).grid(row=1, column=6, sticky=tk.W)
 
         # Controls
         controls = ttk.Frame(frame)
@@ -91,13 +122,16 @@ class ScreenStreamerGUI:
         ttk.Button(controls, text="One Shot (WS)", command=self.one_shot_ws).grid(row=0, column=2, padx=5)
         ttk.Button(controls, text="Test Connect", command=self.test_connect).grid(row=0, column=3, padx=5)
 
+        # Metrics
+        ttk.Label(frame, textvariable=self.metrics_var, font=("TkFixedFont", 9)).grid(row=4, column=0, columnspan=2, sticky=tk.W)
+
         # Log
         self.log_text = tk.Text(frame, height=10)
-        self.log_text.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
-        frame.rowconfigure(4, weight=1)
+        self.log_text.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+        frame.rowconfigure(5, weight=1)
         frame.columnconfigure(1, weight=1)
 
-        self._log("Ready. Install deps: pip install mss requests pillow numpy")
+        self._log("Ready. Install deps: pip install mss requests pillow numpy websockets")
 
     def pick_start_point(self):
         """Show a fullscreen transparent window to pick the top-left point by click"""
@@ -129,167 +163,115 @@ class ScreenStreamerGUI:
             messagebox.showerror("Error", f"Pick failed: {e}")
             self._log(f"Pick failed: {e}")
 
+    def _refresh_metrics(self):
+        if self.engine.running:
+            self.metrics_var.set(self.engine.metrics.summary_line())
+        self.root.after(500, self._refresh_metrics)
+
     def _log(self, msg):
-        self.log_text.insert(tk.END, msg + "\n")
-        self.log_text.see(tk.END)
-
-    def _capture_region(self, x, y, w, h):
-        if mss is None:
-            raise RuntimeError("mss not installed: pip install mss")
-        with mss.mss() as sct:
-            monitor = {"left": x, "top": y, "width": w, "height": h}
-            raw = sct.grab(monitor)
-            img = Image.frombytes("RGB", raw.size, raw.rgb)
-            return img
-
-    def _to_4bit_bytes(self, img, invert=False):
-        # Ensure 640x480
-        if img.size != (640, 480):
-            img = img.resize((640, 480), Image.Resampling.LANCZOS)
-        gray = img.convert("L")
-        arr = np.array(gray)
-        g4 = np.clip(np.round(arr / 17.0), 0, 15).astype(np.uint8)
-        if invert:
-            g4 = 15 - g4
-        return g4.tobytes()
-
-    def _pack_rows_4bit(self, g4_bytes, row_start, rows):
-        """Pack 1B/px low-nibble grayscale to 4-bit per pixel (two pixels per byte) for given rows"""
-        w = 640
-        bytes_per_row_src = w
-        bytes_per_row_dst = w // 2
-        out = np.empty(bytes_per_row_dst * rows, dtype=np.uint8)
-        src = np.frombuffer(g4_bytes, dtype=np.uint8).reshape(480, 640)
-        block = src[row_start:row_start+rows, :]
-        # pack: (p0<<4) | p1
-        hi = block[:, 0::2] & 0x0F
-        lo = block[:, 1::2] & 0x0F
-        packed = ((hi << 4) | lo).astype(np.uint8)
-        out[:] = packed.reshape(-1)
-        return out.tobytes()
-
-    def _upload_and_apply(self, host, data_bytes):
-        if requests is None:
-            raise RuntimeError("requests not installed: pip install requests")
-        files = {"file": ("current_image.bin", data_bytes, "application/octet-stream")}
-        r = requests.post(host.rstrip('/') + "/upload", files=files, timeout=10)
-        r.raise_for_status()
-        self._log(f"Upload: {r.text.strip()}")
-        r2 = requests.post(host.rstrip('/') + "/apply", timeout=10)
-        r2.raise_for_status()
-        self._log(f"Apply: {r2.text.strip()}")
-
-    def _ws_send_frame(self, host_ip, g4_bytes):
-        if websockets is None or asyncio is None:
-            raise RuntimeError("websockets not installed: pip install websockets")
-
-        async def _run():
-            uri = f"ws://{host_ip}:81/"
-            async with websockets.connect(uri, max_size=None, ping_interval=None) as ws:
-                # 以每60行一个块发送（与设备端一致），每块前加4字节小端头: rowStart(u16), rows(u16)
-                try:
-                    chunk_rows = int(self.ws_rows_var.get())
-                except Exception:
-                    chunk_rows = 10
-                if chunk_rows <= 0 or chunk_rows > 60:
-                    chunk_rows = 10
-                for row_start in range(0, 480, chunk_rows):
-                    rows = min(chunk_rows, 480 - row_start)
-                    chunk = self._pack_rows_4bit(g4_bytes, row_start, rows)
-                    header = struct.pack('<HH', row_start, rows)
-                    await ws.send(header + chunk)
-        loop = asyncio.new_event_loop()
+        """Thread-safe: the engine calls this from its sender, pipeline and probe threads"""
+        self._log_queue.put(msg)
+
+    def _drain_log(self):
+        lines = []
         try:
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(_run())
-        finally:
+            while True:
+                lines.append(self._log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if lines:
+            self.log_text.insert(tk.END, "".join(m + "\n" for m in lines))
+            self.log_text.see(tk.END)
+        self.root.after(100, self._drain_log)
+
+    def _read_config(self, base):
+        """Build a StreamConfig from the Tk variables; unparsable fields keep base's value"""
+        def _num(var, conv, default):
             try:
-                loop.close()
+                return conv(var.get())
             except Exception:
-                pass
-
-    def one_shot(self):
-        try:
-            x = int(self.x_var.get()); y = int(self.y_var.get())
-            w = int(self.w_var.get()); h = int(self.h_var.get())
-            host = self.host.get().strip()
-            if not host.startswith("http"):
-                host = "http://" + host
-            img = self._capture_region(x, y, w, h)
-            g4 = self._to_4bit_bytes(img, invert=self.invert_var.get())
-            # stream in chunks of 60 rows via /stream-chunk (packed=1)
-            for row_start in range(0, 480, 60):
-                rows = min(60, 480 - row_start)
-                chunk = self._pack_rows_4bit(g4, row_start, rows)
-                params = {
-                    'rowStart': str(row_start),
-                    'rows': str(rows),
-                    'packed': '1'
-                }
-                files = {'file': ('chunk.bin', chunk, 'application/octet-stream')}
-                if requests is None:
-                    raise RuntimeError("requests not installed: pip install requests")
-                r = requests.post(host.rstrip('/') + "/stream-chunk", params=params, files=files, timeout=10)
-                r.raise_for_status()
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self._log(f"Error: {e}")
+                return default
+
+        region = tuple(_num(v, int, d) for v, d in zip((self.x_var, self.y_var, self.w_var, self.h_var), base.region))
+        if region[2] <= 0 or region[3] <= 0:
+            region = base.region
+        fps = _num(self.fps_var, float, base.fps)
+        return StreamConfig(host=self.host.get().strip(),
+                            fps=fps if fps > 0 else 1.0,
+                            region=region,
+                            invert=self.invert_var.get(),
+                            delta=self.delta_var.get(),
+                            chunk_rows=_num(self.ws_rows_var, int, base.chunk_rows),
+                            transport=self.transport_var.get(),
+                            pipelined=self.pipeline_var.get(),
+                            delta_refresh_s=base.delta_refresh_s,
+                            ws_port=base.ws_port,
+                            rtt_interval_s=base.rtt_interval_s,
+                            adaptive=self.adaptive_var.get(),
+                            target_latency_s=base.target_latency_s,
+                            compress=self.compress_var.get(),
+                            skip_identical=base.skip_identical,
+                            keepalive_s=base.keepalive_s,
+                            dither=self.dither_var.get(),
+                            resample=self.resample_var.get(),
+                            ws_window=base.ws_window,
+                            window=self.window_var.get().strip() or None,
+                            auto_crop=self.auto_crop_var.get())
+
+    def _on_setting_changed(self, *args):
+        # the engine reads its config every frame, so edits apply while streaming
+        self.engine.config = self._read_config(self.engine.config)
 
     def one_shot_ws(self):
         try:
-            x = int(self.x_var.get()); y = int(self.y_var.get())
-            w = int(self.w_var.get()); h = int(self.h_var.get())
-            host_ip = self.host.get().strip()
-            img = self._capture_region(x, y, w, h)
-            g4 = self._to_4bit_bytes(img, invert=self.invert_var.get())
-            self._ws_send_frame(host_ip, g4)
-            self._log("One shot via WebSocket done")
+            cfg = self._read_config(self.engine.config)
+            cfg.transport = "ws"
+            n = StreamEngine(cfg, log=self._log).one_shot()
+            self._log(f"One shot via WebSocket done ({n} bytes)")
         except Exception as e:
             messagebox.showerror("Error", str(e))
             self._log(f"WS Error: {e}")
 
-    def _loop(self):
-        while self.running:
-            t0 = time.time()
-            try:
-                # Prefer WebSocket streaming for performance
-                self.one_shot_ws()
-            except Exception as e:
-                self._log(f"Loop error: {e}")
-            # update interval from FPS
-            try:
-                fps = float(self.fps_var.get())
-                if fps <= 0:
-                    fps = 1.0
-            except Exception:
-                fps = 1.0
-            self.capture_interval = 1.0 / fps
-            dt = time.time() - t0
-            sleep_left = max(0.0, self.capture_interval - dt)
-            time.sleep(sleep_left)
-
     def start(self):
-        if self.running:
+        if self.engine.running:
             return
-        self.running = True
-        threading.Thread(target=self._loop, daemon=True).start()
-        self._log("Started streaming")
+        self.engine.config = self._read_config(self.engine.config)
+        self.engine.start()
+        self._start_metrics_server()
+        mode = "pipelined" if self.engine.config.pipelined else "sequential"
+        self._log(f"Started streaming ({mode}, {self.engine.config.transport})")
 
     def stop(self):
-        self.running = False
-        self._log("Stopped")
+        self.engine.stop()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+        self._log(f"Stopped ({self.engine.metrics.summary_line()})")
+
+    def _start_metrics_server(self):
+        port = self.metrics_port_var.get().strip()
+        if not port or self._metrics_server is not None:
+            return
+        try:
+            server = MetricsServer(self.engine.metrics, int(port))
+            server.start()
+            self._log(f"Metrics: {server.url()}")
+            self._metrics_server = server
+        except Exception as e:
+            self._log(f"Metrics server failed: {e}")
 
     def test_connect(self):
         try:
             if requests is None:
                 raise RuntimeError("requests not installed: pip install requests")
-            host = self.host.get().strip().rstrip('/')
-            if not host.startswith("http"):
-                host = "http://" + host
-            r = requests.get(host + "/api/fs-status", timeout=5)
+            host = http_base_url(self.host.get())
+            session = http_session()
+            r = session.get(host + "/api/fs-status", timeout=5)
             self._log(f"fs-status: {r.status_code} {r.text[:120]}")
-            r2 = requests.get(host + "/api/runtime-status", timeout=5)
+            r2 = session.get(host + "/api/runtime-status", timeout=5)
             self._log(f"runtime-status: {r2.status_code} {r2.text[:120]}")
+            features = device_http_features(host, session, timeout=5)
+            self._log(f"HTTP body formats: {', '.join(sorted(features)) or 'multipart only'}")
         except Exception as e:
             messagebox.showerror("Error", str(e))
             self._log(f"Conn error: {e}")
@@ -303,5 +285,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-
@@ -137,8 +137,24 @@ WebSocketsServer wsServer(81); // WebSocket端口81
 bool invertEnabled = false;
 
 // 运行时图像路径与FS状态
-static const char* kRuntimeImagePath = "/current_image.bin"; // 640x480, 1B/px, 低4位有效
+static const char* kRuntimeImagePath = "/current_image.bin"; // v1: 20字节头+打包4bit；旧格式: 640x480, 1B/px, 低4位有效
 static bool fsMounted = false;
+
+// 运行时图像v1文件头（小端，20字节）：
+// magic "JBD4" | version(u8) | headerSize(u8) | bpp(u8) | flags(u8, bit0=打包) | width(u16) | height(u16) | dataLen(u32) | crc32(u32)
+struct RuntimeImageHeader {
+  u8 version;
+  u8 headerSize;
+  u8 bpp;
+  u8 flags;
+  u16 width;
+  u16 height;
+  u32 dataLen;
+  u32 crc32;
+};
+static const u8 kRuntimeMagic[4] = {'J', 'B', 'D', '4'};
+static const u8 kRuntimeHeaderSize = 20;
+static const u8 kRuntimeFlagPacked = 0x01;
 static File uploadFile;
 static size_t lastUploadedSize = 0;
 
@@ -148,6 +164,7 @@ void drawLetter(char letter);
 void drawString(const char text[], int len);
 void setTextHorizontalFlip(bool enable);
 void packPngScaledRowsToPanel(u8 *dest, u16 destWidth, u16 destHeight, const u8 *src, u16 srcWidth, u16 srcHeight, u16 rowStart, u16 rows, bool invert);
+void packCurrentImageRows(u8 *dest, u16 rowStart, u16 rows, bool invert);
 void refreshDisplay();
 void refreshDisplayFromFS();
 void setBrightness(u16 brightness);
@@ -178,6 +195,8 @@ void handleRuntimeDownload();
 void handleFsStatus();
 uint32_t crc32_update(uint32_t crc, const uint8_t *data, size_t len);
 uint32_t computeFileCRC32(File &f);
+uint32_t computeFileCRC32Range(File &f, size_t offset, size_t len);
+bool readRuntimeHeader(File &f, RuntimeImageHeader &hdr);
 void webSocketEvent(uint8_t num, WStype_t type, uint8_t * payload, size_t length);
 
 // 配置引脚
@@ -889,10 +908,7 @@ void refreshDisplay() {
   
   while (rowStart < panelHeight) {
     u16 rowsNow = (panelHeight - rowStart) > chunkRows ? chunkRows : (panelHeight - rowStart);
-    memset(image, 0, (size_t)bytesPerRow * (size_t)rowsNow);
-    packPngScaledRowsToPanel(image, panelWidth, panelHeight,
-                             current_image_data, current_image_width, current_image_height,
-                             rowStart, rowsNow, invertEnabled);
+    packCurrentImageRows(image, rowStart, rowsNow, invertEnabled);
     u32 lenBytes = (u32)bytesPerRow * (u32)rowsNow;
     display_image(image, lenBytes, 0, (u16)rowStart);
     rowStart += rowsNow;
@@ -900,6 +916,7 @@ void refreshDisplay() {
 }
 
 // 从SPIFFS读取运行时图像并刷新
+// v1打包格式按行块直接读入并送显（无需重新打包）；v1非打包/旧版1B/px格式逐行打包
 void refreshDisplayFromFS() {
   if (!fsMounted || !SPIFFS.exists(kRuntimeImagePath)) {
     refreshDisplay();
@@ -913,8 +930,41 @@ void refreshDisplayFromFS() {
 
   File f = SPIFFS.open(kRuntimeImagePath, "r");
   if (!f) { refreshDisplay(); return; }
+
+  RuntimeImageHeader hdr;
+  bool hasHeader = readRuntimeHeader(f, hdr);
+  size_t dataOffset = 0;
+  if (hasHeader) {
+    if (hdr.bpp != 4 || hdr.width != panelWidth || hdr.height != panelHeight ||
+        (size_t)f.size() < (size_t)hdr.headerSize + (size_t)hdr.dataLen) {
+      Serial.println("运行时图像头无效");
+      f.close(); refreshDisplay(); return;
+    }
+    dataOffset = hdr.headerSize;
+  }
+
+  if (hasHeader && (hdr.flags & kRuntimeFlagPacked)) {
+    if (hdr.dataLen < (u32)dstBytesPerRow * (u32)panelHeight) { f.close(); refreshDisplay(); return; }
+    const u16 packedChunkRows = 60; // 60*320=19200 字节，放入 image 缓冲
+    u16 rowStart = 0;
+    f.seek((u32)dataOffset, SeekSet);
+    while (rowStart < panelHeight) {
+      u16 rowsNow = (panelHeight - rowStart) > packedChunkRows ? packedChunkRows : (panelHeight - rowStart);
+      size_t toRead = (size_t)dstBytesPerRow * (size_t)rowsNow;
+      size_t n = f.read((uint8_t*)image, toRead);
+      if (n != toRead) break;
+      if (invertEnabled) {
+        for (size_t i = 0; i < toRead; i++) image[i] ^= 0xFF; // 两个半字节同时 15 - v
+      }
+      display_image(image, (u32)toRead, 0, (u16)rowStart);
+      rowStart += rowsNow;
+    }
+    f.close();
+    return;
+  }
+
   size_t expected = (size_t)panelWidth * (size_t)panelHeight;
-  if ((size_t)f.size() < expected) { f.close(); refreshDisplay(); return; }
+  if ((size_t)f.size() < dataOffset + expected) { f.close(); refreshDisplay(); return; }
 
   std::unique_ptr<u8[]> src(new u8[(size_t)srcBytesPerRow * (size_t)chunkRows]);
   std::unique_ptr<u8[]> dst(new u8[(size_t)dstBytesPerRow * (size_t)chunkRows]);
@@ -922,7 +972,7 @@ void refreshDisplayFromFS() {
   u16 rowStart = 0;
   while (rowStart < panelHeight) {
     u16 rowsNow = (panelHeight - rowStart) > chunkRows ? chunkRows : (panelHeight - rowStart);
-    size_t offset = (size_t)rowStart * (size_t)srcBytesPerRow;
+    size_t offset = dataOffset + (size_t)rowStart * (size_t)srcBytesPerRow;
     f.seek((u32)offset, SeekSet);
     size_t toRead = (size_t)srcBytesPerRow * (size_t)rowsNow;
     size_t n = f.read((uint8_t*)src.get(), toRead);
@@ -1084,41 +1134,268 @@ void handleGetWiFiStatus() {
   server.send(200, "application/json", json);
 }
 
-// 上传处理：数据块写入
+// HTTP请求体支持的格式(runtime-status "http"字段):
+//   raw   /upload 与 /stream-chunk 接受 application/octet-stream 原始请求体(免multipart逐字节解析)
+//   multi /stream-chunks 一个请求携带多个块
+//   chunked /upload/begin|chunk|status|commit|abort 分块可续传上传
+static const char* kHttpFeatures = "raw,multi,chunked";
+
+// 请求体分段: multipart走HTTPUpload, 其余Content-Type走HTTPRaw(arduino-esp32 2.x), 统一成一种视图
+enum BodyStatus { BODY_START, BODY_WRITE, BODY_END, BODY_ABORTED };
+struct BodyPart {
+  BodyStatus status;
+  const u8* buf;
+  size_t len;
+};
+
+static BodyPart currentBodyPart() {
+  BodyPart part;
+  if (server.header("Content-Type").startsWith("multipart/")) {
+    HTTPUpload& up = server.upload();
+    part.status = up.status == UPLOAD_FILE_START ? BODY_START :
+                  up.status == UPLOAD_FILE_WRITE ? BODY_WRITE :
+                  up.status == UPLOAD_FILE_END ? BODY_END : BODY_ABORTED;
+    part.buf = up.buf;
+    part.len = up.currentSize;
+  } else {
+    HTTPRaw& raw = server.raw();
+    part.status = raw.status == RAW_START ? BODY_START :
+                  raw.status == RAW_WRITE ? BODY_WRITE :
+                  raw.status == RAW_END ? BODY_END : BODY_ABORTED;
+    part.buf = raw.buf;
+    part.len = raw.currentSize;
+  }
+  if (part.status != BODY_WRITE) part.len = 0;
+  return part;
+}
+
+// 上传临时文件与替换: 新图像先完整写入临时文件, 校验通过后才替换运行时图像,
+// 上传中断或校验失败时旧图像保持不变
+static const char* kUploadTmpPath = "/upload.tmp";
+static const char* kUploadMetaPath = "/upload.meta";     // 分块上传: 目标大小与整文件CRC32
+static const char* kRuntimeOldPath = "/current_image.old";
+static const size_t kUploadChunkMax = 16384;             // 分块上传单块最大字节数
+
+struct UploadMeta {
+  u32 size;
+  u32 crc32;
+};
+
+static bool readUploadMeta(UploadMeta& m) {
+  if (!SPIFFS.exists(kUploadMetaPath)) return false;
+  File f = SPIFFS.open(kUploadMetaPath, "r");
+  bool ok = f && f.read((u8*)&m, sizeof(m)) == sizeof(m);
+  if (f) f.close();
+  return ok;
+}
+
+static size_t uploadTmpSize() {
+  if (!SPIFFS.exists(kUploadTmpPath)) return 0;
+  File f = SPIFFS.open(kUploadTmpPath, "r");
+  size_t sz = f ? f.size() : 0;
+  if (f) f.close();
+  return sz;
+}
+
+static void clearUploadSession() {
+  if (SPIFFS.exists(kUploadTmpPath)) SPIFFS.remove(kUploadTmpPath);
+  if (SPIFFS.exists(kUploadMetaPath)) SPIFFS.remove(kUploadMetaPath);
+}
+
+// 校验临时文件: 分块上传时核对大小与整文件CRC; v1格式再核对数据CRC. 返回nullptr表示通过
+static const char* verifyUploadTmp(const UploadMeta* meta) {
+  File f = SPIFFS.open(kUploadTmpPath, "r");
+  if (!f) return "上传失败";
+  size_t sz = f.size();
+  const char* err = nullptr;
+  RuntimeImageHeader hdr;
+  if (sz == 0) err = "上传失败: 空文件";
+  else if (meta && sz != meta->size) err = "上传失败: 大小不符";
+  else if (meta && computeFileCRC32Range(f, 0, sz) != meta->crc32) err = "上传失败: CRC校验错误";
+  else if (readRuntimeHeader(f, hdr) &&
+           (sz < (size_t)hdr.headerSize + (size_t)hdr.dataLen ||
+            computeFileCRC32Range(f, hdr.headerSize, hdr.dataLen) != hdr.crc32)) {
+    err = "上传失败: CRC校验错误";
+  }
+  f.close();
+  return err;
+}
+
+// 临时文件替换运行时图像: 旧文件先改名, 新文件就位后再删除(掉电由recoverRuntimeImage恢复)
+static bool replaceRuntimeImage() {
+  if (SPIFFS.exists(kRuntimeOldPath)) SPIFFS.remove(kRuntimeOldPath);
+  bool hadOld = SPIFFS.exists(kRuntimeImagePath);
+  if (hadOld && !SPIFFS.rename(kRuntimeImagePath, kRuntimeOldPath)) return false;
+  if (!SPIFFS.rename(kUploadTmpPath, kRuntimeImagePath)) {
+    if (hadOld) SPIFFS.rename(kRuntimeOldPath, kRuntimeImagePath);
+    return false;
+  }
+  if (hadOld) SPIFFS.remove(kRuntimeOldPath);
+  return true;
+}
+
+// 启动时调用: 替换中途掉电只剩旧文件时改回原名
+static void recoverRuntimeImage() {
+  if (!SPIFFS.exists(kRuntimeOldPath)) return;
+  if (SPIFFS.exists(kRuntimeImagePath)) SPIFFS.remove(kRuntimeOldPath);
+  else SPIFFS.rename(kRuntimeOldPath, kRuntimeImagePath);
+}
+
+// 上传处理：数据块写入临时文件
 void handleUploadData() {
-  HTTPUpload& up = server.upload();
-  if (up.status == UPLOAD_FILE_START) {
+  BodyPart up = currentBodyPart();
+  if (up.status == BODY_START) {
     if (!fsMounted) { Serial.println("/upload: FS未挂载"); return; }
-    if (SPIFFS.exists(kRuntimeImagePath)) SPIFFS.remove(kRuntimeImagePath);
-    uploadFile = SPIFFS.open(kRuntimeImagePath, "w");
+    clearUploadSession();  // 单次上传取代未完成的分块上传
+    uploadFile = SPIFFS.open(kUploadTmpPath, "w");
     lastUploadedSize = 0;
-    Serial.printf("/upload: start '%s'\n", up.filename.c_str());
-  } else if (up.status == UPLOAD_FILE_WRITE) {
+    Serial.printf("/upload: start (%s)\n", server.header("Content-Type").c_str());
+  } else if (up.status == BODY_WRITE) {
     if (uploadFile) {
-      uploadFile.write(up.buf, up.currentSize);
-      lastUploadedSize += up.currentSize;
+      uploadFile.write(up.buf, up.len);
+      lastUploadedSize += up.len;
     }
-  } else if (up.status == UPLOAD_FILE_END) {
+  } else if (up.status == BODY_END) {
     if (uploadFile) uploadFile.close();
     Serial.printf("/upload: end, total=%u bytes\n", (unsigned)lastUploadedSize);
-  } else if (up.status == UPLOAD_FILE_ABORTED) {
+  } else if (up.status == BODY_ABORTED) {
     if (uploadFile) { uploadFile.close(); }
-    if (SPIFFS.exists(kRuntimeImagePath)) { SPIFFS.remove(kRuntimeImagePath); }
+    if (SPIFFS.exists(kUploadTmpPath)) { SPIFFS.remove(kUploadTmpPath); }
     Serial.println("/upload: aborted");
   }
 }
 
-// 上传完成后的响应
+// 上传完成后的响应（v1格式校验CRC，失败则删除临时文件，旧图像不受影响）
 void handleUploadComplete() {
   if (!fsMounted) { server.send(500, "text/plain", "FS未挂载"); return; }
-  if (SPIFFS.exists(kRuntimeImagePath)) {
-    File f = SPIFFS.open(kRuntimeImagePath, "r");
-    size_t sz = f ? f.size() : 0; if (f) f.close();
-    if (sz == 0) server.send(500, "text/plain", "上传失败: 空文件");
-    else server.send(200, "text/plain", String("上传完成, 大小 ") + String(sz) + " 字节");
-  } else {
-    server.send(500, "text/plain", "上传失败");
+  if (!SPIFFS.exists(kUploadTmpPath)) { server.send(500, "text/plain", "上传失败"); return; }
+  size_t sz = uploadTmpSize();
+  const char* err = verifyUploadTmp(nullptr);
+  if (err) {
+    SPIFFS.remove(kUploadTmpPath);
+    server.send(sz == 0 ? 500 : 400, "text/plain", err);
+    return;
   }
+  File f = SPIFFS.open(kUploadTmpPath, "r");
+  RuntimeImageHeader hdr;
+  bool hasHeader = f && readRuntimeHeader(f, hdr);
+  if (f) f.close();
+  if (!replaceRuntimeImage()) { server.send(500, "text/plain", "上传失败: 替换文件失败"); return; }
+  server.send(200, "text/plain", String("上传完成, 大小 ") + String(sz) + " 字节" + (hasHeader ? ", v1打包格式" : ""));
+}
+
+// 分块可续传上传:
+//   POST /upload/begin?size=<字节>&crc=<整文件CRC32>   开始; 与未完成会话相同则续传
+//   POST /upload/chunk?offset=<偏移>&crc=<本块CRC32>   请求体为数据(<=16KiB), 按偏移顺序追加
+//   GET  /upload/status                                 查询已接收字节数
+//   POST /upload/commit                                 校验整文件后替换运行时图像
+//   POST /upload/abort                                  丢弃未完成的上传
+// 进度保存在临时文件长度与/upload.meta中, 断网或重启后可续传
+static std::unique_ptr<u8[]> g_chunkBuf;
+static size_t g_chunkLen = 0;
+static bool g_chunkOverflow = false;
+
+static void sendUploadState(int code, size_t received, const UploadMeta* m) {
+  String json = "{";
+  json += "\"active\": " + String(m ? "true" : "false") + ",";
+  json += "\"size\": " + String(m ? (unsigned long)m->size : 0UL) + ",";
+  json += "\"crc32\": " + String(m ? (unsigned long)m->crc32 : 0UL) + ",";
+  json += "\"received\": " + String((unsigned long)received) + ",";
+  json += "\"chunk_max\": " + String((unsigned long)kUploadChunkMax);
+  json += "}";
+  server.send(code, "application/json", json);
+}
+
+void handleUploadBegin() {
+  if (!fsMounted) { server.send(500, "text/plain", "FS未挂载"); return; }
+  if (!server.hasArg("size") || !server.hasArg("crc")) { server.send(400, "text/plain", "缺少size/crc参数"); return; }
+  UploadMeta want;
+  want.size = (u32)strtoul(server.arg("size").c_str(), nullptr, 10);
+  want.crc32 = (u32)strtoul(server.arg("crc").c_str(), nullptr, 10);
+  if (want.size == 0) { server.send(400, "text/plain", "size无效"); return; }
+  UploadMeta cur;
+  bool resume = readUploadMeta(cur) && cur.size == want.size && cur.crc32 == want.crc32 &&
+                SPIFFS.exists(kUploadTmpPath) && uploadTmpSize() <= want.size;
+  if (!resume) {
+    clearUploadSession();
+    // 提交前临时文件与旧图像同时存在
+    if (want.size > SPIFFS.totalBytes() - SPIFFS.usedBytes()) { server.send(507, "text/plain", "空间不足"); return; }
+    File mf = SPIFFS.open(kUploadMetaPath, "w");
+    if (!mf) { server.send(500, "text/plain", "无法创建上传会话"); return; }
+    mf.write((const u8*)&want, sizeof(want));
+    mf.close();
+    File tf = SPIFFS.open(kUploadTmpPath, "w");
+    if (tf) tf.close();
+  }
+  sendUploadState(200, uploadTmpSize(), &want);
+}
+
+void handleUploadChunkBody() {
+  BodyPart part = currentBodyPart();
+  if (part.status == BODY_START) {
+    g_chunkBuf.reset(new u8[kUploadChunkMax]);
+    g_chunkLen = 0;
+    g_chunkOverflow = false;
+  } else if (part.status == BODY_WRITE && g_chunkBuf) {
+    size_t n = std::min(part.len, kUploadChunkMax - g_chunkLen);
+    memcpy(g_chunkBuf.get() + g_chunkLen, part.buf, n);
+    g_chunkLen += n;
+    if (n < part.len) g_chunkOverflow = true;
+  } else if (part.status == BODY_ABORTED) {
+    g_chunkBuf.reset();
+    g_chunkLen = 0;
+  }
+}
+
+void handleUploadChunk() {
+  std::unique_ptr<u8[]> buf = std::move(g_chunkBuf);
+  size_t len = g_chunkLen;
+  g_chunkLen = 0;
+  UploadMeta m;
+  if (!fsMounted || !readUploadMeta(m)) { server.send(409, "text/plain", "没有进行中的上传"); return; }
+  if (!buf || len == 0 || g_chunkOverflow) { server.send(400, "text/plain", "分块为空或超过16KiB"); return; }
+  if (!server.hasArg("offset") || !server.hasArg("crc")) { server.send(400, "text/plain", "缺少offset/crc参数"); return; }
+  size_t offset = strtoul(server.arg("offset").c_str(), nullptr, 10);
+  u32 crc = (u32)strtoul(server.arg("crc").c_str(), nullptr, 10);
+  if (crc32_update(0, buf.get(), len) != crc) { server.send(400, "text/plain", "分块CRC校验错误"); return; }
+  if (offset + len > m.size) { server.send(400, "text/plain", "分块超出文件大小"); return; }
+  size_t received = uploadTmpSize();
+  if (offset + len <= received) { sendUploadState(200, received, &m); return; }  // 重传的分块, 已写入
+  if (offset > received) { sendUploadState(409, received, &m); return; }         // 之前的分块尚未到达
+  File f = SPIFFS.open(kUploadTmpPath, "a");
+  if (!f) { server.send(500, "text/plain", "无法写入临时文件"); return; }
+  size_t skip = received - offset;  // 与已写入部分重叠时只追加新数据
+  size_t written = f.write(buf.get() + skip, len - skip);
+  f.close();
+  if (written != len - skip) { server.send(507, "text/plain", "写入失败: 空间不足"); return; }
+  sendUploadState(200, received + written, &m);
+}
+
+void handleUploadStatus() {
+  UploadMeta m;
+  if (fsMounted && readUploadMeta(m)) sendUploadState(200, uploadTmpSize(), &m);
+  else sendUploadState(200, 0, nullptr);
+}
+
+void handleUploadCommit() {
+  UploadMeta m;
+  if (!fsMounted || !readUploadMeta(m)) { server.send(409, "text/plain", "没有进行中的上传"); return; }
+  size_t received = uploadTmpSize();
+  if (received != m.size) { sendUploadState(409, received, &m); return; }
+  const char* err = verifyUploadTmp(&m);
+  if (err) {
+    clearUploadSession();
+    server.send(400, "text/plain", err);
+    return;
+  }
+  SPIFFS.remove(kUploadMetaPath);
+  if (!replaceRuntimeImage()) { server.send(500, "text/plain", "上传失败: 替换文件失败"); return; }
+  server.send(200, "text/plain", String("上传完成, 大小 ") + String((unsigned long)m.size) + " 字节");
+}
+
+void handleUploadAbort() {
+  if (fsMounted) clearUploadSession();
+  server.send(200, "text/plain", "已取消上传");
 }
 
 // 应用运行时图像
@@ -1141,10 +1418,21 @@ void handleRuntimeDownload() {
 void handleGetRuntimeStatus() {
   bool available = fsMounted && SPIFFS.exists(kRuntimeImagePath);
   size_t sz = 0;
-  if (available) { File f = SPIFFS.open(kRuntimeImagePath, "r"); if (f) { sz = f.size(); f.close(); } }
+  RuntimeImageHeader hdr;
+  bool hasHeader = false;
+  if (available) {
+    File f = SPIFFS.open(kRuntimeImagePath, "r");
+    if (f) { sz = f.size(); hasHeader = readRuntimeHeader(f, hdr); f.close(); }
+  }
   String json = "{";
   json += "\"available\": " + String(available ? "true" : "false") + ",";
-  json += "\"size\": " + String(sz);
+  json += "\"size\": " + String(sz) + ",";
+  json += "\"format\": \"" + String(!available ? "none" : (hasHeader ? ((hdr.flags & kRuntimeFlagPacked) ? "v1-packed" : "v1") : "legacy")) + "\",";
+  json += "\"codecs\": \"rle\",";
+  json += "\"http\": \"" + String(kHttpFeatures) + "\"";
+  if (hasHeader) {
+    json += ",\"crc32\": " + String((unsigned long)hdr.crc32);
+  }
   json += "}";
   server.send(200, "application/json", json);
 }
@@ -1154,22 +1442,49 @@ static const u16 kPanelWidth = 640;
 static const u16 kPanelHeight = 480;
 static const u16 kBytesPerRowPacked = kPanelWidth / 2; // 4bit/像素
 static const u16 kBytesPerRowUnpacked = kPanelWidth;   // 1B/px 低4bit有效
+static const u16 kChunkFlagRle = 0x8000;              // WS头rows字段bit15: 数据为RLE压缩
 static u16 g_streamRowStart = 0;
 static u16 g_streamRows = 0;
 static bool g_streamPacked = true;
+static bool g_streamRle = false;
 static std::unique_ptr<u8[]> g_streamBuf;
 static size_t g_streamExpected = 0;
 static size_t g_streamReceived = 0;
 
+// RLE解码(与chunk_codec.py一致):
+//   0x00-0x7F c: 后跟 c+1 字节原样复制
+//   0x80-0xFF c: 后跟1字节, 重复 c-0x80+3 次
+// 解码长度必须正好等于dstLen
+static bool rleDecode(const u8* src, size_t srcLen, u8* dst, size_t dstLen) {
+  size_t i = 0, o = 0;
+  while (i < srcLen) {
+    u8 c = src[i++];
+    if (c < 0x80) {
+      size_t n = (size_t)c + 1;
+      if (i + n > srcLen || o + n > dstLen) return false;
+      memcpy(dst + o, src + i, n);
+      i += n;
+      o += n;
+    } else {
+      size_t n = (size_t)(c - 0x80) + 3;
+      if (i >= srcLen || o + n > dstLen) return false;
+      memset(dst + o, src[i++], n);
+      o += n;
+    }
+  }
+  return o == dstLen;
+}
+
 void handleStreamUpload() {
-  HTTPUpload &up = server.upload();
-  if (up.status == UPLOAD_FILE_START) {
+  BodyPart up = currentBodyPart();
+  if (up.status == BODY_START) {
     String qsRow = server.arg("rowStart");
     String qsRows = server.arg("rows");
     String qsPacked = server.arg("packed");
     g_streamRowStart = (u16)(qsRow.length() ? qsRow.toInt() : 0);
     g_streamRows = (u16)(qsRows.length() ? qsRows.toInt() : 0);
     g_streamPacked = (qsPacked == "0") ? false : true;
+    g_streamRle = g_streamPacked && server.arg("enc") == "rle";
     if (g_streamRows == 0 || g_streamRowStart >= kPanelHeight) {
       g_streamRows = 0; // 标记无效
     }
@@ -1180,13 +1495,13 @@ void handleStreamUpload() {
     if (g_streamExpected > 0) {
       g_streamBuf.reset(new u8[g_streamExpected]);
     }
-  } else if (up.status == UPLOAD_FILE_WRITE) {
+  } else if (up.status == BODY_WRITE) {
     if (g_streamBuf && g_streamReceived < g_streamExpected) {
-      size_t can = std::min((size_t)up.currentSize, g_streamExpected - g_streamReceived);
+      size_t can = std::min(up.len, g_streamExpected - g_streamReceived);
       memcpy(g_streamBuf.get() + g_streamReceived, up.buf, can);
       g_streamReceived += can;
     }
-  } else if (up.status == UPLOAD_FILE_ABORTED) {
+  } else if (up.status == BODY_ABORTED) {
     g_streamBuf.reset();
     g_streamExpected = g_streamReceived = 0;
   }
@@ -1197,6 +1512,17 @@ void handleStreamComplete() {
     server.send(400, "text/plain", "invalid stream params");
     return;
   }
+  if (g_streamRle) {
+    // 压缩数据不超过原始大小, 接收缓冲区按原始大小分配
+    std::unique_ptr<u8[]> dec(new u8[g_streamExpected]);
+    if (!rleDecode(g_streamBuf.get(), g_streamReceived, dec.get(), g_streamExpected)) {
+      server.send(400, "text/plain", "bad rle data");
+      g_streamBuf.reset();
+      return;
+    }
+    g_streamBuf = std::move(dec);
+    g_streamReceived = g_streamExpected;
+  }
   if (g_streamReceived != g_streamExpected) {
     server.send(400, "text/plain", "incomplete body");
     g_streamBuf.reset();
@@ -1240,21 +1566,199 @@ void handleStreamComplete() {
   server.send(200, "text/plain", "chunk applied");
 }
 
+// /stream-chunks: 请求体为若干块首尾相接, 每块 = 4字节头(同WebSocket: rowStart, rows|RLE标志) + 数据
+// 边接收边解析(RLE也逐段解码), 每块收齐立即显示, 只需一块大小的缓冲区; 一帧的所有块只需一次HTTP请求
+struct ChunkStream {
+  u8 hdr[4];
+  u8 hdrLen;
+  u16 rowStart;
+  bool rle;
+  size_t expected;   // 当前块解码后字节数
+  size_t filled;
+  u8 rleState;       // 0: 等待控制字节 1: 复制字面量 2: 等待重复字节
+  size_t rleLeft;
+  u16 applied;
+  const char* error;
+};
+static ChunkStream g_chunks;
+static std::unique_ptr<u8[]> g_chunksBuf;
+static size_t g_chunksBufSize = 0;
+
+static void chunkStreamHeader(ChunkStream& c) {
+  c.rowStart = (u16)(c.hdr[0] | ((u16)c.hdr[1] << 8));
+  u16 rows = (u16)(c.hdr[2] | ((u16)c.hdr[3] << 8));
+  c.rle = (rows & kChunkFlagRle) != 0;
+  rows &= (u16)~kChunkFlagRle;
+  if (rows == 0 || c.rowStart + rows > kPanelHeight) { c.error = "invalid chunk header"; return; }
+  c.expected = (size_t)kBytesPerRowPacked * (size_t)rows;
+  c.filled = 0;
+  c.rleState = 0;
+  c.rleLeft = 0;
+  if (g_chunksBufSize < c.expected) {
+    g_chunksBuf.reset(new u8[c.expected]);
+    g_chunksBufSize = c.expected;
+  }
+}
+
+static void chunkStreamFeed(ChunkStream& c, const u8* data, size_t len) {
+  size_t i = 0;
+  while (i < len && !c.error) {
+    if (c.hdrLen < 4) {
+      c.hdr[c.hdrLen++] = data[i++];
+      if (c.hdrLen == 4) chunkStreamHeader(c);
+      continue;
+    }
+    if (!c.rle) {
+      size_t n = std::min(len - i, c.expected - c.filled);
+      memcpy(g_chunksBuf.get() + c.filled, data + i, n);
+      c.filled += n;
+      i += n;
+    } else if (c.rleState == 0) {
+      // 控制字节: 与rleDecode相同的格式
+      u8 ctl = data[i++];
+      if (ctl < 0x80) { c.rleLeft = (size_t)ctl + 1; c.rleState = 1; }
+      else { c.rleLeft = (size_t)(ctl - 0x80) + 3; c.rleState = 2; }
+      if (c.filled + c.rleLeft > c.expected) { c.error = "bad rle data"; return; }
+    } else if (c.rleState == 1) {
+      size_t n = std::min(len - i, c.rleLeft);
+      memcpy(g_chunksBuf.get() + c.filled, data + i, n);
+      c.filled += n;
+      c.rleLeft -= n;
+      i += n;
+      if (c.rleLeft == 0) c.rleState = 0;
+    } else {
+      memset(g_chunksBuf.get() + c.filled, data[i++], c.rleLeft);
+      c.filled += c.rleLeft;
+      c.rleLeft = 0;
+      c.rleState = 0;
+    }
+    if (c.filled == c.expected && c.rleState == 0) {
+      display_image(g_chunksBuf.get(), (u32)c.expected, 0, c.rowStart);
+      c.applied++;
+      c.hdrLen = 0;
+    }
+  }
+}
+
+void handleStreamChunksBody() {
+  BodyPart part = currentBodyPart();
+  if (part.status == BODY_START) {
+    memset(&g_chunks, 0, sizeof(g_chunks));
+  } else if (part.status == BODY_WRITE) {
+    chunkStreamFeed(g_chunks, part.buf, part.len);
+  } else if (part.status == BODY_ABORTED) {
+    g_chunks.error = "aborted";
+  }
+}
+
+void handleStreamChunksComplete() {
+  const char* err = g_chunks.error;
+  if (!err && g_chunks.hdrLen != 0) err = "incomplete body";  // 最后一块不完整
+  // 大缓冲区只在一个请求内保留, 不长期占用堆
+  g_chunksBuf.reset();
+  g_chunksBufSize = 0;
+  if (err) {
+    server.send(400, "text/plain", String(err) + " after " + String(g_chunks.applied) + " chunks");
+    return;
+  }
+  server.send(200, "text/plain", String(g_chunks.applied) + " chunks applied");
+}
+
+// WebSocket流控扩展(协议见stream_transport.py): rowStart=0xFFFF为控制消息, rows字段为消息类型
+// 旧固件按rowStart越界丢弃控制消息; 未发送HELLO的旧客户端不会收到任何确认
+static const u16 kWsControlRow = 0xFFFF;
+static const u16 kWsMsgHello = 1;      // 客户端->设备: 请求确认; 回复 版本, 窗口
+static const u16 kWsMsgFrameEnd = 2;   // 客户端->设备: 帧结束标记(seq); 回复 seq, 拒收块数, 应用耗时(us)
+static const u16 kWsMsgChunkAck = 3;   // 设备->客户端: 每块处理后 已处理块数(u16), 状态(0应用 1拒收)
+static const u16 kWsProtoVersion = 1;
+static const u16 kWsWindow = 8;        // 建议同时在途的最大块数
+
+struct WsClientState {
+  bool acks;          // 已收到HELLO
+  u16 chunkSeq;       // 本连接已处理块数(回绕)
+  u16 rejected;       // 当前帧拒收块数
+  bool inFrame;
+  u32 frameStartUs;   // 当前帧第一块到达时间
+};
+static WsClientState g_wsClients[WEBSOCKETS_SERVER_CLIENT_MAX];
+
+static void putU16(u8* p, u16 v) { p[0] = (u8)v; p[1] = (u8)(v >> 8); }
+static void putU32(u8* p, u32 v) { putU16(p, (u16)v); putU16(p + 2, (u16)(v >> 16)); }
+
+// 显示一个数据块, 格式错误(头越界/长度不足/RLE损坏)返回false
+static bool wsApplyChunk(uint8_t* payload, size_t length) {
+  if (length < 4) return false;
+  u16 rowStart = (u16)(payload[0] | ((u16)payload[1] << 8));
+  u16 rows = (u16)(payload[2] | ((u16)payload[3] << 8));
+  bool rle = (rows & kChunkFlagRle) != 0;
+  rows &= (u16)~kChunkFlagRle;
+  size_t expected = (size_t)kBytesPerRowPacked * (size_t)rows;
+  if (rowStart >= kPanelHeight || rows == 0) return false;
+  if (rle) {
+    if (rowStart + rows > kPanelHeight) return false;
+    std::unique_ptr<u8[]> dec(new u8[expected]);
+    if (!rleDecode(payload + 4, length - 4, dec.get(), expected)) return false;
+    display_image(dec.get(), (u32)expected, 0, rowStart);
+    return true;
+  }
+  if (length < 4 + expected) return false;
+  display_image(payload + 4, (u32)expected, 0, rowStart);
+  return true;
+}
+
+static void wsHandleControl(uint8_t num, uint8_t* payload, size_t length) {
+  WsClientState& st = g_wsClients[num];
+  u16 kind = (u16)(payload[2] | ((u16)payload[3] << 8));
+  if (kind == kWsMsgHello) {
+    st.acks = true;
+    st.chunkSeq = 0;
+    st.rejected = 0;
+    st.inFrame = false;
+    u8 reply[8];
+    putU16(reply, kWsControlRow); putU16(reply + 2, kWsMsgHello);
+    putU16(reply + 4, kWsProtoVersion); putU16(reply + 6, kWsWindow);
+    wsServer.sendBIN(num, reply, sizeof(reply));
+  } else if (kind == kWsMsgFrameEnd && st.acks && length >= 6) {
+    u16 seq = (u16)(payload[4] | ((u16)payload[5] << 8));
+    u32 applyUs = st.inFrame ? (u32)(micros() - st.frameStartUs) : 0;
+    u8 reply[12];
+    putU16(reply, kWsControlRow); putU16(reply + 2, kWsMsgFrameEnd);
+    putU16(reply + 4, seq); putU16(reply + 6, st.rejected);
+    putU32(reply + 8, applyUs);
+    wsServer.sendBIN(num, reply, sizeof(reply));
+    st.rejected = 0;
+    st.inFrame = false;
+  }
+}
+
 // WebSocket事件处理：接收二进制块：前4字节为小端头 rowStart(u16), rows(u16)，随后为打包数据(rows * 320字节)
+// rows的bit15置位时数据为RLE压缩(见rleDecode); 格式错误的块被丢弃, 开启确认的客户端会收到拒收状态
 void webSocketEvent(uint8_t num, WStype_t type, uint8_t * payload, size_t length) {
   if (type == WStype_BIN) {
-    if (length < 4) return;
-    u16 rowStart = (u16)(payload[0] | ((u16)payload[1] << 8));
-    u16 rows = (u16)(payload[2] | ((u16)payload[3] << 8));
-    size_t expected = (size_t)kBytesPerRowPacked * (size_t)rows;
-    if (rowStart >= kPanelHeight || rows == 0) return;
-    if (length < 4 + expected) return;
-    u8 *data = (u8*)(payload + 4);
-    display_image(data, (u32)expected, 0, rowStart);
+    if (length >= 4 && payload[0] == 0xFF && payload[1] == 0xFF) {
+      wsHandleControl(num, payload, length);
+      return;
+    }
+    WsClientState& st = g_wsClients[num];
+    if (!st.inFrame) {
+      st.inFrame = true;
+      st.frameStartUs = micros();
+    }
+    bool ok = wsApplyChunk(payload, length);
+    if (st.acks) {
+      if (!ok) st.rejected++;
+      st.chunkSeq++;
+      u8 reply[8];
+      putU16(reply, kWsControlRow); putU16(reply + 2, kWsMsgChunkAck);
+      putU16(reply + 4, st.chunkSeq); putU16(reply + 6, ok ? 0 : 1);
+      wsServer.sendBIN(num, reply, sizeof(reply));
+    }
   } else if (type == WStype_CONNECTED) {
     // 可选：连接建立时打印日志
+    memset(&g_wsClients[num], 0, sizeof(WsClientState));
     Serial.println("WebSocket connected");
   } else if (type == WStype_DISCONNECTED) {
+    memset(&g_wsClients[num], 0, sizeof(WsClientState));
     Serial.println("WebSocket disconnected");
   }
 }
@@ -1288,6 +1792,38 @@ uint32_t crc32_update(uint32_t crc, const uint8_t *data, size_t len) {
   return ~crc;
 }
 
+// 计算文件[offset, offset+len)区间的CRC32
+uint32_t computeFileCRC32Range(File &f, size_t offset, size_t len) {
+  const size_t BUFSZ = 2048;
+  uint8_t buf[BUFSZ];
+  uint32_t crc = 0;
+  f.seek((u32)offset, SeekSet);
+  while (len > 0) {
+    size_t n = f.read(buf, len < BUFSZ ? len : BUFSZ);
+    if (n == 0) break;
+    crc = crc32_update(crc, buf, n);
+    len -= n;
+  }
+  return crc;
+}
+
+// 读取并校验运行时图像v1文件头；旧版无头文件返回false
+bool readRuntimeHeader(File &f, RuntimeImageHeader &hdr) {
+  u8 b[kRuntimeHeaderSize];
+  f.seek(0, SeekSet);
+  if (f.read(b, sizeof(b)) != sizeof(b)) return false;
+  if (memcmp(b, kRuntimeMagic, 4) != 0) return false;
+  hdr.version = b[4];
+  hdr.headerSize = b[5];
+  hdr.bpp = b[6];
+  hdr.flags = b[7];
+  hdr.width = (u16)(b[8] | ((u16)b[9] << 8));
+  hdr.height = (u16)(b[10] | ((u16)b[11] << 8));
+  hdr.dataLen = (u32)b[12] | ((u32)b[13] << 8) | ((u32)b[14] << 16) | ((u32)b[15] << 24);
+  hdr.crc32 = (u32)b[16] | ((u32)b[17] << 8) | ((u32)b[18] << 16) | ((u32)b[19] << 24);
+  return hdr.version == 1 && hdr.headerSize >= kRuntimeHeaderSize;
+}
+
 uint32_t computeFileCRC32(File &f) {
   const size_t BUFSZ = 2048;
   uint8_t buf[BUFSZ];
@@ -1330,6 +1866,11 @@ void setupWebServer() {
 
   // 运行时图像上传/应用/下载/状态
   server.on("/upload", HTTP_POST, handleUploadComplete, handleUploadData);
+  server.on("/upload/begin", HTTP_POST, handleUploadBegin);
+  server.on("/upload/chunk", HTTP_POST, handleUploadChunk, handleUploadChunkBody);
+  server.on("/upload/status", HTTP_GET, handleUploadStatus);
+  server.on("/upload/commit", HTTP_POST, handleUploadCommit);
+  server.on("/upload/abort", HTTP_POST, handleUploadAbort);
   server.on("/apply", HTTP_POST, handleApply);
   server.on("/api/runtime-status", HTTP_GET, handleGetRuntimeStatus);
   server.on("/runtime.bin", HTTP_GET, handleRuntimeDownload);
@@ -1344,6 +1885,11 @@ void setupWebServer() {
 
   // 直连流式端点：/stream-chunk?rowStart=<u16>&rows=<u16>&packed=1
   server.on("/stream-chunk", HTTP_POST, handleStreamComplete, handleStreamUpload);
+  // 多块端点: 一个application/octet-stream请求体携带多个WS格式的块
+  server.on("/stream-chunks", HTTP_POST, handleStreamChunksComplete, handleStreamChunksBody);
+  // currentBodyPart()按Content-Type区分multipart与原始请求体
+  const char* collectedHeaders[] = {"Content-Type"};
+  server.collectHeaders(collectedHeaders, 1);
 
   
   server.begin();
@@ -1438,6 +1984,30 @@ void packPngScaledRowsToPanel(u8 *dest,
   }
 }
 
+// 将内置图像(current_image.h)的行块写入面板缓冲：
+// 打包格式(CURRENT_IMAGE_PACKED, 640宽)直接拷贝，否则按1B/px缩放打包
+void packCurrentImageRows(u8 *dest, u16 rowStart, u16 rows, bool invert) {
+  const u16 panelWidth = 640;
+  const u16 panelHeight = 480;
+  const u16 bytesPerRow = panelWidth / 2;
+#ifdef CURRENT_IMAGE_PACKED
+  // 打包数据按面板行直接拷贝，尺寸不符会越界读取，编译期拒绝
+  static_assert(current_image_width == 640 && current_image_height == 480,
+                "CURRENT_IMAGE_PACKED 需要640x480的current_image.h");
+  static_assert(current_image_size == 640 / 2 * 480, "CURRENT_IMAGE_PACKED 数据大小应为153600字节");
+  size_t len = (size_t)bytesPerRow * (size_t)rows;
+  memcpy(dest, current_image_data + (size_t)rowStart * (size_t)bytesPerRow, len);
+  if (invert) {
+    for (size_t i = 0; i < len; i++) dest[i] ^= 0xFF; // 两个半字节同时 15 - v
+  }
+#else
+  memset(dest, 0, (size_t)bytesPerRow * (size_t)rows);
+  packPngScaledRowsToPanel(dest, panelWidth, panelHeight,
+                           current_image_data, current_image_width, current_image_height,
+                           rowStart, rows, invert);
+#endif
+}
+
 // u32 ID=read_id();
 void setup()
 {
@@ -1461,6 +2031,7 @@ void setup()
     fsMounted = false;
   } else {
     fsMounted = true;
+    recoverRuntimeImage();
     Serial.println("SPIFFS 已挂载");
   }
   //u32 ID = read_id();
@@ -1496,10 +2067,7 @@ void setup()
   u16 rowStart = 0;
   while (rowStart < panelHeight) {
     u16 rowsNow = (panelHeight - rowStart) > chunkRows ? chunkRows : (panelHeight - rowStart);
-    memset(image, 0, (size_t)bytesPerRow * (size_t)rowsNow);
-    packPngScaledRowsToPanel(image, panelWidth, panelHeight,
-                             current_image_data, current_image_width, current_image_height,
-                             rowStart, rowsNow, invertEnabled);
+    packCurrentImageRows(image, rowStart, rowsNow, invertEnabled);
     u32 lenBytes = (u32)bytesPerRow * (u32)rowsNow;
     display_image(image, lenBytes, 0, (u16)rowStart);
     rowStart += rowsNow;
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Adaptive frame rate and chunk sizing for the screen streamer
+- Send completion times (transport on_sent callbacks) give the sustainable frame rate;
+  FPS tracks a fraction of it, backs off multiplicatively on back-pressure (queued or
+  dropped frames), holds while a queued frame would miss the latency target and
+  creeps back up additively otherwise (AIMD)
+- Rows per chunk grow towards the transport ceiling (fewer messages and SPI_SYNCs per
+  frame); a 1009/timeout lowers the ceiling for the rest of the session
+"""
+
+import collections
+import threading
+import time
+
+
+class AdaptiveController:
+    """AIMD controller for StreamEngine; config.fps / chunk_rows are the upper bound / start"""
+
+    def __init__(self, max_fps, rows, max_rows, min_fps=0.5, target_latency_s=0.25,
+                 headroom=0.8, adjust_every_s=1.0, window=16):
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.fps = max_fps
+        self.rows = max(1, min(rows, max_rows))
+        self.max_rows = max_rows
+        self.target_latency_s = target_latency_s
+        self.headroom = headroom
+        self.adjust_every_s = adjust_every_s
+        self._lock = threading.Lock()
+        self._send_times = collections.deque(maxlen=window)
+        self._pressure = 0
+        self._last_adjust = time.time()
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+    def on_sent(self, nbytes, seconds):
+        with self._lock:
+            self._send_times.append(seconds)
+
+    def on_backpressure(self, n=1):
+        with self._lock:
+            self._pressure += n
+
+    def on_chunk_error(self, limit):
+        """The transport rejected or timed out on a chunk; never go above limit again"""
+        with self._lock:
+            self.max_rows = max(1, min(self.max_rows, limit))
+            self.rows = min(self.rows, self.max_rows)
+            self._pressure += 1
+
+    def update(self, pending=0):
+        """Called once per processed frame with the number of frames waiting in the transport"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_adjust < self.adjust_every_s or not self._send_times:
+                return False
+            self._last_adjust = now
+            times = sorted(self._send_times)
+            send_p50 = times[len(times) // 2]
+            pressure, self._pressure = self._pressure, 0
+
+            capacity = self.headroom / send_p50 if send_p50 > 0 else self.max_fps
+            if pressure or pending:
+                fps = self.fps * 0.7
+            elif send_p50 * 2 > self.target_latency_s:
+                # a frame queued behind this one would miss the latency target: hold
+                fps = self.fps
+            else:
+                fps = self.fps + max(0.5, self.fps * 0.1)
+            if not pressure:
+                self.rows = min(self.max_rows, self.rows + max(1, self.rows // 2))
+            self.fps = max(self.min_fps, min(self.max_fps, capacity, fps))
+            return True
+
+    def describe(self):
+        return f"adaptive {self.fps:.1f} fps, {self.rows} rows/chunk (max {self.max_rows})"
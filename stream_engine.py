@@ -0,0 +1,636 @@
+#!/usr/bin/env python3
+"""
+Headless streaming engine for the ESP32-S2 / JBD013VGA screen streamer
+- StreamEngine: capture -> 4-bit -> pack -> delta bands -> transport, no Tk needed
+- Runs sequentially or as a capture/convert/send pipeline
+- Per-stage timings, rates and counters in engine.metrics (see stream_metrics.py)
+- Optional adaptive FPS / rows per chunk from measured send times (stream_adaptive.py)
+- Identical captures (per-band CRC, frame_signature.py) skip quantize/pack/send; an idle
+  stream only sends a rotating keepalive chunk every keepalive_s
+- Optional playback source (playback_source.py) instead of screen capture
+- Capture region can follow a window by title and crop to its content (region_tracker.py)
+- CLI: python -m stream_engine stream --host 192.168.1.189 --fps 10 --region 0,0,640,480 --transport ws
+       python -m stream_engine play --host 192.168.1.189 --input demo.mp4
+       python -m stream_engine upload --host 192.168.1.189 --input photo.png  (runtime image + apply)
+"""
+
+import argparse
+import signal
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import runtime_image
+from frame_packer import PANEL_WIDTH, FramePacker
+from frame_signature import BandSignature
+from quantizer import DITHER_MODES, LIVE_MODES, quantize_image
+from region_tracker import RegionTracker
+from resampler import RESAMPLE_METHODS
+from screen_capture import Bgra4BitConverter, MssCapture
+from stream_adaptive import AdaptiveController
+from stream_metrics import JsonlWriter, MetricsServer, RttProbe, StreamMetrics
+from stream_pipeline import FramePipeline
+from stream_transport import (WS_DEFAULT_WINDOW, WS_MAX_CHUNK_ROWS, HttpChunkSender, HttpUploadSender,
+                              WsStreamSession, mask_to_bands, send_frame_ws, upload_and_apply)
+
+PANEL_HEIGHT = 480
+MAX_CHUNK_ROWS = 60
+TRANSPORTS = ("ws", "http", "upload")  # upload: /upload + /apply of a packed v1 runtime image
+
+
+class StreamConfig:
+    """Streaming parameters; the engine reads them every frame so they can change live"""
+
+    def __init__(self, host="192.168.1.189", fps=1.0, region=(0, 0, 640, 480), invert=False,
+                 delta=True, chunk_rows=None, transport="ws", pipelined=True, delta_refresh_s=10.0, ws_port=81,
+                 rtt_interval_s=5.0, adaptive=False, target_latency_s=0.25, compress=False,
+                 skip_identical=True, keepalive_s=2.0, dither="none",
+                 resample="lanczos", max_frames=None, ws_window=WS_DEFAULT_WINDOW, window=None,
+                 auto_crop=False):
+        self.host = host
+        self.fps = fps
+        self.region = region
+        self.invert = invert
+        self.delta = delta
+        self.chunk_rows = chunk_rows  # None: transport default
+        self.transport = transport
+        self.pipelined = pipelined
+        self.delta_refresh_s = delta_refresh_s  # periodic full frame to heal any device-side drift
+        self.ws_port = ws_port  # device_emulator.py listens on 8081 by default
+        self.rtt_interval_s = rtt_interval_s  # /api/runtime-status probe while streaming, 0 = off
+        self.adaptive = adaptive  # fps becomes the upper bound, chunk_rows the starting size
+        self.target_latency_s = target_latency_s
+        self.compress = compress  # RLE chunks (ws/http); firmware must list "rle" in codecs
+        self.skip_identical = skip_identical
+        self.keepalive_s = keepalive_s  # idle stream: resend one baseline chunk this often, 0 = never
+        self.dither = dither  # quantizer.LIVE_MODES
+        self.resample = resample  # non-panel-sized regions: resampler.RESAMPLE_METHODS
+        self.max_frames = max_frames  # WS frames queued before dropping the oldest (None: 1 pipelined, else 2)
+        self.ws_window = ws_window  # WS chunks in flight when the device acks them, 0 = no flow control
+        self.window = window  # capture this window (title substring) instead of region
+        self.auto_crop = auto_crop  # capture only the content bounding box of the window / region
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps if self.fps > 0 else 1.0
+
+    @property
+    def rows_per_chunk(self):
+        # small WS chunks avoid 1009 (message too big) closes; HTTP pays per request so use 60
+        default = 10 if self.transport == "ws" else MAX_CHUNK_ROWS
+        if self.chunk_rows is None or self.chunk_rows <= 0 or self.chunk_rows > MAX_CHUNK_ROWS:
+            return default
+        return self.chunk_rows
+
+
+def parse_region(text):
+    """'x,y,w,h' -> (x, y, w, h)"""
+    parts = [int(p) for p in text.replace(" ", "").split(",")]
+    if len(parts) != 4 or parts[2] <= 0 or parts[3] <= 0:
+        raise ValueError(f"region must be x,y,w,h with positive w/h: {text!r}")
+    return tuple(parts)
+
+
+def changed_row_bands(prev, cur, max_rows, merge_gap=2):
+    """Return [(row_start, rows), ...] covering every row that differs between two packed frames"""
+    if prev is None:
+        return [(r, min(max_rows, PANEL_HEIGHT - r)) for r in range(0, PANEL_HEIGHT, max_rows)]
+    return mask_to_bands(np.any(prev != cur, axis=1), max_rows, merge_gap)
+
+
+class StreamEngine:
+    """Capture the configured region and stream it to the device.
+
+    In delta mode the last packed frame handed to the transport is kept as the
+    baseline and only changed row bands are sent; a full frame is sent on start,
+    host change, transport resync and every config.delta_refresh_s seconds.
+    """
+
+    def __init__(self, config, log=None, metrics=None, source=None):
+        self.config = config
+        self._log = log or (lambda msg: None)
+        self.metrics = metrics or StreamMetrics()
+        self.source = source  # PlaybackSource: pre-packed frames replace screen capture
+        if source is not None and source.metrics is None:
+            source.metrics = self.metrics
+        self._seen = {}  # last cumulative transport/pipeline counters folded into metrics
+        self._rtt_probe = None
+        self._adaptive = None  # AdaptiveController for the current sender when config.adaptive
+        self.running = False
+        self._thread = None
+        self._pipeline = None
+        self._sender = None
+        self._sender_key = None
+        self._capture = None
+        self._tracker = None  # RegionTracker when config.window / config.auto_crop is set
+        self._tracker_key = None
+        self._local = threading.local()  # per-thread converter/packer (reused buffers)
+
+        # Delta streaming state: last packed frame known to be on the device
+        self._prev_packed = None
+        self._prev_host = None
+        self._last_full_send = 0.0
+        self._last_send = 0.0
+        self._signature = BandSignature()
+        self._signature_key = None
+        self._keepalive_row = 0
+
+    # ---- frame stages -------------------------------------------------------
+
+    def _converter(self):
+        conv = getattr(self._local, "conv", None)
+        if conv is None:
+            conv = self._local.conv = Bgra4BitConverter()
+        return conv
+
+    def _packer(self):
+        packer = getattr(self._local, "packer", None)
+        if packer is None:
+            packer = self._local.packer = FramePacker()
+        return packer
+
+    def capture_region(self):
+        """(x, y, w, h) to grab: config.region, or the tracked window / content crop"""
+        cfg = self.config
+        if not cfg.window and not cfg.auto_crop:
+            return cfg.region
+        key = (cfg.window, cfg.auto_crop, tuple(cfg.region))
+        if self._tracker is None or self._tracker_key != key:
+            self._tracker = RegionTracker(cfg.region, window=cfg.window, auto_crop=cfg.auto_crop,
+                                          screen=self._capture.screen_bounds(), log=self._log)
+            self._tracker_key = key
+        return self._tracker.region(self._capture.grab_bgra)
+
+    def grab(self):
+        """Grab the capture region as an (h, w, 4) BGRA array"""
+        if self._capture is None:
+            self._capture = MssCapture()
+        t0 = time.perf_counter()
+        x, y, w, h = self.capture_region()
+        frame = self._capture.grab_bgra(x, y, w, h)
+        self.metrics.record("capture", time.perf_counter() - t0)
+        return frame
+
+    def encode(self, frame, force_full=False, row_mask=None):
+        """BGRA frame -> (packed, bands, full) relative to the device baseline.
+
+        row_mask (from the frame signature) limits quantize/pack to the changed rows
+        of a panel-sized frame; the other rows are taken from the baseline.
+        """
+        cfg = self.config
+        m = self.metrics
+        prev = self._baseline(force_full)
+        t0 = time.perf_counter()
+        if row_mask is not None and prev is not None and frame.shape[:2] == (PANEL_HEIGHT, PANEL_WIDTH):
+            rows = np.flatnonzero(row_mask)
+            g4 = self._converter().convert_rows(frame, rows, invert=cfg.invert, dither=cfg.dither)
+            t1 = time.perf_counter()
+            packed = self._packer().pack_rows(g4, rows, prev.copy())
+        else:
+            g4 = self._converter().convert(frame, invert=cfg.invert, dither=cfg.dither, resample=cfg.resample)
+            t1 = time.perf_counter()
+            packed = self._packer().pack(g4)
+        t2 = time.perf_counter()
+        m.record("quantize", t1 - t0)
+        m.record("pack", t2 - t1)
+        bands = changed_row_bands(prev, packed, self.chunk_rows())
+        m.record("delta", time.perf_counter() - t2)
+        return packed, bands, prev is None
+
+    def _baseline(self, force_full=False):
+        """Packed frame the next delta is computed against, or None when a full frame is due"""
+        cfg = self.config
+        if (force_full or not cfg.delta or cfg.host != self._prev_host
+                or time.time() - self._last_full_send >= cfg.delta_refresh_s):
+            return None
+        return self._prev_packed
+
+    def _set_baseline(self, packed, full):
+        self._prev_packed = packed
+        self._prev_host = self.config.host
+        if full:
+            self._last_full_send = time.time()
+
+    def _ensure_sender(self):
+        cfg = self.config
+        key = (cfg.transport, cfg.host, cfg.ws_port, cfg.adaptive, cfg.compress, cfg.ws_window)
+        if self._sender is not None and self._sender_key != key:
+            self._close_sender()
+        sender = self._sender
+        if sender is None:
+            self._adaptive = None
+            if cfg.adaptive:
+                ceiling = WS_MAX_CHUNK_ROWS if cfg.transport == "ws" else MAX_CHUNK_ROWS
+                self._adaptive = AdaptiveController(cfg.fps, cfg.rows_per_chunk, ceiling,
+                                                    target_latency_s=cfg.target_latency_s)
+            on_sent, on_err = self._on_sent, self._on_chunk_error
+            if cfg.transport == "http":
+                sender = HttpChunkSender(cfg.host, log=self._log, on_sent=on_sent, on_chunk_error=on_err,
+                                         compress=cfg.compress)
+            elif cfg.transport == "upload":
+                sender = HttpUploadSender(cfg.host, log=self._log, on_sent=on_sent)
+            else:
+                # Pipelined mode keeps only the newest frame waiting so stale frames are never sent
+                max_frames = cfg.max_frames or (1 if self._pipeline is not None else 2)
+                sender = WsStreamSession(cfg.host, port=cfg.ws_port, max_frames=max_frames,
+                                         log=self._log, on_sent=on_sent, on_chunk_error=on_err,
+                                         compress=cfg.compress, window=cfg.ws_window,
+                                         on_frame_ack=self._on_frame_ack)
+            sender.start()
+            self._seen.pop("frames_dropped", None)
+            self._seen.pop("reconnects", None)
+            self._sender = sender
+            self._sender_key = key
+        return sender
+
+    def _close_sender(self):
+        sender, self._sender = self._sender, None
+        if sender is None:
+            return
+        sender.stop()
+        self._sync_counters(sender)
+        self._log(f"Session closed: {sender.frames_sent} frames sent, "
+                  f"{sender.frames_dropped} dropped, {sender.reconnects} reconnects")
+
+    def _close_capture(self):
+        capture, self._capture = self._capture, None
+        if capture is not None:
+            capture.close()
+
+    def _on_sent(self, nbytes, seconds):
+        self.metrics.frame_sent(nbytes, seconds)
+        adaptive = self._adaptive
+        if adaptive is not None:
+            adaptive.on_sent(nbytes, seconds)
+
+    def _on_frame_ack(self, apply_s, rejected):
+        self.metrics.record("device", apply_s)
+        self.metrics.add("chunks_rejected", rejected)
+
+    def _on_chunk_error(self, limit):
+        adaptive = self._adaptive
+        if adaptive is not None:
+            adaptive.on_chunk_error(limit)
+
+    def interval(self):
+        """Seconds between captures: the adaptive rate when enabled, else config.fps"""
+        adaptive = self._adaptive
+        if self.config.adaptive and adaptive is not None:
+            return adaptive.interval
+        return self.config.interval
+
+    def chunk_rows(self):
+        """Rows per chunk, never above what the current sender has learned it can deliver"""
+        adaptive = self._adaptive
+        rows = adaptive.rows if self.config.adaptive and adaptive is not None else self.config.rows_per_chunk
+        limit = getattr(self._sender, "chunk_limit", None)
+        return rows if limit is None else max(1, min(rows, limit))
+
+    def _sync_counters(self, sender):
+        """Fold cumulative sender/pipeline counters into metrics as deltas"""
+        sources = [(sender, "frames_dropped", "frames_dropped"), (sender, "reconnects", "reconnects"),
+                   (self._pipeline, "stale_dropped", "stale_dropped")]
+        for obj, attr, counter in sources:
+            if obj is None:
+                continue
+            cur = getattr(obj, attr)
+            self.metrics.add(counter, cur - self._seen.get(attr, 0))
+            self._seen[attr] = cur
+
+    def _frame_changes(self, frame):
+        """Per-row changed mask vs the last processed frame (None: unknown / settings changed)"""
+        cfg = self.config
+        key = (cfg.invert, cfg.dither, cfg.resample, cfg.region, cfg.host)
+        if key != self._signature_key:
+            self._signature.reset()
+            self._signature_key = key
+        t0 = time.perf_counter()
+        mask = self._signature.update(frame)
+        self.metrics.record("signature", time.perf_counter() - t0)
+        return mask
+
+    def _keepalive(self, sender):
+        """Resend one chunk of the baseline, rotating over the panel, if the link has been idle"""
+        cfg = self.config
+        if (cfg.keepalive_s <= 0 or self._prev_packed is None
+                or time.time() - self._last_send < cfg.keepalive_s):
+            return
+        rows = self.chunk_rows()
+        row_start = self._keepalive_row if self._keepalive_row < PANEL_HEIGHT else 0
+        band = (row_start, min(rows, PANEL_HEIGHT - row_start))
+        self._keepalive_row = row_start + band[1]
+        sender.submit(self._prev_packed, [band], rows)
+        self._last_send = time.time()
+        self.metrics.add("keepalives")
+
+    def process(self, frame):
+        """Encode one captured frame and hand it to the transport"""
+        sender = self._ensure_sender()
+        try:
+            resync = sender.take_resync()
+            row_mask = self._frame_changes(frame) if self.config.skip_identical else None
+            if (row_mask is not None and not resync and not row_mask.any()
+                    and self._prev_packed is not None):
+                self.metrics.add("frames_skipped")
+                self._keepalive(sender)
+                return
+            packed, bands, full = self.encode(frame, force_full=resync, row_mask=row_mask)
+            self._submit(sender, packed, bands, full)
+        except Exception:
+            self._prev_packed = None
+            self._signature.reset()
+            self.metrics.add("errors")
+            raise
+        finally:
+            self._sync_counters(sender)
+
+    def deliver(self, packed):
+        """Send a frame packed elsewhere (stream_fanout encodes once for several devices).
+
+        packed must not be modified afterwards; passing the same object again means
+        the content is unchanged, which only drives the keepalive.
+        """
+        sender = self._ensure_sender()
+        try:
+            resync = sender.take_resync()
+            if packed is self._prev_packed and not resync:
+                self.metrics.add("frames_skipped")
+                self._keepalive(sender)
+                return
+            prev = self._baseline(resync)
+            t0 = time.perf_counter()
+            bands = changed_row_bands(prev, packed, self.chunk_rows())
+            self.metrics.record("delta", time.perf_counter() - t0)
+            self._submit(sender, packed, bands, prev is None)
+        except Exception:
+            self._prev_packed = None
+            self.metrics.add("errors")
+            raise
+        finally:
+            self._sync_counters(sender)
+
+    def _submit(self, sender, packed, bands, full):
+        """Hand the bands to the sender, then advance the baseline and the adaptive controller"""
+        if bands:
+            t0 = time.perf_counter()
+            if not sender.submit(packed, bands, self.chunk_rows()) and self._adaptive is not None:
+                self._adaptive.on_backpressure()
+            self.metrics.record("submit", time.perf_counter() - t0)
+            self._last_send = time.time()
+        if self._adaptive is not None:
+            self._adaptive.max_fps = self.config.fps
+        if self._adaptive is not None and self._adaptive.update(sender.pending()):
+            self.metrics.set_gauge("target_fps", round(self._adaptive.fps, 2))
+            self.metrics.set_gauge("chunk_rows", self._adaptive.rows)
+        self._set_baseline(packed, full)
+        if not bands:
+            self._keepalive(sender)
+
+    # ---- control ------------------------------------------------------------
+
+    def one_shot(self):
+        """Capture and send one full frame over a one-off connection; returns bytes sent"""
+        cfg = self.config
+        packed, bands, _ = self.encode(self.grab(), force_full=True)
+        if cfg.transport in ("http", "upload"):
+            sender_cls = HttpUploadSender if cfg.transport == "upload" else HttpChunkSender
+            sender = sender_cls(cfg.host, log=self._log, compress=cfg.compress)
+            try:
+                sender.submit(packed, bands, self.chunk_rows())
+            finally:
+                sender.stop()
+        else:
+            send_frame_ws(cfg.host, packed, bands, port=cfg.ws_port, compress=cfg.compress)
+        return sum(rows for _, rows in bands) * packed.shape[1]
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._prev_packed = None
+        self._seen = {}
+        if self.config.rtt_interval_s > 0:
+            try:
+                self._rtt_probe = RttProbe(self.metrics, lambda: self.config.host,
+                                           self.config.rtt_interval_s)
+                self._rtt_probe.start()
+            except RuntimeError as e:
+                self._log(f"RTT probe disabled: {e}")
+        capture, process, interval = self._stages()
+        if self.source is not None:
+            self.source.start()
+        if self.config.pipelined:
+            # capture thread -> conversion worker -> transport sender
+            self._pipeline = FramePipeline(capture, process, interval, log=self._log)
+            self._pipeline.start()
+        else:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def _stages(self):
+        """(capture, process, interval) for screen capture or the playback source"""
+        if self.source is not None:
+            # next_frame() paces itself at the source frame rate and returns packed frames
+            return self.source.next_frame, self.deliver, lambda: 0.0
+        return self.grab, self.process, self.interval
+
+    def stop(self):
+        self.running = False
+        if self.source is not None:
+            self.source.stop()
+        probe, self._rtt_probe = self._rtt_probe, None
+        if probe is not None:
+            probe.stop()
+        pipeline, self._pipeline = self._pipeline, None
+        if pipeline is not None:
+            pipeline.stop()
+            self.metrics.add("stale_dropped", pipeline.stale_dropped - self._seen.get("stale_dropped", 0))
+            self._log(f"Pipeline: {pipeline.captured} captured, {pipeline.processed} sent, "
+                      f"{pipeline.stale_dropped} stale dropped")
+            self._close_sender()
+            self._close_capture()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(2.0)
+
+    def close(self):
+        """Close the transport session of an engine driven through deliver()"""
+        self._close_sender()
+        self._prev_packed = None
+
+    def _loop(self):
+        capture, process, interval = self._stages()
+        while self.running:
+            t0 = time.time()
+            try:
+                item = capture()
+                if item is not None:
+                    process(item)
+            except Exception as e:
+                self._log(f"Loop error: {e}")
+            sleep_left = max(0.0, interval() - (time.time() - t0))
+            time.sleep(sleep_left)
+        self._close_sender()
+        self._close_capture()
+
+
+def _build_config(args):
+    return StreamConfig(host=args.host, fps=args.fps, region=parse_region(args.region),
+                        invert=args.invert, delta=not args.no_delta, chunk_rows=args.rows,
+                        transport=args.transport, pipelined=not args.sequential, ws_port=args.ws_port,
+                        rtt_interval_s=args.rtt_interval, adaptive=args.adaptive,
+                        target_latency_s=args.target_latency, compress=args.compress,
+                        skip_identical=not args.no_skip_identical, keepalive_s=args.keepalive,
+                        dither=args.dither, resample=args.resample, ws_window=args.ws_window,
+                        window=args.window, auto_crop=args.auto_crop)
+
+
+def _log_stdout(msg):
+    print(time.strftime("%H:%M:%S"), msg, flush=True)
+
+
+def _run_engine(engine, args, banner, finished=None):
+    """Start engine (plus metrics exporters), wait for Ctrl-C / --duration / finished(), stop"""
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *a: stop.set())
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    exporters = []
+    if args.metrics_port:
+        server = MetricsServer(engine.metrics, args.metrics_port, args.metrics_bind)
+        server.start()
+        exporters.append(server)
+        _log_stdout(f"Metrics: {server.url()}")
+    if args.metrics_jsonl:
+        writer = JsonlWriter(engine.metrics, args.metrics_jsonl)
+        writer.start()
+        exporters.append(writer)
+    engine.start()
+    _log_stdout(banner)
+    deadline = time.time() + args.duration if args.duration > 0 else None
+    while not stop.wait(0.5):
+        if (deadline is not None and time.time() >= deadline) or (finished is not None and finished()):
+            break
+    engine.stop()
+    for exporter in exporters:
+        exporter.stop()
+    _log_stdout(engine.metrics.summary_line())
+    _log_stdout("Stopped")
+    return 0
+
+
+def cmd_stream(args):
+    engine = StreamEngine(_build_config(args), log=_log_stdout)
+    return _run_engine(engine, args, f"Streaming {engine.config.region} to {args.host} via {args.transport} "
+                                     f"at {args.fps} FPS (Ctrl-C to stop)")
+
+
+def cmd_play(args):
+    from playback_source import PlaybackSource
+    from frame_cache import FrameCache
+    cache = FrameCache(args.cache, args.cache_mb << 20) if args.cache else None
+    source = PlaybackSource(args.input, fps=args.play_fps, loop=not args.no_loop, invert=args.invert,
+                            dither=args.dither, resample=args.resample, buffer_frames=args.buffer,
+                            log=_log_stdout, cache=cache)
+    engine = StreamEngine(_build_config(args), log=_log_stdout, source=source)
+    _run_engine(engine, args, f"Playing {args.input} to {args.host} via {args.transport} "
+                              f"at {source.fps:.2f} FPS (Ctrl-C to stop)",
+                finished=lambda: source.finished and (engine._sender is None or not engine._sender.pending()))
+    _log_stdout(f"Playback: {source.decoded} decoded, {source.dropped} late frames dropped, "
+                f"{source.underruns} decoder underruns")
+    return 0
+
+
+def cmd_oneshot(args):
+    engine = StreamEngine(_build_config(args), log=_log_stdout)
+    try:
+        n = engine.one_shot()
+    finally:
+        engine._close_capture()
+    _log_stdout(f"One shot via {args.transport} done ({n} bytes)")
+    return 0
+
+
+def cmd_upload(args):
+    """Upload a runtime image (.bin as is, anything else converted to packed v1) and apply it"""
+    if args.input.lower().endswith(".bin"):
+        with open(args.input, "rb") as f:
+            data = f.read()
+    else:
+        with Image.open(args.input) as img:
+            levels = quantize_image(img, PANEL_WIDTH, PANEL_HEIGHT, args.dither, args.invert, args.resample)
+        data = runtime_image.encode(levels)
+    upload_and_apply(args.host, data, log=_log_stdout, timeout=args.timeout,
+                     chunked=False if args.single else None, skip_same=not args.force)
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m stream_engine",
+                                 description="Stream a desktop region to the ESP32-S2 JBD013VGA panel")
+    sub = ap.add_subparsers(dest="command", required=True)
+    for name, func, help_text in (("stream", cmd_stream, "stream continuously"),
+                                  ("oneshot", cmd_oneshot, "send a single full frame"),
+                                  ("play", cmd_play, "stream a video file or image sequence")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--host", required=True, help="device IP / hostname")
+        p.add_argument("--fps", type=float, default=1.0)
+        p.add_argument("--region", default="0,0,640,480", help="capture region x,y,w,h")
+        p.add_argument("--window", help="capture the window whose title contains this text (needs pygetwindow)")
+        p.add_argument("--auto-crop", action="store_true",
+                       help="capture only the content bounding box of the window / region, snapped to 640x480 multiples")
+        p.add_argument("--transport", choices=TRANSPORTS, default="ws")
+        p.add_argument("--ws-port", type=int, default=81, help="WebSocket port (device: 81)")
+        p.add_argument("--ws-window", type=int, default=WS_DEFAULT_WINDOW,
+                       help="WS chunks in flight when the device acks them (0 = no flow control)")
+        p.add_argument("--rows", type=int, default=None, help="rows per chunk, 1..60 (default: 10 ws, 60 http)")
+        p.add_argument("--invert", action="store_true")
+        p.add_argument("--dither", choices=LIVE_MODES, default="none", help="4-bit quantization dither")
+        p.add_argument("--resample", choices=RESAMPLE_METHODS, default="lanczos",
+                       help="filter for regions that are not 640x480 (box/bilinear are faster)")
+        p.add_argument("--no-delta", action="store_true", help="always send full frames")
+        p.add_argument("--sequential", action="store_true", help="single-threaded loop instead of pipeline")
+        p.add_argument("--duration", type=float, default=0.0, help="stop after N seconds (0 = until Ctrl-C)")
+        p.add_argument("--adaptive", action="store_true",
+                       help="adapt FPS (up to --fps) and rows per chunk to measured throughput")
+        p.add_argument("--target-latency", type=float, default=0.25, help="adaptive latency target (s)")
+        p.add_argument("--compress", action="store_true", help="RLE-compress chunks (needs RLE firmware)")
+        p.add_argument("--no-skip-identical", action="store_true",
+                       help="re-encode and send frames even when the capture is unchanged")
+        p.add_argument("--keepalive", type=float, default=2.0, help="idle keepalive chunk period (s, 0 = off)")
+        p.add_argument("--rtt-interval", type=float, default=5.0, help="runtime-status RTT probe period (0 = off)")
+        p.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus /metrics on this port")
+        p.add_argument("--metrics-bind", default="127.0.0.1",
+                       help="address the metrics server listens on (0.0.0.0 = all interfaces)")
+        p.add_argument("--metrics-jsonl", help="append a metrics snapshot per second to this file")
+        if name == "play":
+            p.add_argument("--input", required=True, help="video file, image, directory or glob of images")
+            p.add_argument("--play-fps", type=float, default=None,
+                           help="playback frame rate (default: the source's, else 10)")
+            p.add_argument("--no-loop", action="store_true", help="stop at the end instead of looping")
+            p.add_argument("--buffer", type=int, default=32, help="pre-converted frames kept ahead")
+            p.add_argument("--cache", help="frame cache directory (converted clips are reused across runs)")
+            p.add_argument("--cache-mb", type=int, default=512, help="frame cache size limit (MiB)")
+        p.set_defaults(func=func)
+    p = sub.add_parser("upload", help="store an image as the device's runtime image and apply it")
+    p.add_argument("--host", required=True, help="device IP / hostname")
+    p.add_argument("--input", required=True, help="runtime .bin, or an image to convert")
+    p.add_argument("--invert", action="store_true")
+    p.add_argument("--dither", choices=DITHER_MODES, default="floyd-steinberg")
+    p.add_argument("--resample", choices=RESAMPLE_METHODS, default="lanczos")
+    p.add_argument("--force", action="store_true", help="upload even if the device already has this image")
+    p.add_argument("--single", action="store_true", help="one /upload request instead of the resumable chunked upload")
+    p.add_argument("--timeout", type=float, default=10.0)
+    p.set_defaults(func=cmd_upload)
+    args = ap.parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
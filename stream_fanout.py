@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+One capture streamed to several devices (e.g. a set of AR-LDC headsets)
+- A single capture of the bounding box of all device regions per frame
+- Quantize/pack runs once per distinct (region, invert, dither, resample) group,
+  with the same per-band skip-identical / changed-rows re-encode as StreamEngine
+- Each device has its own StreamEngine (delta baseline, persistent WebSocket or HTTP
+  sender with its own queue, keepalive, adaptive rows) fed by its own thread through a
+  latest-wins slot: a slow or disconnected device drops its own stale frames and never
+  holds up the encoder or the other devices
+- CLI: python -m stream_fanout --fps 10 --device 192.168.1.10 --device 192.168.1.11
+       python -m stream_fanout --fps 10 --devices headsets.json
+  (headsets.json: list of StreamConfig keyword objects, e.g. {"host": "...", "invert": true})
+"""
+
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+
+import numpy as np
+
+from frame_packer import PANEL_HEIGHT, PANEL_WIDTH, FramePacker
+from frame_signature import BandSignature
+from quantizer import LIVE_MODES
+from resampler import RESAMPLE_METHODS
+from screen_capture import Bgra4BitConverter, MssCapture
+from stream_engine import TRANSPORTS, StreamConfig, StreamEngine, parse_region
+from stream_metrics import StreamMetrics
+from stream_pipeline import FramePipeline, LatestSlot
+from stream_transport import WS_DEFAULT_WINDOW
+
+
+def encode_key(cfg):
+    """Settings that change the packed frame; devices with equal keys share one encode"""
+    return (tuple(cfg.region), cfg.invert, cfg.dither, cfg.resample)
+
+
+class _EncodeGroup:
+    """Quantize/pack state for one encode key (used from the pipeline worker thread only)"""
+
+    def __init__(self, key):
+        self.key = key
+        self.signature = BandSignature()
+        self.converter = Bgra4BitConverter()
+        self.packer = FramePacker()
+        self.packed = None  # newest packed frame; never modified once handed out
+
+    def encode(self, frame, metrics, skip_identical=True):
+        _, invert, dither, resample = self.key
+        mask = None
+        if skip_identical:
+            t0 = time.perf_counter()
+            mask = self.signature.update(frame)
+            metrics.record("signature", time.perf_counter() - t0)
+            if mask is not None and self.packed is not None and not mask.any():
+                return self.packed
+        t0 = time.perf_counter()
+        if mask is not None and self.packed is not None and frame.shape[:2] == (PANEL_HEIGHT, PANEL_WIDTH):
+            rows = np.flatnonzero(mask)
+            g4 = self.converter.convert_rows(frame, rows, invert=invert, dither=dither)
+            t1 = time.perf_counter()
+            packed = self.packer.pack_rows(g4, rows, self.packed.copy())
+        else:
+            g4 = self.converter.convert(frame, invert=invert, dither=dither, resample=resample)
+            t1 = time.perf_counter()
+            packed = self.packer.pack(g4)
+        metrics.record("quantize", t1 - t0)
+        metrics.record("pack", time.perf_counter() - t1)
+        self.packed = packed
+        return packed
+
+
+class _Device:
+    """A device engine plus the thread that feeds it packed frames"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.slot = LatestSlot()
+        self.thread = None
+        self.stale_seen = 0
+
+    @property
+    def config(self):
+        return self.engine.config
+
+
+class StreamFanout:
+    """Capture once, encode once per distinct setting, send to every configured device.
+
+    configs: one StreamConfig per device. The capture rate is `fps` (default: the
+    highest device fps); per-device fps is not applied. Device configs may be edited
+    while running; encode groups follow the current settings.
+    """
+
+    def __init__(self, configs, fps=None, log=None, metrics=None):
+        if not configs:
+            raise ValueError("at least one device config is needed")
+        self._log = log or (lambda msg: None)
+        self.fps = fps or max(cfg.fps for cfg in configs)
+        self.metrics = metrics or StreamMetrics()  # shared capture / encode stages
+        self.devices = [_Device(StreamEngine(cfg, log=self._device_log(cfg))) for cfg in configs]
+        self._groups = {}
+        self._capture = None
+        self._pipeline = None
+        self.running = False
+
+    def _device_log(self, cfg):
+        return lambda msg: self._log(f"[{cfg.host}] {msg}")
+
+    def interval(self):
+        return 1.0 / self.fps if self.fps > 0 else 1.0
+
+    def bounding_region(self):
+        """(x, y, w, h) covering every device region"""
+        regions = [d.config.region for d in self.devices]
+        x0 = min(r[0] for r in regions)
+        y0 = min(r[1] for r in regions)
+        x1 = max(r[0] + r[2] for r in regions)
+        y1 = max(r[1] + r[3] for r in regions)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def grab(self):
+        """One capture of the bounding region: (origin, (h, w, 4) BGRA array)"""
+        if self._capture is None:
+            self._capture = MssCapture()
+        x, y, w, h = self.bounding_region()
+        t0 = time.perf_counter()
+        frame = self._capture.grab_bgra(x, y, w, h)
+        self.metrics.record("capture", time.perf_counter() - t0)
+        return (x, y), frame
+
+    def process(self, item):
+        """Encode each group's crop once and post the result to its devices"""
+        (ox, oy), frame = item
+        groups = {}
+        for dev in self.devices:
+            groups.setdefault(encode_key(dev.config), []).append(dev)
+        for key in list(self._groups):
+            if key not in groups:
+                del self._groups[key]
+        for key, devs in groups.items():
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = _EncodeGroup(key)
+            x, y, w, h = key[0]
+            crop = frame[y - oy:y - oy + h, x - ox:x - ox + w]
+            skip = all(d.config.skip_identical for d in devs)
+            packed = group.encode(crop, self.metrics, skip_identical=skip)
+            for dev in devs:
+                dev.slot.put(packed)
+
+    def _device_loop(self, dev):
+        engine = dev.engine
+        while self.running:
+            packed = dev.slot.get(timeout=0.2)
+            stale = dev.slot.overwritten
+            engine.metrics.add("stale_dropped", stale - dev.stale_seen)
+            dev.stale_seen = stale
+            if packed is None:
+                continue
+            try:
+                engine.deliver(packed)
+            except Exception as e:
+                engine._log(f"Send error: {e}")
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._groups = {}
+        for dev in self.devices:
+            dev.slot = LatestSlot()
+            dev.stale_seen = 0
+            dev.thread = threading.Thread(target=self._device_loop, args=(dev,), daemon=True)
+            dev.thread.start()
+        self._pipeline = FramePipeline(self.grab, self.process, self.interval, log=self._log)
+        self._pipeline.start()
+
+    def stop(self):
+        self.running = False
+        pipeline, self._pipeline = self._pipeline, None
+        if pipeline is not None:
+            pipeline.stop()
+            self.metrics.add("stale_dropped", pipeline.stale_dropped)
+        for dev in self.devices:
+            dev.slot.close()
+            if dev.thread is not None:
+                dev.thread.join(2.0)
+                dev.thread = None
+            dev.engine.close()
+        capture, self._capture = self._capture, None
+        if capture is not None:
+            capture.close()
+
+    def summary_lines(self):
+        stages = self.metrics.snapshot()["stages"]
+        parts = [f"{s} {'-' if stages[s]['p50_ms'] is None else stages[s]['p50_ms']} ms"
+                 for s in ("capture", "quantize", "pack")]
+        lines = [f"encode: {len(self._groups)} group(s) | " + " | ".join(parts)]
+        for dev in self.devices:
+            lines.append(f"{dev.config.host}: {dev.engine.metrics.summary_line()}")
+        return lines
+
+
+def _load_configs(args):
+    common = dict(fps=args.fps, region=parse_region(args.region), invert=args.invert,
+                  transport=args.transport, ws_port=args.ws_port, chunk_rows=args.rows,
+                  delta=not args.no_delta, compress=args.compress, dither=args.dither,
+                  resample=args.resample, max_frames=args.queue, rtt_interval_s=0,
+                  ws_window=args.ws_window)
+    configs = [StreamConfig(host=host, **common) for host in args.device]
+    if args.devices:
+        with open(args.devices) as f:
+            for entry in json.load(f):
+                kwargs = dict(common, **entry)
+                if isinstance(kwargs["region"], str):
+                    kwargs["region"] = parse_region(kwargs["region"])
+                configs.append(StreamConfig(**kwargs))
+    return configs
+
+
+def _log_stdout(msg):
+    print(time.strftime("%H:%M:%S"), msg, flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m stream_fanout",
+                                 description="Stream one desktop capture to several ESP32-S2 panels")
+    ap.add_argument("--device", action="append", default=[], help="device host (repeat for each device)")
+    ap.add_argument("--devices", help="JSON list of per-device StreamConfig settings (overrides flags)")
+    ap.add_argument("--fps", type=float, default=1.0)
+    ap.add_argument("--region", default="0,0,640,480", help="default capture region x,y,w,h")
+    ap.add_argument("--transport", choices=TRANSPORTS, default="ws")
+    ap.add_argument("--ws-port", type=int, default=81)
+    ap.add_argument("--ws-window", type=int, default=WS_DEFAULT_WINDOW,
+                    help="WS chunks in flight per device when it acks them (0 = no flow control)")
+    ap.add_argument("--rows", type=int, default=None, help="rows per chunk, 1..60")
+    ap.add_argument("--invert", action="store_true")
+    ap.add_argument("--no-delta", action="store_true")
+    ap.add_argument("--compress", action="store_true")
+    ap.add_argument("--dither", choices=LIVE_MODES, default="none")
+    ap.add_argument("--resample", choices=RESAMPLE_METHODS, default="lanczos")
+    ap.add_argument("--queue", type=int, default=None, help="WS frames queued per device before dropping the oldest")
+    ap.add_argument("--duration", type=float, default=0.0, help="stop after N seconds (0 = until Ctrl-C)")
+    args = ap.parse_args(argv)
+    try:
+        configs = _load_configs(args)
+        if not configs:
+            ap.error("give at least one --device or --devices file")
+        fanout = StreamFanout(configs, fps=args.fps, log=_log_stdout)
+        stop = threading.Event()
+        signal.signal(signal.SIGINT, lambda *a: stop.set())
+        signal.signal(signal.SIGTERM, lambda *a: stop.set())
+        fanout.start()
+        _log_stdout(f"Streaming {fanout.bounding_region()} to {len(configs)} devices at {fanout.fps} FPS "
+                    f"(Ctrl-C to stop)")
+        deadline = time.time() + args.duration if args.duration > 0 else None
+        while not stop.wait(0.5):  # short waits so Ctrl-C is handled on Windows too
+            if deadline is not None and time.time() >= deadline:
+                break
+        fanout.stop()
+        for line in fanout.summary_lines():
+            _log_stdout(line)
+        return 0
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
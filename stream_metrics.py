@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Streaming metrics for the screen streamer
+- StreamMetrics: rolling FPS, per-stage timings, bytes/s, counters and gauges (thread-safe)
+- Exported as Prometheus text (MetricsServer: /metrics, /metrics.json) or JSONL (JsonlWriter)
+- RttProbe times GET /api/runtime-status so Wi-Fi latency can be told apart from local stages
+"""
+
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+from stream_transport import http_base_url, http_session
+
+# device: first chunk to end marker on the device, from WS frame acks
+STAGES = ("capture", "signature", "quantize", "pack", "delta", "submit", "send", "device")
+COUNTERS = ("frames_sent", "frames_dropped", "stale_dropped", "frames_skipped", "keepalives",
+            "reconnects", "errors", "bytes_sent", "chunks_rejected")
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[i]
+
+
+class StreamMetrics:
+    """Rolling-window stage timings and rates plus cumulative counters"""
+
+    def __init__(self, window_s=5.0):
+        self.window_s = window_s
+        self._lock = threading.Lock()
+        self._stages = {s: collections.deque() for s in STAGES}  # (t, seconds)
+        self._stage_totals = {s: [0, 0.0] for s in STAGES}  # count, sum (cumulative)
+        self._sent = collections.deque()  # (t, nbytes) per delivered frame
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {"rtt_seconds": None}
+        self.started = time.time()
+
+    def _trim(self, dq, now):
+        limit = now - self.window_s
+        while dq and dq[0][0] < limit:
+            dq.popleft()
+
+    def record(self, stage, seconds):
+        now = time.time()
+        with self._lock:
+            dq = self._stages[stage]
+            dq.append((now, seconds))
+            self._trim(dq, now)
+            total = self._stage_totals[stage]
+            total[0] += 1
+            total[1] += seconds
+
+    def frame_sent(self, nbytes, seconds=None):
+        """A frame reached the device (called by the transport once all its bands are written)"""
+        now = time.time()
+        with self._lock:
+            self._sent.append((now, nbytes))
+            self._trim(self._sent, now)
+            self.counters["frames_sent"] += 1
+            self.counters["bytes_sent"] += nbytes
+        if seconds is not None:
+            self.record("send", seconds)
+
+    def add(self, counter, n=1):
+        if n:
+            with self._lock:
+                self.counters[counter] += n
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """Plain dict of the current window (times in ms, rates per second)"""
+        now = time.time()
+        with self._lock:
+            self._trim(self._sent, now)
+            span = min(self.window_s, max(1e-6, now - self.started))
+            stages = {}
+            for s, dq in self._stages.items():
+                self._trim(dq, now)
+                vals = sorted(v for _, v in dq)
+                stages[s] = {
+                    "p50_ms": None if not vals else round(_percentile(vals, 0.5) * 1000, 3),
+                    "p95_ms": None if not vals else round(_percentile(vals, 0.95) * 1000, 3),
+                    "max_ms": None if not vals else round(vals[-1] * 1000, 3),
+                }
+            rtt = self.gauges.get("rtt_seconds")
+            return {
+                "time": round(now, 3),
+                "fps": round(len(self._sent) / span, 2),
+                "bytes_per_second": round(sum(n for _, n in self._sent) / span, 1),
+                "stages": stages,
+                "counters": dict(self.counters),
+                "rtt_ms": None if rtt is None else round(rtt * 1000, 1),
+                "target_fps": self.gauges.get("target_fps"),
+                "chunk_rows": self.gauges.get("chunk_rows"),
+            }
+
+    def summary_line(self):
+        """One-line text for the GUI overlay"""
+        snap = self.snapshot()
+        parts = [f"FPS {snap['fps']:.1f}"]
+        for s in ("capture", "quantize", "pack", "send"):
+            p50 = snap["stages"][s]["p50_ms"]
+            parts.append(f"{s} {'-' if p50 is None else f'{p50:.1f}'} ms")
+        c = snap["counters"]
+        parts.append(f"{snap['bytes_per_second'] / 1024:.0f} KiB/s")
+        parts.append(f"drops {c['frames_dropped'] + c['stale_dropped']}")
+        parts.append(f"skipped {c['frames_skipped']}")
+        parts.append(f"reconnects {c['reconnects']}")
+        device = snap["stages"]["device"]["p50_ms"]
+        if device is not None:
+            parts.append(f"device {device:.1f} ms")
+        if c["chunks_rejected"]:
+            parts.append(f"rejected {c['chunks_rejected']}")
+        rtt = snap["rtt_ms"]
+        parts.append(f"RTT {'-' if rtt is None else f'{rtt:.0f}'} ms")
+        if snap["target_fps"] is not None:
+            parts.append(f"adaptive {snap['target_fps']:.1f} fps x {snap['chunk_rows']} rows")
+        return " | ".join(parts)
+
+    def prometheus_text(self):
+        snap = self.snapshot()
+        with self._lock:
+            totals = {s: list(v) for s, v in self._stage_totals.items()}
+        out = [
+            "# HELP streamer_fps Frames delivered to the device per second (rolling window)",
+            "# TYPE streamer_fps gauge",
+            f"streamer_fps {snap['fps']}",
+            "# HELP streamer_bytes_per_second Payload bytes sent per second (rolling window)",
+            "# TYPE streamer_bytes_per_second gauge",
+            f"streamer_bytes_per_second {snap['bytes_per_second']}",
+            "# HELP streamer_stage_seconds Per-frame stage time (rolling window quantiles)",
+            "# TYPE streamer_stage_seconds summary",
+        ]
+        for s, st in snap["stages"].items():
+            for q, key in (("0.5", "p50_ms"), ("0.95", "p95_ms")):
+                if st[key] is not None:
+                    out.append(f'streamer_stage_seconds{{stage="{s}",quantile="{q}"}} {st[key] / 1000:.6f}')
+            out.append(f'streamer_stage_seconds_count{{stage="{s}"}} {totals[s][0]}')
+            out.append(f'streamer_stage_seconds_sum{{stage="{s}"}} {totals[s][1]:.6f}')
+        for name, value in snap["counters"].items():
+            out.append(f"# TYPE streamer_{name}_total counter")
+            out.append(f"streamer_{name}_total {value}")
+        for name, help_text in (("target_fps", "Adaptive controller frame rate"),
+                                ("chunk_rows", "Adaptive controller rows per chunk")):
+            if snap[name] is not None:
+                out.append(f"# HELP streamer_{name} {help_text}")
+                out.append(f"# TYPE streamer_{name} gauge")
+                out.append(f"streamer_{name} {snap[name]}")
+        if snap["rtt_ms"] is not None:
+            out.append("# HELP streamer_runtime_status_rtt_seconds Round trip of GET /api/runtime-status")
+            out.append("# TYPE streamer_runtime_status_rtt_seconds gauge")
+            out.append(f"streamer_runtime_status_rtt_seconds {snap['rtt_ms'] / 1000:.4f}")
+        return "\n".join(out) + "\n"
+
+
+class MetricsServer:
+    """Serve /metrics (Prometheus text) and /metrics.json from a background thread.
+
+    Listens on localhost only unless host is given (e.g. "0.0.0.0" for all interfaces).
+    """
+
+    def __init__(self, metrics, port=9100, host="127.0.0.1"):
+        self.metrics = metrics
+        self.address = (host, port)
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/metrics.json"):
+                    body, ctype = json.dumps(metrics.snapshot()).encode(), "application/json"
+                elif self.path.startswith("/metrics"):
+                    body, ctype = metrics.prometheus_text().encode(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(self.address, Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self._httpd.server_address[1]
+
+    def url(self):
+        """http://host:port/metrics of the running server (localhost when bound to all interfaces)"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{'127.0.0.1' if host == '0.0.0.0' else host}:{port}/metrics"
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+class _Periodic:
+    """Background thread calling tick() every interval seconds until stop()"""
+
+    def __init__(self, interval, tick):
+        self.interval = interval
+        self._tick = tick
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(2.0)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._tick()
+
+
+class JsonlWriter(_Periodic):
+    """Append a metrics snapshot to a JSONL file every interval seconds"""
+
+    def __init__(self, metrics, path, interval=1.0):
+        super().__init__(interval, self.write)
+        self.metrics = metrics
+        self.path = path
+
+    def write(self):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(self.metrics.snapshot()) + "\n")
+
+
+class RttProbe(_Periodic):
+    """Time GET /api/runtime-status; host() is called each time so host edits apply"""
+
+    def __init__(self, metrics, host, interval=5.0, timeout=3.0):
+        super().__init__(interval, self.probe)
+        if requests is None:
+            raise RuntimeError("requests not installed: pip install requests")
+        self.metrics = metrics
+        self.host = host
+        self.timeout = timeout
+
+    def probe(self):
+        t0 = time.perf_counter()
+        try:
+            http_session().get(http_base_url(self.host()) + "/api/runtime-status",
+                               timeout=self.timeout).raise_for_status()
+            self.metrics.set_gauge("rtt_seconds", time.perf_counter() - t0)
+        except Exception:
+            self.metrics.set_gauge("rtt_seconds", None)
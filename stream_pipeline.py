@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Staged frame pipeline for the screen streamer
+- Capture thread paced by the target FPS
+- Conversion worker (4-bit quantize, pack, delta bands, hand-off to the sender)
+- Stages are joined by single-slot queues where the latest frame wins,
+  so the frame period is the slowest stage and stale frames are never sent
+"""
+
+import threading
+import time
+
+
+class LatestSlot:
+    """Bounded (size 1) hand-off between stages: put() replaces an unconsumed item"""
+
+    _EMPTY = object()
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = self._EMPTY
+        self._closed = False
+        self.overwritten = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._item is not self._EMPTY:
+                self.overwritten += 1
+            self._item = item
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the newest item, or None on timeout/close"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not self._EMPTY or self._closed, timeout)
+            if self._item is self._EMPTY:
+                return None
+            item, self._item = self._item, self._EMPTY
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class FramePipeline:
+    """Run capture() and process(item) on separate threads joined by a LatestSlot.
+
+    capture() is called every interval() seconds; process() always receives the most
+    recent captured item and is expected to hand the result to a non-blocking sender
+    (e.g. WsStreamSession.submit), which forms the third stage.
+    """
+
+    def __init__(self, capture, process, interval, log=None):
+        self.capture = capture
+        self.process = process
+        self.interval = interval
+        self._log = log or (lambda msg: None)
+        self._slot = LatestSlot()
+        self._threads = []
+        self.running = False
+        self.captured = 0
+        self.processed = 0
+
+    @property
+    def stale_dropped(self):
+        return self._slot.overwritten
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._slot = LatestSlot()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, daemon=True),
+            threading.Thread(target=self._process_loop, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=2.0):
+        self.running = False
+        self._slot.close()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout)
+        self._threads = []
+
+    def _capture_loop(self):
+        while self.running:
+            t0 = time.time()
+            try:
+                item = self.capture()
+                if item is not None:  # None: nothing new (e.g. playback source timeout)
+                    self._slot.put(item)
+                    self.captured += 1
+            except Exception as e:
+                self._log(f"Capture error: {e}")
+            sleep_left = max(0.0, self.interval() - (time.time() - t0))
+            time.sleep(sleep_left)
+
+    def _process_loop(self):
+        while self.running:
+            item = self._slot.get(timeout=0.2)
+            if item is None:
+                continue
+            try:
+                self.process(item)
+                self.processed += 1
+            except Exception as e:
+                self._log(f"Process error: {e}")
@@ -0,0 +1,785 @@
+#!/usr/bin/env python3
+"""
+Stream transports for the ESP32-S2 screen streamer
+- WsStreamSession: one long-lived WebSocket (port 81) owned by a background asyncio loop
+- HttpChunkSender: synchronous POSTs for networks without port 81; all bands of a frame
+  go in one /stream-chunks request (WS-format chunks back to back) on a keep-alive session
+- HttpUploadSender: whole frames as packed v1 runtime images via /upload + /apply
+- upload_and_apply: one-off runtime image upload; skipped when the device already holds
+  the same v1 image (runtime-status size/format/crc32), resumable chunked upload
+  (upload_chunked) where the firmware lists "chunked"
+- Firmware that lists "raw" / "multi" in /api/runtime-status "http" takes
+  application/octet-stream bodies and /stream-chunks; older firmware gets one multipart
+  /stream-chunk POST per band
+- send_frame_ws / upload_and_apply: one-off helpers
+- Frames are packed 4-bit (480, 320) arrays plus the row bands to send
+- Chunks use the device's 4-byte little-endian header: rowStart(u16), rows(u16)
+- compress=True sends RLE chunks (chunk_codec.py) where they are smaller; needs firmware
+  that reports "rle" in /api/runtime-status "codecs"
+- A chunk the device rejects as too big (WS close 1009) or that times out lowers the
+  sender's chunk_limit and the frame is re-sent in smaller chunks instead of dropped
+- WS flow control (firmware that answers HELLO): the device acks every chunk and every
+  frame end marker, the sender keeps at most `window` chunks in flight and learns each
+  frame's device-side apply time; devices that do not answer get the plain protocol
+
+WS control messages reuse the chunk header with rowStart = 0xFFFF (older firmware drops
+any rowStart >= 480), rows = message type, then little-endian u16/u32 fields:
+    HELLO      client -> device  <HH>          device -> client  <HHHH version, window>
+    FRAME_END  client -> device  <HHH seq>     device -> client  <HHHHI seq, rejected, apply_us>
+    CHUNK_ACK                                  device -> client  <HHHH chunk count, status>
+CHUNK_ACK follows every chunk message: count is the u16 number of chunks processed on the
+connection, status 0 = applied, 1 = rejected (malformed); the frame ack reports the rejected
+chunks and the microseconds from the frame's first chunk to its end marker.
+"""
+
+import collections
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from chunk_codec import CHUNK_FLAG_RLE, encode_or_raw
+from frame_packer import WS_HEADER, FramePacker
+import runtime_image
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+try:
+    import websockets
+    import asyncio
+except ImportError:
+    websockets = None
+    asyncio = None
+
+
+PANEL_HEIGHT = 480
+WS_CLOSE_TOO_BIG = 1009
+# links2004/WebSockets drops messages above WEBSOCKETS_MAX_DATA_SIZE (15 KiB on ESP32)
+WS_MAX_CHUNK_ROWS = (15 * 1024 - 4) // 320
+OCTET_STREAM = {"Content-Type": "application/octet-stream"}
+
+WS_CONTROL_ROW = 0xFFFF
+WS_MSG_HELLO = 1
+WS_MSG_FRAME_END = 2
+WS_MSG_CHUNK_ACK = 3
+WS_CONTROL = struct.Struct('<HH')
+WS_FRAME_END = struct.Struct('<HHH')
+WS_REPLY = struct.Struct('<HHHH')  # HELLO reply, CHUNK_ACK and the head of a frame ack
+WS_FRAME_ACK = struct.Struct('<HHHHI')
+WS_DEFAULT_WINDOW = 4  # chunks in flight with flow control
+UPLOAD_CHUNK_BYTES = 8192  # /upload/chunk body size (firmware limit: chunk_max, 16 KiB)
+
+
+def mask_to_bands(mask, max_rows, merge_gap=2):
+    """Turn a per-row bool mask into [(row_start, rows), ...] with at most max_rows per band.
+
+    Runs separated by at most merge_gap unset rows are merged, since each extra chunk
+    costs a WS message plus a 1ms SPI_SYNC on the device.
+    """
+    changed = np.flatnonzero(mask)
+    if changed.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(changed) > merge_gap + 1)
+    starts = np.concatenate(([changed[0]], changed[breaks + 1]))
+    ends = np.concatenate((changed[breaks], [changed[-1]])) + 1
+    bands = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        for r in range(s, e, max_rows):
+            bands.append((r, min(max_rows, e - r)))
+    return bands
+
+
+def split_bands(bands, max_rows):
+    """Split bands so none is taller than max_rows"""
+    if max_rows is None:
+        return list(bands)
+    out = []
+    for start, rows in bands:
+        for r in range(start, start + rows, max_rows):
+            out.append((r, min(max_rows, start + rows - r)))
+    return out
+
+
+def _close_code(exc):
+    rcvd = getattr(exc, "rcvd", None)
+    return rcvd.code if rcvd is not None else getattr(exc, "code", None)
+
+
+def bands_to_mask(bands, height=PANEL_HEIGHT):
+    mask = np.zeros(height, dtype=bool)
+    for row_start, rows in bands:
+        mask[row_start:row_start + rows] = True
+    return mask
+
+
+class _Frame:
+    __slots__ = ("packed", "bands", "chunk_rows")
+
+    def __init__(self, packed, bands, chunk_rows):
+        self.packed = packed
+        self.bands = bands
+        self.chunk_rows = chunk_rows
+
+
+class WsStreamSession:
+    """Persistent WebSocket sender with reconnect/backoff and a bounded drop-oldest frame queue.
+
+    submit() never blocks on the network. When the queue is full the oldest frame is
+    dropped and its rows are folded into the next queued frame (sent with that frame's
+    newer pixels), so delta frames stay consistent on the device. After a connection
+    error the queue is cleared and take_resync() reports that a full frame is needed.
+
+    If the device closes with 1009 (message too big) or a send times out, chunk_limit
+    is halved, on_chunk_error(rows) is called and the newest frame is queued again as
+    a full frame, so the stream reconnects at once without waiting for a resync.
+
+    window > 0 asks the device for acks on connect. With flow control on_sent fires
+    when the frame ack arrives (seconds = first chunk to ack), on_frame_ack(apply_s,
+    rejected) reports the device side, and a rejected chunk requests a resync.
+    """
+
+    def __init__(self, host_ip, port=81, max_frames=2, log=None,
+                 min_backoff=0.5, max_backoff=5.0, open_timeout=5.0, on_sent=None,
+                 send_timeout=5.0, on_chunk_error=None, compress=False,
+                 window=WS_DEFAULT_WINDOW, hello_timeout=1.0, on_frame_ack=None):
+        if websockets is None or asyncio is None:
+            raise RuntimeError("websockets not installed: pip install websockets")
+        self.host_ip = host_ip
+        self.uri = f"ws://{ws_host(host_ip)}:{port}/"
+        self.max_frames = max(1, int(max_frames))
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.open_timeout = open_timeout
+        self._log = log or (lambda msg: None)
+        self._on_sent = on_sent  # on_sent(nbytes, seconds) from the loop thread
+        self._on_chunk_error = on_chunk_error
+        self.send_timeout = send_timeout
+        self.compress = compress
+        self.window = window
+        self.hello_timeout = hello_timeout
+        self._on_frame_ack = on_frame_ack
+        self._plain = False  # the device did not answer HELLO: skip it on reconnect
+        self.chunk_limit = WS_MAX_CHUNK_ROWS
+        self._last_frame = None  # newest frame taken off the queue
+        self._conn_max_rows = 0  # tallest chunk written on the current connection
+
+        self._lock = threading.Lock()
+        self._frames = collections.deque()
+        self._resync = True
+        self._stopping = False
+        self._loop = None
+        self._wakeup = None
+        self._thread = None
+
+        self.connected = False
+        self.reconnects = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self.flow_window = 0  # chunks in flight allowed on this connection (0: no acks)
+        self.chunks_rejected = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stopping = True
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._wake)
+            except RuntimeError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, packed, bands, chunk_rows):
+        """Queue a packed frame; only `bands` of it are sent. Returns False if a frame was dropped."""
+        dropped = False
+        with self._lock:
+            self._frames.append(_Frame(packed, list(bands), chunk_rows))
+            while len(self._frames) > self.max_frames:
+                old = self._frames.popleft()
+                nxt = self._frames[0]
+                mask = bands_to_mask(old.bands) | bands_to_mask(nxt.bands)
+                nxt.bands = mask_to_bands(mask, nxt.chunk_rows)
+                self.frames_dropped += 1
+                dropped = True
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+        return not dropped
+
+    def take_resync(self):
+        """True once after start or a connection error: the next frame must be a full frame."""
+        with self._lock:
+            resync = self._resync
+            self._resync = False
+        return resync
+
+    def pending(self):
+        with self._lock:
+            return len(self._frames)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _pop(self):
+        with self._lock:
+            frame = self._frames.popleft() if self._frames else None
+            if frame is not None:
+                self._last_frame = frame
+            return frame
+
+    def _shrink_and_requeue(self, reason):
+        """Lower chunk_limit below the tallest chunk of this connection and queue the newest frame in full"""
+        rows = self._conn_max_rows or self.chunk_limit
+        self.chunk_limit = max(1, min(self.chunk_limit, rows // 2))
+        self._log(f"WS {reason}: chunk rows {rows} -> {self.chunk_limit}")
+        with self._lock:
+            newest = self._frames[-1] if self._frames else self._last_frame
+            self._frames.clear()
+            if newest is not None:
+                full = [(r, min(newest.chunk_rows, PANEL_HEIGHT - r))
+                        for r in range(0, PANEL_HEIGHT, newest.chunk_rows)]
+                self._frames.append(_Frame(newest.packed, full, newest.chunk_rows))
+            else:
+                self._resync = True
+        if self._on_chunk_error is not None:
+            self._on_chunk_error(self.chunk_limit)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            try:
+                self._loop.close()
+            except Exception:
+                pass
+
+    async def _main(self):
+        self._wakeup = asyncio.Event()
+        backoff = self.min_backoff
+        while not self._stopping:
+            try:
+                async with websockets.connect(self.uri, max_size=None, ping_interval=None,
+                                              open_timeout=self.open_timeout) as ws:
+                    self.connected = True
+                    backoff = self.min_backoff
+                    self._conn_max_rows = 0
+                    self._log(f"WS connected: {self.uri}")
+                    acks = await self._handshake(ws)
+                    await self._send_frames(ws, acks)
+            except Exception as e:
+                if self._stopping:
+                    break
+                self.reconnects += 1
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                if (timed_out or _close_code(e) == WS_CLOSE_TOO_BIG) and self._conn_max_rows > 1:
+                    self._shrink_and_requeue("send timeout" if timed_out else "message too big (1009)")
+                    continue
+                with self._lock:
+                    self._frames.clear()
+                    self._resync = True
+                self._log(f"WS error: {e}; reconnecting in {backoff:.1f}s")
+                try:
+                    await asyncio.wait_for(self._wakeup_when_stopping(), timeout=backoff)
+                except asyncio.TimeoutError:
+                    pass
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                self.connected = False
+                self.flow_window = 0
+
+    async def _wakeup_when_stopping(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    async def _handshake(self, ws):
+        """Ask for acks; an _AckState, or None (plain protocol) if the device does not answer"""
+        if self.window <= 0 or self._plain:
+            return None
+        await ws.send(WS_CONTROL.pack(WS_CONTROL_ROW, WS_MSG_HELLO))
+        try:
+            reply = await asyncio.wait_for(ws.recv(), self.hello_timeout)
+        except asyncio.TimeoutError:
+            self._plain = True
+            self._log("WS: device does not ack chunks, sending without flow control")
+            return None
+        if isinstance(reply, str) or len(reply) < WS_REPLY.size:
+            return None
+        row, kind, version, window = WS_REPLY.unpack_from(reply)
+        if row != WS_CONTROL_ROW or kind != WS_MSG_HELLO:
+            return None
+        acks = _AckState(max(1, min(self.window, window)))
+        self.flow_window = acks.window
+        self._log(f"WS flow control: protocol {version}, {acks.window} chunks in flight")
+        return acks
+
+    async def _read_acks(self, ws, acks):
+        try:
+            async for msg in ws:
+                if isinstance(msg, str) or len(msg) < WS_REPLY.size:
+                    continue
+                row, kind, a, b = WS_REPLY.unpack_from(msg)
+                if row != WS_CONTROL_ROW:
+                    continue
+                if kind == WS_MSG_CHUNK_ACK:
+                    acks.acked += (a - acks.acked) & 0xFFFF
+                    if b:
+                        self.chunks_rejected += 1
+                        with self._lock:
+                            self._resync = True
+                elif kind == WS_MSG_FRAME_END and len(msg) >= WS_FRAME_ACK.size:
+                    apply_us = WS_FRAME_ACK.unpack_from(msg)[4]
+                    sent = acks.frames.pop(a, None)
+                    if sent is not None:
+                        self._frame_acked(sent, b, apply_us / 1e6)
+                acks.changed.set()
+        except Exception as e:
+            acks.error = e
+        finally:
+            if acks.error is None:
+                acks.error = ConnectionError("connection closed by device")
+            acks.changed.set()
+            self._wake()
+
+    def _frame_acked(self, sent, rejected, apply_s):
+        t0, nbytes = sent
+        self.frames_sent += 1
+        if rejected:
+            self._log(f"WS: device rejected {rejected} chunk(s), resyncing")
+        if self._on_sent is not None:
+            self._on_sent(nbytes, time.perf_counter() - t0)
+        if self._on_frame_ack is not None:
+            self._on_frame_ack(apply_s, rejected)
+
+    async def _wait_credit(self, acks):
+        """Block until fewer than acks.window chunks are unacknowledged"""
+        deadline = self._loop.time() + self.send_timeout
+        while acks.sent - acks.acked >= acks.window:
+            if acks.error is not None:
+                raise acks.error
+            acks.changed.clear()
+            left = deadline - self._loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            await asyncio.wait_for(acks.changed.wait(), left)
+
+    async def _send_frames(self, ws, acks=None):
+        reader = None
+        if acks is not None:
+            reader = asyncio.ensure_future(self._read_acks(ws, acks))
+        try:
+            await self._send_loop(ws, acks)
+        finally:
+            if reader is not None:
+                reader.cancel()
+
+    async def _send_loop(self, ws, acks):
+        packer = FramePacker()
+        while not self._stopping:
+            self._wakeup.clear()
+            if acks is not None and acks.error is not None:
+                raise acks.error
+            frame = self._pop()
+            if frame is None:
+                await self._wakeup.wait()
+                continue
+            packed = frame.packed
+            t0 = time.perf_counter()
+            nbytes = 0
+            for row_start, rows in split_bands(frame.bands, self.chunk_limit):
+                payload = packer.ws_message(packed, row_start, rows, compress=self.compress)
+                self._conn_max_rows = max(self._conn_max_rows, rows)
+                if acks is not None:
+                    await self._wait_credit(acks)
+                await asyncio.wait_for(ws.send(payload), self.send_timeout)
+                nbytes += len(payload)
+                if acks is not None:
+                    acks.sent += 1
+            self.bytes_sent += nbytes
+            if acks is not None:
+                # frames_sent / on_sent follow the device's ack of the end marker
+                seq = acks.next_seq()
+                acks.frames[seq] = (t0, nbytes)
+                await asyncio.wait_for(ws.send(WS_FRAME_END.pack(WS_CONTROL_ROW, WS_MSG_FRAME_END, seq)),
+                                       self.send_timeout)
+                continue
+            self.frames_sent += 1
+            if self._on_sent is not None:
+                self._on_sent(nbytes, time.perf_counter() - t0)
+
+
+class _AckState:
+    """Chunks in flight and unacknowledged frames of one flow-controlled connection (loop thread only)"""
+
+    def __init__(self, window):
+        self.window = window
+        self.sent = 0
+        self.acked = 0
+        self.seq = 0
+        self.frames = {}  # frame seq -> (perf_counter at first chunk, bytes)
+        self.changed = asyncio.Event()
+        self.error = None
+
+    def next_seq(self):
+        seq, self.seq = self.seq, (self.seq + 1) & 0xFFFF
+        return seq
+
+
+class HttpChunkSender:
+    """Send frames as HTTP POSTs; submit() blocks until every band is applied.
+
+    Same interface as WsStreamSession so the engine can swap transports. Uses its own
+    pooled keep-alive session; the body format follows device_http_features(), probed
+    on the first frame and again after an error.
+    """
+
+    def __init__(self, host, log=None, timeout=10.0, on_sent=None, on_chunk_error=None,
+                 compress=False):
+        if requests is None:
+            raise RuntimeError("requests not installed: pip install requests")
+        self.host_ip = host
+        self.base_url = http_base_url(host)
+        self.timeout = timeout
+        self._log = log or (lambda msg: None)
+        self._on_sent = on_sent
+        self._on_chunk_error = on_chunk_error
+        self.chunk_limit = None  # set after a chunk timed out
+        self.compress = compress
+        self.session = new_session()
+        self._features = None
+        self._resync = True
+        self.connected = False
+        self.reconnects = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=None):
+        self.session.close()
+
+    def pending(self):
+        return 0
+
+    def take_resync(self):
+        resync, self._resync = self._resync, False
+        return resync
+
+    def features(self):
+        if self._features is None:
+            self._features = device_http_features(self.base_url, self.session, self.timeout)
+            self._log(f"HTTP body formats: {', '.join(sorted(self._features)) or 'multipart'}")
+        return self._features
+
+    def _post(self, packed, batch):
+        """POST one batch of bands; returns the body bytes sent"""
+        features = self.features()
+        if "multi" in features:
+            body = chunk_batch(packed, batch, self.compress)
+            r = self.session.post(self.base_url + "/stream-chunks", data=body, headers=OCTET_STREAM,
+                                  timeout=self.timeout)
+        else:
+            (row_start, rows), = batch
+            body = FramePacker.chunk_view(packed, row_start, rows)
+            params = {'rowStart': str(row_start), 'rows': str(rows), 'packed': '1'}
+            if self.compress:
+                body, rle = encode_or_raw(body)
+                if rle:
+                    params['enc'] = 'rle'
+            body = bytes(body)
+            if "raw" in features:
+                r = self.session.post(self.base_url + "/stream-chunk", params=params, data=body,
+                                      headers=OCTET_STREAM, timeout=self.timeout)
+            else:
+                files = {'file': ('chunk.bin', body, 'application/octet-stream')}
+                r = self.session.post(self.base_url + "/stream-chunk", params=params, files=files,
+                                      timeout=self.timeout)
+        r.raise_for_status()
+        return len(body)
+
+    def _split(self, batch):
+        """Smaller batches for a timed-out one: halve the band list, or the band itself"""
+        if len(batch) > 1:
+            mid = len(batch) // 2
+            return [batch[:mid], batch[mid:]]
+        (row_start, rows), = batch
+        self.chunk_limit = max(1, rows // 2)
+        self._log(f"Chunk timeout: rows {rows} -> {self.chunk_limit}")
+        if self._on_chunk_error is not None:
+            self._on_chunk_error(self.chunk_limit)
+        return [[band] for band in split_bands(batch, self.chunk_limit)]
+
+    def submit(self, packed, bands, chunk_rows):
+        t0 = time.perf_counter()
+        nbytes = 0
+        retries = 0
+        try:
+            bands = split_bands(bands, self.chunk_limit)
+            if "multi" in self.features():
+                work = collections.deque([bands] if bands else [])
+            else:
+                work = collections.deque([band] for band in bands)
+            while work:
+                batch = work.popleft()
+                try:
+                    n = self._post(packed, batch)
+                except requests.Timeout:
+                    if (len(batch) == 1 and batch[0][1] <= 1) or retries >= 3:
+                        raise
+                    # retry in smaller pieces rather than failing the whole frame
+                    retries += 1
+                    work.extendleft(reversed(self._split(batch)))
+                    continue
+                self.bytes_sent += n
+                nbytes += n
+        except Exception:
+            if self.connected:
+                self.reconnects += 1
+            self.connected = False
+            self._resync = True
+            self._features = None  # the device may have been reflashed
+            raise
+        self.connected = True
+        self.frames_sent += 1
+        if self._on_sent is not None:
+            self._on_sent(nbytes, time.perf_counter() - t0)
+        return True
+
+
+class HttpUploadSender(HttpChunkSender):
+    """Upload each frame as a packed v1 runtime image (/upload), then /apply it.
+
+    Always sends the whole frame; bands only decide whether anything changed.
+    """
+
+    def submit(self, packed, bands, chunk_rows):
+        t0 = time.perf_counter()
+        try:
+            data = runtime_image.encode(packed=packed)
+            upload_and_apply(self.base_url, data, timeout=self.timeout, session=self.session,
+                             raw="raw" in self.features(), chunked=False, skip_same=False)
+            self.bytes_sent += len(data)
+            nbytes = len(data)
+        except Exception:
+            if self.connected:
+                self.reconnects += 1
+            self.connected = False
+            self._resync = True
+            self._features = None
+            raise
+        self.connected = True
+        self.frames_sent += 1
+        if self._on_sent is not None:
+            self._on_sent(nbytes, time.perf_counter() - t0)
+        return True
+
+
+def chunk_batch(packed, bands, compress=False):
+    """/stream-chunks body: per band the 4-byte WS header and its raw or RLE rows, back to back"""
+    parts = []
+    for row_start, rows in bands:
+        payload, flags = FramePacker.chunk_view(packed, row_start, rows), 0
+        if compress:
+            payload, rle = encode_or_raw(payload)
+            flags = CHUNK_FLAG_RLE if rle else 0
+        parts.append(WS_HEADER.pack(row_start, rows | flags))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def new_session(pool_size=4):
+    """requests.Session with pooled keep-alive connections and no automatic retries"""
+    if requests is None:
+        raise RuntimeError("requests not installed: pip install requests")
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def http_session():
+    """Process-wide pooled session for one-off device requests (status, upload, probes)"""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = new_session()
+        return _shared_session
+
+
+def runtime_status(host, session=None, timeout=5.0):
+    """GET /api/runtime-status as a dict ({} if the device answers with an error or no JSON)"""
+    session = session or http_session()
+    r = session.get(http_base_url(host) + "/api/runtime-status", timeout=timeout)
+    if not r.ok:
+        return {}
+    try:
+        status = r.json()
+    except ValueError:
+        return {}
+    return status if isinstance(status, dict) else {}
+
+
+def http_features(status):
+    """Body formats listed in a runtime-status dict: "raw" (application/octet-stream on /upload
+    and /stream-chunk), "multi" (/stream-chunks), "chunked" (/upload/begin|chunk|commit)"""
+    return frozenset(f.strip() for f in str(status.get("http", "")).split(",") if f.strip())
+
+
+def device_http_features(host, session=None, timeout=5.0):
+    """Body formats the firmware takes besides multipart; empty for firmware without the field"""
+    return http_features(runtime_status(host, session, timeout))
+
+
+def image_on_device(status, data):
+    """True if runtime-status describes this v1 image (same size, format and data CRC)"""
+    try:
+        hdr = runtime_image.parse_header(data)
+    except runtime_image.RuntimeImageError:
+        return False
+    if hdr is None or not status.get("available"):
+        return False
+    fmt = "v1-packed" if hdr["packed"] else "v1"
+    return status.get("size") == len(data) and status.get("format") == fmt and status.get("crc32") == hdr["crc32"]
+
+
+def http_base_url(host):
+    host = host.strip().rstrip('/')
+    if not host.startswith("http"):
+        host = "http://" + host
+    return host
+
+
+def ws_host(host):
+    """Hostname part of a device address ('http://1.2.3.4:8080/' -> '1.2.3.4'); WS has its own port"""
+    host = host.strip()
+    if "://" in host:
+        host = host.split("://", 1)[1]
+    host = host.split("/", 1)[0]
+    return host.rsplit(":", 1)[0] if host.count(":") == 1 else host
+
+
+def send_frame_ws(host_ip, packed, bands, port=81, compress=False):
+    """Send bands of a packed frame over a one-off WebSocket connection (blocking)"""
+    if websockets is None or asyncio is None:
+        raise RuntimeError("websockets not installed: pip install websockets")
+    packer = FramePacker()
+
+    async def _run():
+        uri = f"ws://{ws_host(host_ip)}:{port}/"
+        async with websockets.connect(uri, max_size=None, ping_interval=None) as ws:
+            # 每块前加4字节小端头: rowStart(u16), rows(u16)，随后为rows*320字节打包数据
+            for row_start, rows in bands:
+                await ws.send(packer.ws_message(packed, row_start, rows, compress=compress))
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(_run())
+    finally:
+        try:
+            loop.close()
+        except Exception:
+            pass
+
+
+def upload_chunked(host, data_bytes, log=None, timeout=10, session=None, chunk_size=UPLOAD_CHUNK_BYTES,
+                   attempts=3):
+    """Resumable upload through /upload/begin, /upload/chunk and /upload/commit.
+
+    Chunks carry their offset and CRC-32 and go out in order, one request at a time
+    over the keep-alive session: the device only appends at its current position
+    (and serves one request at a time anyway). Every reply carries that position,
+    so a resent or unexpected chunk just moves the next offset. commit() swaps the
+    file in only after the whole-file CRC checks out. After a connection error the
+    upload resumes from the device's position (begin with the same size and CRC),
+    up to `attempts` times.
+    """
+    if requests is None:
+        raise RuntimeError("requests not installed: pip install requests")
+    log = log or (lambda msg: None)
+    base = http_base_url(host)
+    session = session or http_session()
+    data = bytes(data_bytes)
+    crc = zlib.crc32(data)
+    for attempt in range(attempts):
+        try:
+            r = session.post(base + "/upload/begin", params={"size": len(data), "crc": crc}, timeout=timeout)
+            r.raise_for_status()
+            state = r.json()
+            offset = state.get("received", 0)
+            step = max(1, min(chunk_size, state.get("chunk_max", chunk_size)))
+            if offset:
+                log(f"Upload: resuming at {offset}/{len(data)} bytes")
+            while offset < len(data):
+                chunk = data[offset:offset + step]
+                r = session.post(base + "/upload/chunk", params={"offset": offset, "crc": zlib.crc32(chunk)},
+                                 data=chunk, headers=OCTET_STREAM, timeout=timeout)
+                if r.status_code != 409:
+                    r.raise_for_status()
+                elif "json" not in r.headers.get("Content-Type", ""):
+                    raise RuntimeError(f"upload session lost on the device: {r.text.strip()}")
+                received = r.json().get("received", 0)
+                if r.status_code == 409 and received == offset:
+                    raise RuntimeError(f"device did not accept the chunk at offset {offset}")
+                offset = received
+            r = session.post(base + "/upload/commit", timeout=timeout)
+            r.raise_for_status()
+            return r.text.strip()
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt + 1 >= attempts:
+                raise
+            log(f"Upload interrupted ({e}); resuming")
+
+
+def upload_and_apply(host, data_bytes, log=None, timeout=10, session=None, raw=None, chunked=None,
+                     skip_same=True):
+    """Upload a runtime image, then /apply it.
+
+    skip_same: do not upload when the device already holds this v1 image.
+    chunked: resumable upload_chunked() instead of one /upload request; raw: send the
+    /upload body as application/octet-stream instead of multipart (None: whatever
+    the device's runtime-status lists).
+    """
+    if requests is None:
+        raise RuntimeError("requests not installed: pip install requests")
+    log = log or (lambda msg: None)
+    base = http_base_url(host)
+    session = session or http_session()
+    status = runtime_status(base, session, timeout) if skip_same or raw is None or chunked is None else {}
+    features = http_features(status)
+    if skip_same and image_on_device(status, data_bytes):
+        log("Upload: skipped, the device already has this image")
+    elif chunked or (chunked is None and "chunked" in features):
+        log(f"Upload: {upload_chunked(base, data_bytes, log, timeout, session)}")
+    else:
+        if raw if raw is not None else "raw" in features:
+            r = session.post(base + "/upload", data=bytes(data_bytes), headers=OCTET_STREAM, timeout=timeout)
+        else:
+            files = {"file": ("current_image.bin", data_bytes, "application/octet-stream")}
+            r = session.post(base + "/upload", files=files, timeout=timeout)
+        r.raise_for_status()
+        log(f"Upload: {r.text.strip()}")
+    r2 = session.post(base + "/apply", timeout=timeout)
+    r2.raise_for_status()
+    log(f"Apply: {r2.text.strip()}")
@@ -0,0 +1,23 @@
+import pytest
+
+from device_emulator import DeviceEmulator
+from stream_transport import new_session
+
+
+@pytest.fixture
+def emu():
+    emu = DeviceEmulator(http_port=0, ws_port=0, realtime=False).start()
+    yield emu
+    emu.stop()
+
+
+@pytest.fixture
+def host(emu):
+    return f"127.0.0.1:{emu.http_port}"
+
+
+@pytest.fixture
+def session():
+    s = new_session()
+    yield s
+    s.close()
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from chunk_codec import (CHUNK_FLAG_RLE, MAX_LITERAL, MAX_REPEAT, encode_or_raw, encoded_size, rle_decode,
+                         rle_decode_prefix, rle_encode)
+from device_emulator import DeviceEmulator
+from frame_packer import WS_HEADER
+
+
+def samples():
+    rng = np.random.default_rng(1)
+    yield np.zeros(320 * 10, np.uint8)
+    yield rng.integers(0, 256, 320 * 10, dtype=np.uint8)
+    yield np.repeat(rng.integers(0, 4, 700, dtype=np.uint8), rng.integers(1, 9, 700))
+    for n in (1, 2, 3, 127, 128, 129, 130, 131, 132, 260, 300, 1000):
+        yield np.full(n, 0xA5, np.uint8)
+        yield np.arange(n, dtype=np.uint8)  # no repeats: literal pieces of up to 128
+    yield np.array([0, 1, 2, 3, 4] + [7] * 131 + [9, 9] + [1] * 3, np.uint8)
+
+
+@pytest.mark.parametrize("data", list(samples()), ids=lambda d: str(d.size))
+def test_roundtrip(data):
+    enc = rle_encode(data)
+    assert encoded_size(data) == len(enc)
+    assert rle_decode(enc, data.size) == data.tobytes()
+
+
+def test_empty():
+    empty = np.zeros(0, np.uint8)
+    assert rle_encode(empty) == b""
+    assert encoded_size(empty) == 0
+    assert rle_decode(b"", 0) == b""
+    assert encode_or_raw(empty) == (empty, False)
+
+
+def test_long_runs_split_at_max_repeat():
+    enc = rle_encode(np.full(2 * MAX_REPEAT, 3, np.uint8))
+    assert enc == bytes([0xFF, 3, 0xFF, 3])
+    # 131 = 130 + 1: the leftover byte goes out as a literal
+    assert rle_encode(np.full(MAX_REPEAT + 1, 3, np.uint8)) == bytes([0xFF, 3, 0x00, 3])
+    assert len(rle_encode(np.arange(MAX_LITERAL + 1, dtype=np.uint8))) == MAX_LITERAL + 3
+
+
+@pytest.mark.parametrize("bad", [
+    bytes([0x05, 1, 2]),  # literal runs past the input
+    bytes([0x85]),  # repeat without its value
+    bytes([0xFF, 1]),  # 130 bytes into a 10-byte chunk
+    bytes([0x82, 1, 0x82, 1, 0x00, 1]),  # data left after out_len
+])
+def test_malformed(bad):
+    with pytest.raises(ValueError):
+        rle_decode(bad, 10)
+
+
+def test_decode_prefix_back_to_back():
+    a, b = np.full(320, 1, np.uint8), np.arange(320, dtype=np.uint16).astype(np.uint8)
+    body = rle_encode(a) + rle_encode(b)
+    first, end = rle_decode_prefix(body, 320)
+    second, end2 = rle_decode_prefix(body, 320, end)
+    assert (first, second, end2) == (a.tobytes(), b.tobytes(), len(body))
+
+
+def test_encode_or_raw_keeps_incompressible_chunks():
+    noise = np.random.default_rng(2).integers(0, 256, 640, dtype=np.uint8)
+    payload, compressed = encode_or_raw(noise)
+    assert not compressed and payload is noise
+    payload, compressed = encode_or_raw(np.zeros(640, np.uint8))
+    assert compressed and rle_decode(payload, 640) == bytes(640)
+
+
+def test_ws_chunk_with_rle_flag_applies():
+    emu = DeviceEmulator(realtime=False)
+    rows = np.zeros((4, 320), np.uint8)
+    rows[1, 100:200] = 0x5A
+    msg = WS_HEADER.pack(10, 4 | CHUNK_FLAG_RLE) + rle_encode(rows)
+    emu.handle_ws_message(msg)
+    assert np.array_equal(emu.panel.cache[10:14], rows)
+    assert emu.stats["ws_dropped"] == 0
+    # truncated RLE data is dropped, not applied
+    emu.handle_ws_message(WS_HEADER.pack(0, 4 | CHUNK_FLAG_RLE) + rle_encode(rows + 1)[:-1])
+    assert emu.stats["ws_dropped"] == 1 and not emu.panel.cache[0].any()
+
+
+def test_stream_chunks_mixes_raw_and_rle():
+    emu = DeviceEmulator(realtime=False)
+    raw = np.full((2, 320), 0x11, np.uint8)
+    rle = np.full((3, 320), 0x22, np.uint8)
+    body = (WS_HEADER.pack(0, 2) + raw.tobytes() +
+            WS_HEADER.pack(2, 3 | CHUNK_FLAG_RLE) + rle_encode(rle))
+    assert emu.handle_stream_chunks(body) == (200, "2 chunks applied")
+    assert np.array_equal(emu.panel.cache[:5], np.concatenate([raw, rle]))
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import runtime_image
+from stream_engine import StreamConfig, StreamEngine
+from stream_transport import HttpUploadSender, upload_and_apply
+
+
+def packed_frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (480, 320), dtype=np.uint8)
+
+
+def image(seed=0):
+    return runtime_image.encode(packed=packed_frame(seed))
+
+
+def test_upload_and_apply_skips_same_image(emu, host, session):
+    data = image()
+    upload_and_apply(host, data, session=session)
+    assert np.array_equal(emu.panel.cache, packed_frame())
+    before = emu.stats["http_requests"]
+    logs = []
+    upload_and_apply(host, data, log=logs.append, session=session)
+    assert emu.stats["http_requests"] - before == 2  # runtime-status + /apply
+    assert "skipped" in logs[0]
+
+
+def test_http_upload_sender(emu, host):
+    sender = HttpUploadSender(host)
+    try:
+        frame = packed_frame(3)
+        assert sender.submit(frame, [(0, 480)], 60)
+    finally:
+        sender.stop()
+    assert emu.runtime_file == runtime_image.encode(packed=frame)
+    assert np.array_equal(emu.panel.cache, frame)
+    assert sender.frames_sent == 1 and sender.bytes_sent == len(emu.runtime_file)
+
+
+class FakeCapture:
+    def __init__(self, frame):
+        self.frame = frame
+
+    def screen_bounds(self):
+        return 0, 0, 640, 480
+
+    def grab_bgra(self, x, y, w, h):
+        return self.frame[y:y + h, x:x + w]
+
+    def close(self):
+        pass
+
+
+def bgra_frame(seed=0):
+    gray = np.random.default_rng(seed).integers(0, 256, (480, 640), dtype=np.uint8)
+    return np.dstack([gray, gray, gray, np.full_like(gray, 255)])
+
+
+@pytest.mark.parametrize("transport", ["http", "upload", "ws"])
+def test_one_shot(emu, host, transport):
+    engine = StreamEngine(StreamConfig(host=host, transport=transport, ws_port=emu.ws_port,
+                                       rtt_interval_s=0))
+    engine._capture = FakeCapture(bgra_frame())
+    expected = engine.encode(bgra_frame(), force_full=True)[0].copy()
+    assert engine.one_shot() == 480 * 320
+    assert np.array_equal(emu.panel.cache, expected)
+
+
+def test_deliver_sends_changed_rows(emu, host):
+    engine = StreamEngine(StreamConfig(host=host, transport="http", rtt_interval_s=0, keepalive_s=0))
+    try:
+        a = packed_frame(4)
+        engine.deliver(a)
+        assert np.array_equal(emu.panel.cache, a)
+        b = a.copy()
+        b[200:203] ^= 0xFF
+        written = emu.panel.bytes_written
+        engine.deliver(b)
+        assert np.array_equal(emu.panel.cache, b)
+        assert emu.panel.bytes_written - written == 3 * 320
+    finally:
+        engine.close()
@@ -0,0 +1,61 @@
+import numpy as np
+
+import frame_cache
+from frame_cache import FrameCache, make_key
+
+
+def frames(n, value=0):
+    return [np.full((480, 320), value + i, dtype=np.uint8) for i in range(n)]
+
+
+def test_put_get_roundtrip(tmp_path):
+    cache = FrameCache(str(tmp_path))
+    key = make_key("abc", dither="none")
+    stored = cache.put(key, frames(3))
+    assert stored.shape == (3, 480, 320)
+    got = FrameCache(str(tmp_path)).get(key)
+    assert got is not None and np.array_equal(got[2], frames(3)[2])
+    assert cache.get(make_key("other")) is None
+
+
+def test_lru_eviction(tmp_path, monkeypatch):
+    one = 480 * 320
+    cache = FrameCache(str(tmp_path), max_bytes=2 * one)
+    clock = iter(range(100, 1000))
+    monkeypatch.setattr(frame_cache.time, "time", lambda: next(clock))
+    monkeypatch.setattr(frame_cache, "TOUCH_INTERVAL_S", 0)
+    cache.put("a", frames(1))
+    cache.put("b", frames(1))
+    cache.get("a")  # b is now the least recently used
+    cache.put("c", frames(1))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_too_big_is_not_stored(tmp_path):
+    cache = FrameCache(str(tmp_path), max_bytes=480 * 320)
+    assert cache.put("big", frames(2)) is None
+    assert cache.get("big") is None
+
+
+def test_merge_keeps_newer_last_used(tmp_path):
+    a = FrameCache(str(tmp_path))
+    a.put("x", frames(1))
+    b = FrameCache(str(tmp_path))
+    b._index["x"]["last_used"] += 1000  # unsaved touch in this process
+    touched = b._index["x"]["last_used"]
+    a.put("y", frames(1))  # rewrites index.json with the older last_used for x
+    b.put("z", frames(1))
+    assert b._index["x"]["last_used"] == touched
+    assert set(b._index) == {"x", "y", "z"}
+
+
+def test_miss_does_not_reload_unchanged_index(tmp_path, monkeypatch):
+    cache = FrameCache(str(tmp_path))
+    cache.put("x", frames(1))
+    loads = []
+    real = cache._load_index
+    monkeypatch.setattr(cache, "_load_index", lambda: loads.append(1) or real())
+    for _ in range(5):
+        assert cache.get("missing") is None
+    assert not loads
@@ -0,0 +1,21 @@
+import numpy as np
+
+from frame_signature import BandSignature
+
+
+def test_update_reports_changed_bands():
+    sig = BandSignature(band_rows=16)
+    frame = np.zeros((480, 640, 4), np.uint8)
+    assert sig.update(frame) is None
+    assert not sig.update(frame.copy()).any()
+    frame[40, 10] = 1
+    mask = sig.update(frame)
+    assert mask.shape == (480,) and np.array_equal(np.flatnonzero(mask), np.arange(32, 48))
+
+
+def test_shape_change_and_reset_are_unknown():
+    sig = BandSignature()
+    sig.update(np.zeros((480, 640, 4), np.uint8))
+    assert sig.update(np.zeros((470, 640, 4), np.uint8)) is None
+    sig.reset()
+    assert sig.update(np.zeros((470, 640, 4), np.uint8)) is None
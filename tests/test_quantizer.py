@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from quantizer import LIVE_MODES, THRESHOLD_LEVELS, _blue_noise, _offsets, _texture, quantize
+
+
+def test_shipped_blue_noise_matches_generator():
+    assert np.array_equal(_texture("bluenoise"), _blue_noise() * THRESHOLD_LEVELS // (64 * 64))
+
+
+@pytest.mark.parametrize("mode", LIVE_MODES)
+@pytest.mark.parametrize("invert", [False, True])
+def test_rows_match_full_frame(mode, invert):
+    gray = np.random.default_rng(1).integers(0, 256, (480, 640), dtype=np.uint8)
+    full = quantize(gray, mode, invert)
+    rows = np.r_[17:33, 200:210]
+    assert np.array_equal(quantize(gray[rows], mode, invert, rows=rows, height=480), full[rows])
+
+
+def test_row_bands_share_one_offset_table():
+    gray = np.zeros((480, 640), dtype=np.uint8)
+    _offsets.cache_clear()
+    for start in range(0, 480, 16):
+        rows = np.arange(start, start + 16)
+        quantize(gray[rows], "bayer", rows=rows, height=480)
+    assert _offsets.cache_info().currsize == 1
+
+
+def test_invert_is_fifteen_minus_levels():
+    gray = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    for mode in LIVE_MODES:
+        assert np.array_equal(quantize(gray, mode, True), 15 - quantize(gray, mode))
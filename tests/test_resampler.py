@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from resampler import resample_plan, resize_gray
+
+PIL_FILTERS = {"box": Image.Resampling.BOX, "bilinear": Image.Resampling.BILINEAR}
+
+
+@pytest.mark.parametrize("method", sorted(PIL_FILTERS))
+@pytest.mark.parametrize("size", [(641, 481), (961, 721), (1279, 959), (1920, 1080), (333, 250), (101, 77)])
+def test_matches_pil(method, size):
+    w, h = size
+    src = np.random.default_rng(w * h).integers(0, 256, (h, w), dtype=np.uint8)
+    ref = np.asarray(Image.fromarray(src).resize((640, 480), PIL_FILTERS[method]), dtype=np.int16)
+    out = resize_gray(src, 640, 480, method).astype(np.int16)
+    assert np.abs(out - ref).max() <= 1
+
+
+def test_identity_plan_copies():
+    src = np.arange(48, dtype=np.uint8).reshape(6, 8)
+    assert np.array_equal(resample_plan(8, 6, 8, 6, "lanczos")(src), src)
+
+
+def test_plan_rejects_other_sizes():
+    with pytest.raises(ValueError):
+        resample_plan(8, 6, 4, 3, "box")(np.zeros((5, 8), dtype=np.uint8))
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        resample_plan(8, 6, 4, 3, "cubic")
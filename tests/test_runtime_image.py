@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import runtime_image
+from device_emulator import DeviceEmulator
+from runtime_image import RuntimeImageError
+
+
+def levels(h=480, w=640):
+    return (np.arange(h * w, dtype=np.uint32).reshape(h, w) * 7 % 16).astype(np.uint8)
+
+
+@pytest.mark.parametrize("pack", [True, False])
+def test_roundtrip(pack):
+    img = levels()
+    data = runtime_image.encode(img, pack=pack)
+    hdr = runtime_image.parse_header(data)
+    assert hdr["packed"] == pack and (hdr["width"], hdr["height"]) == (640, 480)
+    assert hdr["length"] == (640 * 480 // 2 if pack else 640 * 480)
+    out, hdr2 = runtime_image.decode(data)
+    assert hdr2 == hdr and np.array_equal(out, img)
+
+
+def test_encode_packed_frame():
+    img = levels()
+    packed = runtime_image.encode(img)[runtime_image.HEADER.size:]
+    frame = np.frombuffer(packed, np.uint8).reshape(480, 320)
+    assert runtime_image.encode(packed=frame) == runtime_image.encode(img)
+
+
+def test_legacy_has_no_header():
+    data = runtime_image.encode_legacy(levels())
+    assert runtime_image.parse_header(data) is None
+    out, hdr = runtime_image.decode(data)
+    assert hdr is None and np.array_equal(out, levels())
+    assert runtime_image.parse_header(b"JBD") is None
+
+
+def test_crc_mismatch_rejected():
+    data = bytearray(runtime_image.encode(levels()))
+    data[-1] ^= 0x01
+    with pytest.raises(RuntimeImageError, match="CRC"):
+        runtime_image.decode(bytes(data))
+    out, _ = runtime_image.decode(bytes(data), verify=False)
+    assert out.shape == (480, 640)
+
+
+def test_truncated_rejected():
+    data = runtime_image.encode(levels())
+    with pytest.raises(RuntimeImageError, match="truncated"):
+        runtime_image.decode(data[:-1])
+
+
+@pytest.mark.parametrize("offset", [4, 6])  # version, bpp
+def test_unsupported_header_rejected(offset):
+    data = bytearray(runtime_image.encode(levels()))
+    data[offset] = 9
+    with pytest.raises(RuntimeImageError, match="unsupported"):
+        runtime_image.parse_header(bytes(data))
+
+
+def test_odd_width_cannot_be_packed():
+    with pytest.raises(RuntimeImageError):
+        runtime_image.encode(levels(4, 5))
+
+
+def test_emulator_upload_rejects_bad_crc():
+    emu = DeviceEmulator(realtime=False)
+    good = runtime_image.encode(levels())
+    assert emu.handle_upload(good)[0] == 200
+    bad = bytearray(runtime_image.encode(15 - levels()))
+    bad[100] ^= 0xFF
+    code, text = emu.handle_upload(bytes(bad))
+    assert code == 400 and "CRC" in text
+    assert emu.runtime_file == good
@@ -0,0 +1,127 @@
+import zlib
+
+import numpy as np
+import pytest
+import requests
+
+import runtime_image
+import stream_transport
+from stream_transport import upload_chunked
+
+
+def packed_frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (480, 320), dtype=np.uint8)
+
+
+def image(seed=0):
+    return runtime_image.encode(packed=packed_frame(seed))
+
+
+def chunk(session, host, data, offset, size=stream_transport.UPLOAD_CHUNK_BYTES):
+    body = data[offset:offset + size]
+    return session.post(f"http://{host}/upload/chunk", params={"offset": offset, "crc": zlib.crc32(body)},
+                        data=body)
+
+
+def begin(session, host, data):
+    r = session.post(f"http://{host}/upload/begin", params={"size": len(data), "crc": zlib.crc32(data)})
+    r.raise_for_status()
+    return r.json()
+
+
+class FlakySession:
+    """Passes requests through, except that the fail_at-th /upload/chunk raises or runs before() first"""
+
+    def __init__(self, session, fail_at, before=None):
+        self.session = session
+        self.fail_at = fail_at
+        self.before = before
+        self.chunks = 0
+
+    def post(self, url, **kwargs):
+        if url.endswith("/upload/chunk"):
+            self.chunks += 1
+            if self.chunks == self.fail_at:
+                if self.before is None:
+                    raise requests.ConnectionError("link dropped")
+                self.before()
+        return self.session.post(url, **kwargs)
+
+
+def test_upload_chunked_in_order(emu, host, session):
+    data = image()
+    upload_chunked(host, data, session=session)
+    assert emu.runtime_file == data
+    chunks = -(-len(data) // stream_transport.UPLOAD_CHUNK_BYTES)
+    assert emu.stats["http_requests"] == chunks + 2  # begin + chunks + commit
+    assert emu.upload_meta is None
+
+
+def test_upload_resumes_from_device_position(emu, host, session):
+    data = image()
+    begin(session, host, data)
+    assert chunk(session, host, data, 0).ok and chunk(session, host, data, 8192).ok
+    logs = []
+    upload_chunked(host, data, log=logs.append, session=session)
+    assert emu.runtime_file == data
+    assert "Upload: resuming at 16384" in logs[0]
+
+
+def test_upload_resumes_after_connection_error(emu, host, session):
+    data = image()
+    logs = []
+    upload_chunked(host, data, log=logs.append, session=FlakySession(session, fail_at=3))
+    assert emu.runtime_file == data
+    assert any("resuming at 16384" in line for line in logs)
+
+
+def test_chunk_ahead_of_device_is_409(emu, host, session):
+    data = image()
+    begin(session, host, data)
+    r = chunk(session, host, data, 8192)
+    assert r.status_code == 409 and r.json()["received"] == 0
+    assert chunk(session, host, data, 0).json()["received"] == 8192
+    assert chunk(session, host, data, 0).json()["received"] == 8192  # a resent chunk is ignored
+
+
+def test_abort_drops_the_session(emu, host, session):
+    data = image()
+    begin(session, host, data)
+    chunk(session, host, data, 0)
+    assert session.post(f"http://{host}/upload/abort").ok
+    assert session.get(f"http://{host}/upload/status").json() == {
+        "active": False, "size": 0, "crc32": 0, "received": 0, "chunk_max": 16384}
+    r = chunk(session, host, data, 8192)
+    assert r.status_code == 409 and "json" not in r.headers["Content-Type"]
+
+
+def test_upload_fails_when_aborted_midway(emu, host, session):
+    data = image()
+    old = emu.runtime_file = image(1)
+    flaky = FlakySession(session, fail_at=2, before=lambda: session.post(f"http://{host}/upload/abort"))
+    with pytest.raises(RuntimeError, match="session lost"):
+        upload_chunked(host, data, session=flaky)
+    assert emu.runtime_file == old
+    upload_chunked(host, data, session=session)  # a new upload starts over
+    assert emu.runtime_file == data
+
+
+def test_commit_with_wrong_crc_keeps_old_image(emu, host, session):
+    data = image()
+    old = emu.runtime_file = image(1)
+    r = session.post(f"http://{host}/upload/begin", params={"size": len(data), "crc": zlib.crc32(data) ^ 1})
+    step = r.json()["chunk_max"]
+    for offset in range(0, len(data), step):
+        assert chunk(session, host, data, offset, step).ok
+    r = session.post(f"http://{host}/upload/commit")
+    assert r.status_code == 400 and "CRC" in r.text
+    assert emu.runtime_file == old
+
+
+def test_commit_before_last_chunk_is_409(emu, host, session):
+    data = image()
+    begin(session, host, data)
+    chunk(session, host, data, 0)
+    r = session.post(f"http://{host}/upload/commit")
+    assert r.status_code == 409 and r.json()["received"] == 8192
+    assert emu.runtime_file is None
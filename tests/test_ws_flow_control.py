@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+
+from device_emulator import WS_WINDOW, DeviceEmulator
+from frame_packer import WS_HEADER
+from stream_engine import StreamConfig, StreamEngine
+from stream_transport import (WS_CONTROL, WS_CONTROL_ROW, WS_FRAME_ACK, WS_FRAME_END, WS_MSG_CHUNK_ACK,
+                              WS_MSG_FRAME_END, WS_MSG_HELLO, WS_REPLY, WsStreamSession)
+
+
+def packed_frame(seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (480, 320), dtype=np.uint8)
+
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_ws_deliver_with_flow_control(emu, host):
+    engine = StreamEngine(StreamConfig(host=host, transport="ws", ws_port=emu.ws_port, rtt_interval_s=0,
+                                       keepalive_s=0, ws_window=2))
+    try:
+        frames = [packed_frame(i) for i in range(3)]
+        for frame in frames:
+            engine.deliver(frame)
+            assert wait_for(lambda: np.array_equal(emu.panel.cache, frame))
+        sender = engine._sender
+        assert wait_for(lambda: sender.frames_sent >= 1)
+        assert sender.flow_window == 2 and sender.chunks_rejected == 0
+    finally:
+        engine.close()
+    assert emu.stats["ws_dropped"] == 0
+
+
+def test_ws_window_capped_by_device(emu):
+    sender = WsStreamSession("127.0.0.1", port=emu.ws_port, window=64)
+    sender.start()
+    try:
+        sender.submit(packed_frame(), [(0, 480)], 40)
+        assert wait_for(lambda: sender.frames_sent == 1)
+        assert sender.flow_window == WS_WINDOW
+    finally:
+        sender.stop()
+
+
+def test_ws_hello_and_acks():
+    emu = DeviceEmulator(realtime=False)
+    client = {}
+    rows = packed_frame()[:10]
+    # without HELLO the device applies chunks silently
+    assert emu.handle_ws_message(WS_HEADER.pack(0, 10) + rows.tobytes(), client) == []
+    reply, = emu.handle_ws_message(WS_CONTROL.pack(WS_CONTROL_ROW, WS_MSG_HELLO), client)
+    assert WS_REPLY.unpack(reply)[:2] == (WS_CONTROL_ROW, WS_MSG_HELLO)
+    assert WS_REPLY.unpack(reply)[3] == WS_WINDOW
+    acks = [emu.handle_ws_message(WS_HEADER.pack(r, 10) + rows.tobytes(), client)[0] for r in (0, 10)]
+    bad, = emu.handle_ws_message(WS_HEADER.pack(470, 10) + rows.tobytes()[:-1], client)  # short chunk
+    assert [WS_REPLY.unpack(a) for a in acks + [bad]] == [
+        (WS_CONTROL_ROW, WS_MSG_CHUNK_ACK, 1, 0), (WS_CONTROL_ROW, WS_MSG_CHUNK_ACK, 2, 0),
+        (WS_CONTROL_ROW, WS_MSG_CHUNK_ACK, 3, 1)]
+    end, = emu.handle_ws_message(WS_FRAME_END.pack(WS_CONTROL_ROW, WS_MSG_FRAME_END, 7), client)
+    row, kind, seq, rejected, _ = WS_FRAME_ACK.unpack(end)
+    assert (row, kind, seq, rejected) == (WS_CONTROL_ROW, WS_MSG_FRAME_END, 7, 1)
+    assert np.array_equal(emu.panel.cache[10:20], rows)